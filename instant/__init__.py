@@ -25,7 +25,15 @@ from .output import *
 from .config import *
 from .paths import *
 from .signatures import *
+from .cacheindex import *
 from .cache import *
 from .codegeneration import *
 from .build import *
 from .inlining import *
+from .callbacks import *
+from .expressions import *
+from .stencils import *
+from .streaming import *
+from .parallel import *
+from .asynchronous import *
+from .processes import *
@@ -0,0 +1,87 @@
+"""Calling compiled kernels from asyncio coroutines without blocking the
+event loop, by running them in a dedicated thread pool."""
+
+# This file is part of Instant.
+#
+# Instant is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Instant is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Instant. If not, see <http://www.gnu.org/licenses/>.
+#
+# Alternatively, Instant may be distributed under the terms of the BSD license.
+
+import functools
+import threading
+from .output import instant_assert
+
+# The thread pool running kernels called from coroutines, created when first used
+_async_executor = None
+_async_executor_lock = threading.Lock()
+
+def async_executor(workers=None):
+    """Return the thread pool running kernels called with L{call_async},
+    creating it with the given number of workers if it does not exist."""
+    global _async_executor
+    with _async_executor_lock:
+        if _async_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            from .parallel import default_workers
+            _async_executor = ThreadPoolExecutor(workers or default_workers())
+        return _async_executor
+
+def shutdown_async_executor(wait=True):
+    "Shut down the thread pool running kernels called with L{call_async}."
+    global _async_executor
+    with _async_executor_lock:
+        executor, _async_executor = _async_executor, None
+    if executor is not None:
+        executor.shutdown(wait)
+
+def call_async(kernel, *args, **kwargs):
+    """Call kernel with the given arguments in the thread pool returned by
+    L{async_executor} and return an awaitable future for the result.
+
+    The arguments are kept alive until the call is done. The kernel must
+    release the global interpreter lock so the event loop can run while
+    it does, like the functions made by L{compile_expression} or modules
+    built with C{release_gil=True}. If the awaiting task is cancelled,
+    e.g. by C{asyncio.wait_for} timing out, it stops waiting, but a kernel
+    already running completes in the background::
+
+        r = await call_async(f, x, y)
+    """
+    import asyncio
+    get_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+    return get_loop().run_in_executor(async_executor(),
+                                      functools.partial(kernel, *args, **kwargs))
+
+def awaitable(kernel):
+    """Return kernel with an C{async_} attribute calling it with
+    L{call_async}, wrapping it in a Python function if it can not have
+    attributes, like the functions of compiled modules::
+
+        f = awaitable(inline(code, release_gil=True))
+        r = await f.async_(a, b)
+    """
+    instant_assert(callable(kernel), "In instant.awaitable: Expecting a callable kernel.")
+
+    def async_(*args, **kwargs):
+        return call_async(kernel, *args, **kwargs)
+
+    try:
+        kernel.async_ = async_
+        return kernel
+    except AttributeError:
+        @functools.wraps(kernel)
+        def function(*args, **kwargs):
+            return kernel(*args, **kwargs)
+        function.async_ = async_
+        return function
@@ -32,6 +32,7 @@ from .signatures import *
 from .cache import *
 from .codegeneration import *
 from .locking import file_lock
+from .config import get_openmp_flags
 
 def assert_is_str(x):
     instant_assert(isinstance(x, str),
@@ -217,7 +218,9 @@ def copy_to_cache(module_path, cache_dir, modulename, \
         # finished_copying
         try:
             shutil.copytree(module_path, cache_module_path)
-            open(os.path.join(cache_module_path, "finished_copying"), "w").close()
+            # The size of the module is kept for the disk cache quota
+            write_file(os.path.join(cache_module_path, "finished_copying"),
+                       str(directory_size(cache_module_path)))
         except OSError as e:
             if e.errno != errno.EEXIST:
                 raise
@@ -235,7 +238,8 @@ def build_module(modulename=None, source_directory=".",
                  swigargs=['-c++', '-fcompact', '-O', '-I.', '-small'],
                  swig_include_dirs = [],
                  cppargs=['-O2'], lddargs=[],
-                 object_files=[], arrays=[],
+                 object_files=[], arrays=[], generic_types=[],
+                 function_pointers=[], openmp=False, release_gil=False,
                  generate_interface=True, generate_setup=True,
                  cmake_packages=[],
                  signature=None, cache_dir=None):
@@ -324,6 +328,92 @@ def build_module(modulename=None, source_directory=".",
         If the NumPy array har more than four dimensions, the inner list should
         contain strings with variable names for the number of dimensions,
         the length in each dimension as a pointer, and the array itself, respectively.
+        Such arrays are passed without copying or allocating memory. They must
+        be C contiguous, aligned and of the given data type, unless a pointer
+        to the strides (counted in elements) is named before the array, e.g.
+        C{['nd', 'dims', 'strides', 'x', 'multi']}. Combined with C{'in'},
+        other objects are converted instead.
+        Adding C{'out'} makes the array an output array, returned by the
+        wrapped function. The caller then passes either the shape of a new
+        array, or an existing C contiguous array of matching type that is
+        written into and returned, avoiding allocation in loops. Output
+        arrays can have any number of dimensions, combined with C{'multi'}.
+        Adding C{'owned'} returns memory allocated by the wrapped function
+        as a NumPy array without copying. The function gets pointers to the
+        dimensions and to the data pointer, e.g. C{(int* n, double** x)},
+        and sets them. The array frees the memory with C{free} when it is
+        garbage collected, or with another C{void f(void*)} deallocator given
+        as C{'dealloc=f'} in the inner list.
+        Adding C{'strided'} passes a NumPy array without copying, even if it
+        is a non-contiguous view. The inner list should then contain the names
+        of the dimensions, the names of the strides (counted in elements, not
+        bytes) in the same directions, and the name of the array. Adding
+        C{'fortran'} to a 2D or 3D array passes a Fortran ordered array
+        without copying. Both can be combined with C{'in'} to also accept
+        objects that must be converted first.
+        Adding C{'ragged'} passes a list or tuple of arrays with different
+        lengths in a single call. The inner list should then contain the names
+        of the number of arrays, the array of lengths and the array of data
+        pointers, e.g. C{['k', 'lengths', 'x', 'ragged']} for
+        C{(int k, int* lengths, double** x)}.
+        Adding C{'struct=T'} passes an array with a record data type as a
+        pointer to the C struct C{T}, without copying, e.g. C{['n', 'p',
+        'struct=Particle']} for C{(int n, Particle* p)}. The record size and
+        the offsets and sizes of the struct members, found in a plain C
+        definition of the struct in the code, are checked. Create the data
+        type with C{align=True} to match the C layout.
+        Adding C{'csr'} or C{'csc'} passes a C{scipy.sparse} matrix in that
+        format without copying. The inner list should then contain the names
+        of the number of rows and columns, the index pointer array, the index
+        array and the data array, e.g. C{['m', 'n', 'indptr', 'indices',
+        'data', 'csr']}. The index type is the dimension type. Combined with
+        C{'in'}, arrays of other types are converted, and combined with
+        C{'owned'}, the function instead gets pointers to set to the shape and
+        to arrays it allocates, which are returned as a sparse matrix.
+        Adding C{'trusted'} passes arrays known to be aligned, C contiguous
+        and of the right type and shape by only extracting their data pointers
+        and dimensions, avoiding the per call checks and conversions. The
+        checks are compiled in when C{'-DINSTANT_DEBUG'} is given in B{cppargs}.
+        Adding C{'buffer'} to a 1D, 2D or 3D array accepts any C contiguous
+        object exporting the Python buffer protocol, e.g. memory maps,
+        memoryviews, C{array.array} and C{bytearray} objects, and passes its
+        memory without copying. Untyped byte buffers are reinterpreted as
+        1D arrays of the given data type. Combine with C{'in'} to accept
+        read only buffers.
+        The dimensions are passed as C{int} by default. Adding C{'npy_intp'}
+        or C{'int64_t'} to the inner list passes them with that type instead,
+        allowing arrays with more than 2^31 elements.
+        Adding C{'generic'} instead of a data type makes the array generic,
+        see B{generic_types}.
+        The flags, data types and dimension types follow the names. A trailing
+        word like C{'out'} is taken as the name of a parameter where only that
+        matches the parameters of a function in B{code}, e.g. C{['n', 'out']}
+        for C{(int n, double* out)}, and a specification matching both ways
+        is rejected.
+      - B{generic_types}:
+        - A list of data types, e.g. C{['float', 'double']}. Each function
+        template in B{code} with a single type parameter is compiled for
+        each of these types, and generic arrays are passed with the matching
+        type. The module gets a function with the template name that calls
+        the specialization matching the data type of its first generic array
+        argument, without converting it. C{'std::complex<float>'} and
+        C{'std::complex<double>'} are also supported here. List of strings.
+      - B{function_pointers}:
+        - A list of names of functions in B{code} to export pointers to, e.g.
+        for use as C{scipy.LowLevelCallable} callbacks, see
+        L{function_pointer} and L{low_level_callable}. Parameters of function
+        pointer type in B{code} accept such pointers from other modules, so
+        callbacks are made without going through Python. List of strings.
+      - B{openmp}:
+        - A bool to indicate if the code uses OpenMP. The compiler and linker
+        flags for OpenMP are added and C{omp.h} is included. The module gets
+        the functions C{set_num_threads(n)} and C{get_num_threads()}, which
+        control the number of threads used by parallel regions started from
+        the calling thread.
+      - B{release_gil}:
+        - A bool to indicate if the wrapped functions release the global
+        interpreter lock while running, so other Python threads can run
+        meanwhile. The code must then not use the Python C API.
       - B{generate_interface}:
         - A bool to indicate if you want to generate the interface files.
       - B{generate_setup}:
@@ -370,6 +460,10 @@ def build_module(modulename=None, source_directory=".",
     lddargs           = arg_strings(lddargs)
     object_files      = strip_strings(object_files)
     arrays            = [strip_strings(a) for a in arrays]
+    generic_types     = strip_strings(generic_types)
+    function_pointers = strip_strings(function_pointers)
+    assert_is_bool(openmp)
+    assert_is_bool(release_gil)
     assert_is_bool(generate_interface)
     assert_is_bool(generate_setup)
     cmake_packages   = strip_strings(cmake_packages)
@@ -384,6 +478,16 @@ def build_module(modulename=None, source_directory=".",
 
     cache_dir = validate_cache_dir(cache_dir)
 
+    # Let SWIG release the global interpreter lock around calls
+    if release_gil:
+        swigargs = swigargs + ['-threads']
+
+    # Add the compiler and linker flags for OpenMP
+    if openmp:
+        openmp_cppargs, openmp_lddargs = get_openmp_flags()
+        cppargs = cppargs + openmp_cppargs
+        lddargs = lddargs + openmp_lddargs
+
     # Split sources by file-suffix (.c or .cpp)
     csrcs = [f for f in sources if f.endswith('.c') or f.endswith('.C')]
     cppsrcs = [f for f in sources if f.endswith('.cpp') or f.endswith('.cxx')]
@@ -414,6 +518,10 @@ def build_module(modulename=None, source_directory=".",
     instant_debug('    lddargs: %r' % lddargs)
     instant_debug('    object_files: %r' % object_files)
     instant_debug('    arrays: %r' % arrays)
+    instant_debug('    generic_types: %r' % generic_types)
+    instant_debug('    function_pointers: %r' % function_pointers)
+    instant_debug('    openmp: %r' % openmp)
+    instant_debug('    release_gil: %r' % release_gil)
     instant_debug('    generate_interface: %r' % generate_interface)
     instant_debug('    generate_setup: %r' % generate_setup)
     instant_debug('    cmake_packages: %r' % cmake_packages)
@@ -445,7 +553,8 @@ def build_module(modulename=None, source_directory=".",
                 system_headers,
                 include_dirs, library_dirs, libraries,
                 swig_include_dirs, swigargs, cppargs, lddargs,
-                object_files, arrays,
+                object_files, arrays, generic_types, function_pointers, openmp,
+                release_gil,
                 generate_interface, generate_setup, cmake_packages,
                 # The signature isn't defined, and the cache_dir doesn't affect the module:
                 #signature, cache_dir)
@@ -461,8 +570,8 @@ def build_module(modulename=None, source_directory=".",
             if module: return module
             modulename = moduleids[-1]
 
-        # Look for module in disk cache
-        module = check_disk_cache(modulename, cache_dir, moduleids)
+        # Look for module in disk cache, also if it is missing from the index
+        module = check_disk_cache(modulename, cache_dir, moduleids, find_unindexed=True)
         if module: return module
 
         # Make a temporary module path for compilation
@@ -508,7 +617,8 @@ def build_module(modulename=None, source_directory=".",
         if generate_interface:
             write_interfacefile(ifile_name, modulename, code, init_code,
                 additional_definitions, additional_declarations, system_headers,
-                local_headers, wrap_headers, arrays)
+                local_headers, wrap_headers, arrays, generic_types,
+                function_pointers, openmp)
 
         # Generate setup.py if wanted
         if generate_setup and not cmake_packages:
@@ -567,6 +677,10 @@ def build_module(modulename=None, source_directory=".",
         # Copy compiled module to cache
         if use_cache:
             module_path = copy_to_cache(module_path, cache_dir, modulename)
+            mark_module_in_use(module_path)
+            index_add_module(cache_dir, modulename, module_size(module_path), moduleids,
+                             toolchain_description())
+            evict_from_disk_cache(cache_dir)
 
         # Import module and place in memory cache
         module = import_and_cache_module(module_path, modulename, moduleids)
@@ -608,6 +722,8 @@ def build_module_vtk(c_code, cache_dir=None):
     ret, output = get_status_output("make > compile.log ")
 
     module_path = copy_to_cache(module_path, cache_dir, modulename)
+    index_add_module(cache_dir, modulename, module_size(module_path), moduleids,
+                     toolchain_description())
 
     os.chdir(original_path)
 
@@ -634,6 +750,8 @@ def build_module_vmtk(c_code, cache_dir=None):
     ret, output = get_status_output("make > compile.log ")
 
     module_path = copy_to_cache(module_path, cache_dir, modulename)
+    index_add_module(cache_dir, modulename, module_size(module_path), moduleids,
+                     toolchain_description())
 
     os.chdir(original_path)
 
@@ -9,6 +9,10 @@ Example operations:
   - module = import_module(compute_checksum(signature))
   - modules = cached_modules()
   - modules = cached_modules(cache_dir)
+  - info = memory_cache_info()
+  - clear_memory_cache()
+  - set_disk_cache_quota(max_size="10G")
+  - evicted = evict_from_disk_cache(cache_dir)
 """
 
 # Copyright (C) 2008 Martin Sandve Alnes
@@ -30,10 +34,21 @@ Example operations:
 #
 # Alternatively, Instant may be distributed under the terms of the BSD license.
 
-import os, sys, re
+import os, sys, re, time, errno, shutil, uuid
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
 from .output import instant_warning, instant_assert, instant_debug
 from .paths import get_default_cache_dir, validate_cache_dir
 from .signatures import compute_checksum
+from .locking import file_lock
+from .cacheindex import *
+from .cacheindex import _scan_modules, _removed_suffix, _index_filename
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # TODO: We could make this an argument, but it's used indirectly several places so take care.
 _modulename_prefix = "instant_module_"
@@ -62,21 +77,338 @@ def import_module_directly(path, modulename):
     return module, er
 
 
-_memory_cache = {}
+class MemoryCache(object):
+    """A cache of imported modules, holding at most maxsize modules and
+    evicting the least recently used. A module is stored under all its
+    moduleids, and moduleids which are not strings, like signature
+    objects, are held by weak references where possible. Objects made
+    from a module, like compiled expressions, can be cached with it under
+    keys of their own, and are evicted with it."""
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._modules = OrderedDict()
+        self._ids = {}
+        self._weak_ids = weakref.WeakKeyDictionary()
+        self._objects = {}
+        self._lock = threading.RLock()
+
+    def _is_weak(self, moduleid):
+        if isinstance(moduleid, str):
+            return False
+        try:
+            weakref.ref(moduleid)
+            return True
+        except TypeError:
+            return False
+
+    def _use(self, module):
+        "Mark module as the most recently used."
+        # Not move_to_end, which Python 2 does not have
+        self._modules.pop(module, None)
+        self._modules[module] = True
+
+    def get(self, moduleid):
+        "Return the module cached with moduleid, or None."
+        with self._lock:
+            ids = self._weak_ids if self._is_weak(moduleid) else self._ids
+            module = ids.get(moduleid)
+            if module is not None:
+                self._use(module)
+            return module
+
+    def get_object(self, key):
+        "Return the object cached with key by L{place_object}, or None."
+        with self._lock:
+            if self.get(key) is None:
+                return None
+            return self._objects.get(key)
+
+    def place_object(self, key, module, obj):
+        "Cache an object made from module with key, together with the module."
+        with self._lock:
+            self._objects[key] = obj
+            self.place(key, module)
+
+    def record_lookup(self, found):
+        "Count a lookup of a module as a hit or a miss."
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def place(self, moduleid, module):
+        "Cache module with moduleid, evicting modules if the cache is full."
+        with self._lock:
+            if self._is_weak(moduleid):
+                self._weak_ids[moduleid] = module
+            else:
+                self._ids[moduleid] = module
+            self._use(module)
+            self.resize(self.maxsize)
+
+    def evict(self, module):
+        "Remove module with all its moduleids."
+        with self._lock:
+            self._modules.pop(module, None)
+            for ids in (self._ids, self._weak_ids):
+                for moduleid in [i for i, m in list(ids.items()) if m is module]:
+                    del ids[moduleid]
+                    self._objects.pop(moduleid, None)
+        # Let the module be freed when no longer used elsewhere
+        if sys.modules.get(getattr(module, "__name__", None)) is module:
+            del sys.modules[module.__name__]
+        if getattr(module, "__file__", None):
+            release_module_in_use(os.path.dirname(os.path.abspath(module.__file__)))
+
+    def resize(self, maxsize):
+        "Set the largest number of cached modules, None for no limit."
+        with self._lock:
+            self.maxsize = maxsize
+            while maxsize is not None and len(self._modules) > maxsize:
+                module = next(iter(self._modules))
+                self.evict(module)
+                self.evictions += 1
+                instant_debug("Evicted module '%s' from memory cache." % module)
+
+    def clear(self):
+        "Remove all modules and reset the counters."
+        with self._lock:
+            for module in list(self._modules):
+                self.evict(module)
+            self.hits = self.misses = self.evictions = 0
+
+    def modules(self):
+        "Return the cached modules, the least recently used first."
+        with self._lock:
+            return list(self._modules)
+
+    def __len__(self):
+        return len(self._modules)
+
+    def __contains__(self, moduleid):
+        return self.get(moduleid) is not None
+
+
+# Information about the memory cache, like functools.lru_cache
+MemoryCacheInfo = namedtuple("MemoryCacheInfo", ["hits", "misses", "evictions", "size", "maxsize"])
+
+_memory_cache = MemoryCache(int(os.environ.get("INSTANT_MEMORY_CACHE_SIZE", 256)))
 def memory_cached_module(moduleid):
     "Returns the cached module if found."
-    import sys
-    module = _memory_cache.get(moduleid, None)
+    module = _memory_cache.get(moduleid)
     instant_debug("Found '%s' in memory cache with key '%r'." % (module, moduleid))
     return module
 
 
 def place_module_in_memory_cache(moduleid, module):
     "Place a compiled module in cache with given id."
-    _memory_cache[moduleid] = module
+    _memory_cache.place(moduleid, module)
     instant_debug("Added module '%s' to cache with key '%r'." % (module, moduleid))
 
 
+def memory_cached_object(key):
+    """Return the object made from a module cached with key by
+    L{place_object_in_memory_cache}, or None."""
+    return _memory_cache.get_object(key)
+
+
+def place_object_in_memory_cache(key, module, obj):
+    """Place an object made from a compiled module, like a compiled
+    expression, in the memory cache with the given hashable key. It is
+    evicted together with the module, which is kept in use while cached."""
+    _memory_cache.place_object(key, module, obj)
+    instant_debug("Added object '%s' of module '%s' to cache with key '%r'." % (obj, module, key))
+
+
+def set_memory_cache_size(maxsize):
+    """Set the largest number of modules in the memory cache, evicting the
+    least recently used modules if there are more. None means no limit.
+    The default is 256, or the environment variable
+    INSTANT_MEMORY_CACHE_SIZE."""
+    instant_assert(maxsize is None or maxsize >= 0,
+                   "In instant.set_memory_cache_size: Expecting maxsize >= 0 or None.")
+    _memory_cache.resize(maxsize)
+
+
+def memory_cache_info():
+    "Return the hits, misses, evictions, size and maxsize of the memory cache."
+    return MemoryCacheInfo(_memory_cache.hits, _memory_cache.misses, _memory_cache.evictions,
+                           len(_memory_cache), _memory_cache.maxsize)
+
+
+def memory_cached_modules():
+    "Return the modules in the memory cache, the least recently used first."
+    return _memory_cache.modules()
+
+
+def clear_memory_cache():
+    """Remove all modules, and objects made from them like compiled
+    expressions, from the memory cache and reset its counters. Modules on
+    disk are imported again when needed."""
+    _memory_cache.clear()
+
+
+# Name of the file in a module directory which processes using the module
+# hold a shared lock on, and its eviction an exclusive lock
+_in_use_filename = "in_use"
+
+# Module directories used by this process -> open in use files
+_modules_in_use = {}
+
+def mark_module_in_use(module_path):
+    """Hold a shared lock on a module directory in the cache while this
+    process uses the module, so it is not evicted from the disk cache.
+    Returns False if the module has been removed."""
+    module_path = os.path.abspath(module_path)
+    if module_path in _modules_in_use:
+        return True
+    finished = os.path.join(module_path, "finished_copying")
+    if fcntl is None:
+        return os.path.exists(finished)
+    try:
+        f = open(os.path.join(module_path, _in_use_filename), "a")
+    except (IOError, OSError):
+        return False
+    fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+    if not os.path.exists(finished):
+        f.close()
+        return False
+    _modules_in_use[module_path] = f
+    return True
+
+
+def release_module_in_use(module_path):
+    "Release the lock held on a module directory by L{mark_module_in_use}."
+    f = _modules_in_use.pop(os.path.abspath(module_path), None)
+    if f is not None:
+        f.close()
+
+
+def _parse_size(size):
+    "Return a size in bytes given as a number or a string like '10G'."
+    if size is None or isinstance(size, int):
+        return size
+    r = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*$", str(size), re.IGNORECASE)
+    instant_assert(r is not None, "Invalid cache size %r." % size)
+    return int(float(r.group(1))*1024**" KMGT".index(r.group(2).upper() or " "))
+
+
+_disk_cache_quota = {"max_size": _parse_size(os.environ.get("INSTANT_CACHE_MAX_SIZE") or None),
+                     "max_entries": int(os.environ.get("INSTANT_CACHE_MAX_ENTRIES") or 0) or None}
+
+# Default of arguments to leave unchanged
+_unchanged = object()
+
+def set_disk_cache_quota(max_size=_unchanged, max_entries=_unchanged):
+    """Set the largest total size of the modules in the disk cache, in bytes
+    or as a string like '10G', and the largest number of modules. When a
+    new module is added to a cache directory exceeding these, the least
+    recently used modules are evicted. None means no limit, which is the
+    default unless the environment variables INSTANT_CACHE_MAX_SIZE and
+    INSTANT_CACHE_MAX_ENTRIES are set. Limits not given are unchanged."""
+    if max_size is not _unchanged:
+        _disk_cache_quota["max_size"] = _parse_size(max_size)
+    if max_entries is not _unchanged:
+        _disk_cache_quota["max_entries"] = max_entries
+
+
+def get_disk_cache_quota():
+    "Return the largest total size and number of modules in the disk cache."
+    return _disk_cache_quota["max_size"], _disk_cache_quota["max_entries"]
+
+
+def _remove_module(cache_dir, modulename):
+    """Remove a module from the cache unless a process is using it.
+    Returns True if the module was removed."""
+    module_path = os.path.join(cache_dir, modulename)
+    if module_path in _modules_in_use:
+        return False
+    with file_lock(cache_dir, modulename):
+        f = None
+        if fcntl is not None:
+            try:
+                f = open(os.path.join(module_path, _in_use_filename), "a")
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                if f is not None:
+                    f.close()
+                return False
+        try:
+            # Move the module away at once, so lookups and builds never see
+            # a partly removed module
+            removed_path = "%s.%s%s" % (module_path, uuid.uuid4().hex, _removed_suffix)
+            os.rename(module_path, removed_path)
+        except OSError:
+            return False
+        finally:
+            if f is not None:
+                f.close()
+        index_remove_module(cache_dir, modulename)
+    _remove_tree(removed_path)
+    return True
+
+
+def _remove_tree(path):
+    "Remove a directory tree, warning about files which can not be removed."
+    def failed(function, filename, exc_info):
+        if getattr(exc_info[1], "errno", None) == errno.ENOENT:
+            # Removed by another process cleaning up
+            return
+        instant_warning("In instant.cache: Failed to remove %r from the cache; %s."
+                        % (filename, exc_info[1]))
+    shutil.rmtree(path, onerror=failed)
+
+
+def _remove_leftovers(cache_dir):
+    "Remove module directories left by earlier failures to remove them."
+    for name in os.listdir(cache_dir):
+        if name.endswith(_removed_suffix):
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+
+def evict_from_disk_cache(cache_dir=None, max_size=None, max_entries=None):
+    """Evict the least recently used modules from a cache directory until
+    their total size and number are within max_size and max_entries, by
+    default the quota set by L{set_disk_cache_quota}. Modules used by a
+    process are never evicted. Returns the names of the evicted modules."""
+    if max_size is None and max_entries is None:
+        max_size, max_entries = get_disk_cache_quota()
+    max_size = _parse_size(max_size)
+    if max_size is None and max_entries is None:
+        return []
+    cache_dir = validate_cache_dir(cache_dir)
+
+    evicted = []
+    with file_lock(cache_dir, "instant_disk_cache_quota"):
+        # Files which could not be removed before may be removable now, e.g.
+        # once other NFS clients have closed them
+        _remove_leftovers(cache_dir)
+
+        # Without the index, the last access of a module is the time of its
+        # finished_copying file
+        entries = index_modules(cache_dir, order="accessed")
+        if entries is None:
+            entries = sorted(_scan_modules(cache_dir), key=lambda e: e[2])
+        total_size = sum(size for modulename, size, accessed in entries)
+        count = len(entries)
+        for modulename, size, accessed in entries:
+            if ((max_size is None or total_size <= max_size) and
+                (max_entries is None or count <= max_entries)):
+                break
+            if _remove_module(cache_dir, modulename):
+                instant_debug("In instant.evict_from_disk_cache: Evicted module '%s'."
+                              % modulename)
+                evicted.append(modulename)
+                total_size -= size
+                count -= 1
+    return evicted
+
+
 def is_valid_module_name(name):
     NAMELENGTHLIMIT = 200
     return len(name) < NAMELENGTHLIMIT and bool(re.search(r"^[a-zA-Z_][\w]*$", name))
@@ -94,7 +426,9 @@ def check_memory_cache(moduleid):
     # Check memory cache first with the given moduleid
     moduleids = [moduleid]
     module = memory_cached_module(moduleid)
-    if module: return module, moduleids
+    if module:
+        _memory_cache.record_lookup(True)
+        return module, moduleids
     
     # Get signature from moduleid if it isn't a string,
     # and check memory cache again
@@ -110,6 +444,7 @@ def check_memory_cache(moduleid):
             #              insert?
             #for moduleid in moduleids:
             #    place_module_in_memory_cache(moduleid, module)
+            _memory_cache.record_lookup(True)
             return module, moduleids
         moduleids.append(moduleid)
     
@@ -120,30 +455,73 @@ def check_memory_cache(moduleid):
         instant_debug("In instant.check_memory_cache: Constructed module name "\
                       "'%s' from moduleid '%s'." % (moduleid, moduleids[-1]))
         module = memory_cached_module(moduleid)
-        if module: return module, moduleids
+        if module:
+            _memory_cache.record_lookup(True)
+            return module, moduleids
         moduleids.append(moduleid)
     
+    _memory_cache.record_lookup(False)
     instant_debug("In instant.check_memory_cache: Failed to find module: %s." % moduleid)
     return None, moduleids
 
 
-def check_disk_cache(modulename, cache_dir, moduleids):
+# Seconds within which repeated accesses of a module are not recorded, so
+# most lookups only read the index
+_access_interval = 60.0
+
+def _record_access(cache_dir, path, modulename, accessed):
+    """Record an access of a module for the eviction of the least recently
+    used modules, given its last access time in the index, or None if it is
+    not indexed in path."""
+    now = time.time()
+    if accessed is not None and (now - accessed < _access_interval or
+                                 index_touch_module(cache_dir, modulename)):
+        return
+    # Without the index, the last access is the time of finished_copying
+    finished = os.path.join(path, modulename, "finished_copying")
+    try:
+        if now - os.path.getmtime(finished) >= _access_interval:
+            os.utime(finished, None)
+    except OSError:
+        pass
+
+
+def check_disk_cache(modulename, cache_dir, moduleids, find_unindexed=False):
     # Ensure a valid cache_dir
     cache_dir = validate_cache_dir(cache_dir)
     
-    # Check on disk, in current directory and cache directory
+    # Check on disk, in current directory and cache directory, where the
+    # index tells whether the module exists if available. Modules may have
+    # been added without updating the index, e.g. by older versions of
+    # Instant, so if find_unindexed is True, as before building a module,
+    # modules missing from the index are looked for on disk too.
     for path in (os.getcwd(), cache_dir):
-        if os.path.exists(os.path.join(path, modulename, "finished_copying")):
-
-            # Found existing directory, try to import and place in memory cache
-            module = import_and_cache_module(path, modulename, moduleids)
-            if module:
-                instant_debug("In instant.check_disk_cache: Imported module "\
-                              "'%s' from '%s'." % (modulename, path))
-                return module
-            else:
-                instant_debug("In instant.check_disk_cache: Failed to import "\
-                              "module '%s' from '%s'." % (modulename, path))
+        finished = os.path.join(path, modulename, "finished_copying")
+        accessed = index_module_accessed(cache_dir, modulename) if path == cache_dir else None
+        if accessed == 0 and not find_unindexed:
+            continue
+        if not accessed and not os.path.exists(finished):
+            continue
+        if not mark_module_in_use(os.path.join(path, modulename)):
+            if accessed:
+                # The module was removed without updating the index
+                index_remove_module(cache_dir, modulename)
+            continue
+        if accessed == 0:
+            index_add_module(cache_dir, modulename, module_size(os.path.join(path, modulename)),
+                             moduleids)
+        else:
+            _record_access(cache_dir, path, modulename, accessed)
+
+        # Found existing directory, try to import and place in memory cache
+        module = import_and_cache_module(path, modulename, moduleids)
+        if module:
+            instant_debug("In instant.check_disk_cache: Imported module "\
+                          "'%s' from '%s'." % (modulename, path))
+            return module
+        else:
+            instant_debug("In instant.check_disk_cache: Failed to import "\
+                          "module '%s' from '%s'." % (modulename, path))
     
     # All attempts failed
     instant_debug("In instant.check_disk_cache: Can't import module with modulename "\
@@ -161,6 +539,9 @@ def import_module(moduleid, cache_dir=None):
       - a hashable non-string object with a function moduleid.signature() which is used to get a signature string
     The hashable object is used to look up in the memory cache before signature() is called.
     If the module is found on disk, it is placed in the memory cache.
+    Modules missing from the index of the cache directory, e.g. added by
+    older versions of Instant, are only found by build_module or after
+    rebuild_cache_index.
     """
     # Look for module in memory cache
     module, moduleids = check_memory_cache(moduleid)
@@ -174,5 +555,9 @@ def import_module(moduleid, cache_dir=None):
 def cached_modules(cache_dir=None):
     "Return a list with the names of all cached modules."
     cache_dir = validate_cache_dir(cache_dir)
-    return os.listdir(cache_dir)
+    entries = index_modules(cache_dir)
+    if entries is None:
+        return [name for name in os.listdir(cache_dir)
+                if not name.endswith(_removed_suffix) and not name.startswith(_index_filename)]
+    return [modulename for modulename, size, accessed in entries]
 
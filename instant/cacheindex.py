@@ -0,0 +1,308 @@
+"""A persistent index of the modules in a cache directory, in an SQLite
+database, so looking up, listing and evicting modules does not need to
+scan the directory.
+
+The index uses SQLite's write-ahead log on local filesystems, and the
+rollback journal on network filesystems like NFS, where the write-ahead
+log does not work. SQLite's locking is only as reliable as that of the
+network filesystem, so the index can be disabled by setting the
+environment variable INSTANT_CACHE_INDEX=0."""
+
+# This file is part of Instant.
+#
+# Instant is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Instant is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Instant. If not, see <http://www.gnu.org/licenses/>.
+#
+# Alternatively, Instant may be distributed under the terms of the BSD license.
+
+import os, sys, time
+import threading
+from .output import instant_warning, instant_debug
+from .paths import validate_cache_dir
+from .locking import file_lock
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# Name of the index database in a cache directory
+_index_filename = "instant_cache_index.sqlite"
+
+# Suffix of module directories renamed to be removed from a cache directory
+_removed_suffix = ".removed"
+
+_index_schema = """
+CREATE TABLE IF NOT EXISTS modules (name TEXT PRIMARY KEY, size INTEGER, toolchain TEXT,
+                                    created REAL, accessed REAL);
+CREATE INDEX IF NOT EXISTS modules_accessed ON modules (accessed);
+CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, name TEXT);
+CREATE INDEX IF NOT EXISTS aliases_name ON aliases (name);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Connections to the indices by process and cache directory, used by all
+# threads in turn
+_index_connections = {}
+_index_lock = threading.RLock()
+
+# Cache directories where the index can not be used
+_unindexed_dirs = set()
+
+# Filesystems shared between hosts, where the shared memory file of
+# SQLite's write-ahead log is not coherent
+_network_filesystems = set("""
+nfs nfs4 cifs smbfs smb3 afs ncpfs lustre gpfs beegfs ceph glusterfs 9p panfs
+""".split())
+
+
+def _filesystem_type(path):
+    """Return the type of the filesystem containing path, like 'ext4' or
+    'nfs', or None if it is not known."""
+    try:
+        with open("/proc/mounts") as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) > 2]
+    except (IOError, OSError):
+        return None
+    path = os.path.realpath(path)
+    best, fstype = "", None
+    for mountpoint, kind in mounts:
+        mountpoint = mountpoint.replace("\\040", " ")
+        if ((path == mountpoint or path.startswith(mountpoint.rstrip("/") + "/"))
+            and len(mountpoint) >= len(best)):
+            best, fstype = mountpoint, kind
+    return fstype
+
+
+def _journal_mode(cache_dir):
+    """Return the SQLite journal mode for the index of a cache directory,
+    the write-ahead log on local filesystems and the rollback journal on
+    filesystems shared between hosts or of unknown type."""
+    fstype = _filesystem_type(cache_dir)
+    if fstype is None or fstype in _network_filesystems or fstype.startswith("fuse"):
+        return "DELETE"
+    return "WAL"
+
+
+def directory_size(path):
+    "Return the total size in bytes of the files in a directory tree."
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return size
+
+
+def module_size(module_path):
+    """Return the size of a module in the cache, as written in its
+    finished_copying file or else computed."""
+    try:
+        with open(os.path.join(module_path, "finished_copying")) as f:
+            return int(f.read())
+    except (IOError, OSError, ValueError):
+        return directory_size(module_path)
+
+
+def toolchain_description():
+    "Return a description of the SWIG, Python and compiler building modules."
+    import sysconfig
+    from .config import get_swig_version
+    compiler = os.environ.get("CXX") or sysconfig.get_config_var("CXX") or "c++"
+    return "swig %s, python %s, %s" % (get_swig_version(), sys.version.split()[0], compiler)
+
+
+def _scan_modules(cache_dir):
+    "Return the name, size and last access of the modules in a cache directory."
+    entries = []
+    for modulename in os.listdir(cache_dir):
+        if modulename.endswith(_removed_suffix):
+            continue
+        module_path = os.path.join(cache_dir, modulename)
+        try:
+            accessed = os.stat(os.path.join(module_path, "finished_copying")).st_mtime
+        except OSError:
+            continue
+        entries.append((modulename, module_size(module_path), accessed))
+    return entries
+
+
+def _connect(cache_dir):
+    """Return a connection to the index of a cache directory, creating it
+    from the modules in the directory if necessary, or None if the index
+    can not be used."""
+    if sqlite3 is None or os.environ.get("INSTANT_CACHE_INDEX", "1") == "0":
+        return None
+    key = (os.getpid(), cache_dir)
+    if cache_dir in _unindexed_dirs:
+        return None
+    connection = _index_connections.get(key)
+    if connection is not None:
+        return connection
+    try:
+        connection = sqlite3.connect(os.path.join(cache_dir, _index_filename), timeout=60,
+                                     isolation_level=None, check_same_thread=False)
+        journal_mode = _journal_mode(cache_dir)
+        connection.execute("PRAGMA journal_mode=%s" % journal_mode)
+        if journal_mode == "WAL":
+            connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(_index_schema)
+        complete = connection.execute("SELECT value FROM meta WHERE key='complete'").fetchone()
+        if complete is None:
+            with file_lock(cache_dir, "instant_cache_index"):
+                _rebuild(connection, cache_dir)
+    except sqlite3.Error as e:
+        instant_warning("In instant.cacheindex: Not using the index of the cache directory "
+                        "%r; %s." % (cache_dir, e))
+        _unindexed_dirs.add(cache_dir)
+        return None
+    _index_connections[key] = connection
+    return connection
+
+
+def _rebuild(connection, cache_dir):
+    "Replace the contents of an index by the modules in the cache directory."
+    instant_debug("In instant.cacheindex: Building index of %r." % cache_dir)
+    entries = _scan_modules(cache_dir)
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute("DELETE FROM modules")
+        connection.executemany("INSERT INTO modules VALUES (?, ?, NULL, ?, ?)",
+                               [(name, size, accessed, accessed)
+                                for name, size, accessed in entries])
+        connection.execute("DELETE FROM aliases WHERE name NOT IN (SELECT name FROM modules)")
+        connection.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '1')")
+        connection.execute("COMMIT")
+    except:
+        connection.execute("ROLLBACK")
+        raise
+
+
+def _query(cache_dir, sql, parameters=(), fetch=None):
+    """Run a statement on the index of a cache directory, returning the
+    rows if fetch is 'all', the first row if fetch is 'one', and None if
+    the index can not be used."""
+    with _index_lock:
+        connection = _connect(cache_dir)
+        if connection is None:
+            return None
+        try:
+            cursor = connection.execute(sql, parameters)
+            if fetch == "all":
+                return cursor.fetchall()
+            if fetch == "one":
+                return cursor.fetchone()
+            return True
+        except sqlite3.Error as e:
+            instant_warning("In instant.cacheindex: Failed to use the index of the "
+                            "cache directory %r; %s." % (cache_dir, e))
+            return None
+
+
+def index_add_module(cache_dir, modulename, size, aliases=(), toolchain=None):
+    "Record a module added to a cache directory, with its other moduleids."
+    now = time.time()
+    if _query(cache_dir, "INSERT OR IGNORE INTO modules VALUES (?, ?, ?, ?, ?)",
+              (modulename, size, toolchain, now, now)) is None:
+        return
+    _query(cache_dir, "UPDATE modules SET size=?, accessed=?, "
+           "toolchain=COALESCE(?, toolchain) WHERE name=?", (size, now, toolchain, modulename))
+    for alias in aliases:
+        if isinstance(alias, str) and alias != modulename:
+            _query(cache_dir, "INSERT OR REPLACE INTO aliases VALUES (?, ?)", (alias, modulename))
+
+
+def index_has_module(cache_dir, modulename):
+    "Return whether the index lists a module, or None if there is no index."
+    row = _query(cache_dir, "SELECT 1 FROM modules WHERE name=?", (modulename,), "all")
+    return None if row is None else bool(row)
+
+
+def index_module_accessed(cache_dir, modulename):
+    """Return the last access time of a module in the index, 0 if the index
+    does not list it, or None if there is no index."""
+    rows = _query(cache_dir, "SELECT accessed FROM modules WHERE name=?", (modulename,), "all")
+    if rows is None:
+        return None
+    return rows[0][0] or 0 if rows else 0
+
+
+def index_touch_module(cache_dir, modulename):
+    "Record an access of a module. Returns None if there is no index."
+    return _query(cache_dir, "UPDATE modules SET accessed=? WHERE name=?",
+                  (time.time(), modulename))
+
+
+def index_remove_module(cache_dir, modulename):
+    "Record that a module was removed from a cache directory."
+    if _query(cache_dir, "DELETE FROM modules WHERE name=?", (modulename,)):
+        _query(cache_dir, "DELETE FROM aliases WHERE name=?", (modulename,))
+
+
+def index_modules(cache_dir, order="name"):
+    """Return the name, size and last access of the modules in the index,
+    ordered by name or last access, or None if there is no index."""
+    column = {"name": "name", "accessed": "accessed"}[order]
+    return _query(cache_dir, "SELECT name, size, accessed FROM modules ORDER BY %s" % column,
+                  fetch="all")
+
+
+def rebuild_cache_index(cache_dir=None):
+    """Rebuild the index of a cache directory from the modules in it, e.g.
+    after modules have been removed by hand."""
+    cache_dir = validate_cache_dir(cache_dir)
+    with _index_lock:
+        connection = _connect(cache_dir)
+        if connection is not None:
+            with file_lock(cache_dir, "instant_cache_index"):
+                _rebuild(connection, cache_dir)
+
+
+def lookup_cached_module(alias, cache_dir=None):
+    """Return the name of the module in a cache directory with the given
+    name or signature string, or None if it is not in the index."""
+    cache_dir = validate_cache_dir(cache_dir)
+    row = _query(cache_dir, "SELECT name FROM modules WHERE name=? UNION "
+                 "SELECT name FROM aliases WHERE alias=?", (alias, alias), "one")
+    return row[0] if row else None
+
+
+def cached_module_info(modulename, cache_dir=None):
+    """Return a dict with the size, toolchain, creation and last access
+    time, and the signatures of a module in the index of a cache
+    directory, or None if it is not in the index."""
+    cache_dir = validate_cache_dir(cache_dir)
+    row = _query(cache_dir, "SELECT size, toolchain, created, accessed FROM modules "
+                 "WHERE name=?", (modulename,), "one")
+    if not row:
+        return None
+    aliases = _query(cache_dir, "SELECT alias FROM aliases WHERE name=? ORDER BY alias",
+                     (modulename,), "all") or []
+    return dict(name=modulename, size=row[0], toolchain=row[1], created=row[2],
+                accessed=row[3], aliases=[a for a, in aliases])
+
+
+def disk_cache_stats(cache_dir=None):
+    """Return a dict with the number of modules, their total size, and the
+    oldest and newest last access time in a cache directory."""
+    cache_dir = validate_cache_dir(cache_dir)
+    row = _query(cache_dir, "SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(accessed), "
+                 "MAX(accessed) FROM modules", fetch="one")
+    if row is None:
+        entries = _scan_modules(cache_dir)
+        accessed = [a for name, size, a in entries]
+        row = (len(entries), sum(size for name, size, a in entries),
+               min(accessed) if accessed else None, max(accessed) if accessed else None)
+    return dict(modules=row[0], size=row[1], oldest=row[2], newest=row[3])
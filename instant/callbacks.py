@@ -0,0 +1,38 @@
+"""Access to pointers to functions in Instant modules, for passing compiled
+functions as callbacks to other modules or to SciPy without calling back
+into Python."""
+
+# This file is part of Instant.
+#
+# Instant is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Instant is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Instant. If not, see <http://www.gnu.org/licenses/>.
+#
+# Alternatively, Instant may be distributed under the terms of the BSD license.
+
+from .output import instant_error
+
+def function_pointer(module, name):
+    """Return a PyCapsule with a pointer to the function name in module,
+    named by the signature of the function, e.g. C{'double (double)'}.
+    The module must have been built with name in B{function_pointers}."""
+    getter = getattr(module, "_instant_function_pointer_" + name, None)
+    if getter is None:
+        instant_error("In instant.function_pointer: Module has no pointer to "
+                      "function '%s', add it to function_pointers." % name)
+    return getter()
+
+def low_level_callable(module, name, user_data=None):
+    """Return a C{scipy.LowLevelCallable} calling the function name in module
+    directly, e.g. for C{scipy.integrate.quad} or C{scipy.ndimage}."""
+    from scipy import LowLevelCallable
+    return LowLevelCallable(function_pointer(module, name), user_data)
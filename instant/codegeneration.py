@@ -24,7 +24,7 @@
 
 import sys
 import re, os
-from .output import instant_assert, instant_warning, instant_debug, write_file
+from .output import instant_assert, instant_error, instant_warning, instant_debug, write_file
 from .config import get_swig_binary
 
 def mapstrings(format, sequence):
@@ -60,9 +60,1022 @@ def reindent(code):
     instant_assert(space == " "*n, "Logic breach in reindent.")
     return "\n".join(re.sub(r"^%s" % space, "", l) for l in lines)
 
+# NumPy type numbers for the data types accepted in the arrays argument
+_numpy_typecodes = {'float': 'NPY_FLOAT', 'double': 'NPY_DOUBLE',
+                    'short': 'NPY_SHORT', 'int': 'NPY_INT',
+                    'long': 'NPY_LONG', 'long long': 'NPY_LONGLONG',
+                    'unsigned short': 'NPY_USHORT', 'unsigned int': 'NPY_UINT',
+                    'unsigned long': 'NPY_ULONG',
+                    'unsigned long long': 'NPY_ULONGLONG',
+                    'std::complex<float>': 'NPY_CFLOAT',
+                    'std::complex<double>': 'NPY_CDOUBLE'}
+
+# NumPy type characters for the same data types, used for dispatching
+_numpy_typechars = {'float': 'f', 'double': 'd', 'short': 'h', 'int': 'i',
+                    'long': 'l', 'long long': 'q', 'unsigned short': 'H',
+                    'unsigned int': 'I', 'unsigned long': 'L',
+                    'unsigned long long': 'Q', 'std::complex<float>': 'F',
+                    'std::complex<double>': 'D'}
+
+def find_template_functions(code):
+    "Return the names of the function templates with one type parameter in code."
+    pattern = r"template\s*<\s*(?:typename|class)\s+\w+\s*>\s*[\w:<>\s\*&]*?(\w+)\s*\("
+    return unique_ordered(re.findall(pattern, code))
+
+def unique_ordered(sequence):
+    "Return the unique elements of sequence in order of first occurrence."
+    result = []
+    for i in sequence:
+        if i not in result:
+            result.append(i)
+    return result
+
+def specialization_name(func_name, dtype):
+    "Return the name of the specialization of a function template for dtype."
+    return "%s_%s" % (func_name, re.sub(r"\W+", "_", dtype.replace("std::", "")).strip("_"))
+
+# Words in array specifications which are not names of parameters
+_array_flags = set(['in', 'out', 'multi', 'generic', 'trusted', 'ragged', 'csr', 'csc',
+                    'strided', 'owned', 'buffer', 'fortran'])
+
+def parameter_names(parameters):
+    "Return the names of the comma separated C function parameters."
+    words = [re.findall(r"\w+", p.split("=")[0]) for p in parameters.split(",")]
+    return [w[-1] for w in words if w]
+
+def function_parameters(code, name):
+    "Return the names of the parameters of the function name defined in code, or None."
+    match = re.search(r"\b%s\s*\(([^()]*)\)\s*\{" % re.escape(name), remove_comments(code))
+    if match is None:
+        return None
+    return parameter_names(match.group(1))
+
+def defined_functions(code):
+    "Return a list of the parameter names of each function defined in code."
+    pattern = r"\b(\w+)\s*\(([^()]*)\)\s*(?:const\s*)?\{"
+    return [parameter_names(parameters)
+            for name, parameters in re.findall(pattern, remove_comments(code))
+            if name not in ('if', 'for', 'while', 'switch', 'catch')]
+
+def split_array_spec(spec, types, functions):
+    """Return the parameter names and the flags of an array specification.
+
+    The flags are the trailing words like 'in' and 'out', data types and
+    words like 'dealloc=f'. Such a word is taken as a name instead if only
+    then the names are consecutive parameters of one of functions, a list
+    of the parameter names of the functions in the code, e.g. for an array
+    named 'out'. If both are possible, the specification is ambiguous."""
+    spec = list(spec)
+    count = 0
+    while count < len(spec) and (spec[-1 - count] in _array_flags or
+                                 spec[-1 - count] in types or '=' in spec[-1 - count]):
+        count += 1
+
+    def consecutive(names):
+        return len(names) > 1 and any(parameters[i:i + len(names)] == names
+                                      for parameters in functions
+                                      for i in range(len(parameters)))
+
+    readings = [k for k in range(count + 1) if consecutive(spec[:len(spec) - k])]
+    if len(readings) > 1:
+        words = spec[len(spec) - readings[-1]:len(spec) - readings[0]]
+        instant_error("Ambiguous array specification %r, %s may be parameter names or "
+                      "flags." % (spec, ", ".join(repr(w) for w in words)))
+    # Without a matching function, e.g. declared in a header, all are flags
+    n = len(spec) - (readings[0] if readings else count)
+    return spec[:n], spec[n:]
+
+def generic_positions(parameters, specs):
+    """Return the positions of the Python arguments of a function with the
+    given parameter names, which are arrays marked 'generic' in specs, a
+    list of (names, generic, owned) tuples of the array specifications."""
+    positions = []
+    position = 0
+    i = 0
+    while i < len(parameters):
+        for names, generic, owned in specs:
+            if names and parameters[i:i + len(names)] == names:
+                break
+        else:
+            names, generic, owned = parameters[i:i + 1], False, False
+        if generic and not owned:
+            positions.append(position)
+        # Owned arrays are only returned
+        if not owned:
+            position += 1
+        i += len(names)
+    return positions
+
+def generic_code(functions, generic_types, positions={}):
+    """Return SWIG code instantiating each function template for each of
+    the generic types, and Python dispatchers calling the specialization
+    matching the data type of the first generic array argument, given by
+    positions, a dict mapping the functions to the positions of their
+    generic arguments, or else of the first array argument."""
+    if not functions:
+        return ""
+    templates = []
+    dispatchers = []
+    for f in functions:
+        for t in generic_types:
+            templates.append("%%template(%s) %s<%s >;" % (specialization_name(f, t), f, t))
+        table = ", ".join("(%r, %s)" % (_numpy_typechars[t], specialization_name(f, t))
+                          for t in generic_types)
+        position = positions.get(f)
+        dispatchers.append(reindent("""
+            _%(f)s_specializations = _instant_specializations([%(table)s])
+            def %(f)s(*args):
+                return _instant_dispatch(%(f)r, _%(f)s_specializations, args, %(position)r)
+            """ % locals()))
+    return "\n".join(templates) + reindent("""
+
+        %pythoncode %{
+        def _instant_specializations(table):
+            import numpy
+            specializations = {None: table[0][1]}
+            for typechar, func in table:
+                specializations.setdefault(numpy.dtype(typechar), func)
+            return specializations
+
+        def _instant_dispatch(name, specializations, args, positions=None):
+            candidates = args
+            if positions is not None:
+                candidates = [args[i] for i in positions if i < len(args)]
+            for a in candidates:
+                if hasattr(a, "dtype"):
+                    func = specializations.get(a.dtype)
+                    if func is None:
+                        raise TypeError("%s is not specialized for arrays of type %s"
+                                        % (name, a.dtype))
+                    return func(*args)
+            return specializations[None](*args)
+        """) + "".join(dispatchers) + "%}\n"
+
+
+def strided_typemap(dims, strides, array, dtype, itype, readonly):
+    """Return a typemap passing a NumPy array to C without copying,
+    together with its shape and its strides counted in elements.
+
+    If readonly is True, the typemap accepts any object that can be
+    converted to an array, and only makes a copy if the data type or
+    alignment doesn't match. Otherwise a writeable array with matching
+    data type is required."""
+    nd = len(dims)
+    params = ", ".join(["%s %s" % (itype, n) for n in dims + strides] + ["%s* %s" % (dtype, array)])
+    typecode = _numpy_typecodes[dtype]
+    if readonly:
+        get_array = reindent("""
+            array = (PyArrayObject*) PyArray_FROMANY($input, %(typecode)s, %(nd)d, %(nd)d, NPY_ARRAY_ALIGNED);
+            if (!array) SWIG_fail;
+            """ % locals()).strip()
+        freearg = "%%typemap(freearg) (%s) {\n  Py_XDECREF(array$argnum);\n}\n" % params
+    else:
+        get_array = reindent("""
+            array = obj_to_array_no_conversion($input, %(typecode)s);
+            if (!array || !require_dimensions(array, %(nd)d) || !require_native(array)) SWIG_fail;
+            if (!PyArray_ISALIGNED(array) || !PyArray_ISWRITEABLE(array)) {
+              PyErr_SetString(PyExc_TypeError, "Array must be aligned and writeable");
+              SWIG_fail;
+            }
+            """ % locals()).strip()
+        freearg = ""
+    shape = "\n".join("$%d = (%s) PyArray_DIM(array, %d);" % (i + 1, itype, i)
+                       for i in range(nd))
+    stride = "\n".join("$%d = (%s) (PyArray_STRIDE(array, %d) / (npy_intp) sizeof(%s));"
+                        % (nd + i + 1, itype, i, dtype) for i in range(nd))
+    data = "$%d = (%s*) PyArray_DATA(array);" % (2*nd + 1, dtype)
+    return """
+%%typemap(in, fragment="NumPy_Fragments") (%(params)s) (PyArrayObject* array=NULL) {
+%(get_array)s
+for (int d=0; d<%(nd)d; d++) {
+  if (PyArray_STRIDE(array, d) %% (npy_intp) sizeof(%(dtype)s)) {
+    PyErr_SetString(PyExc_ValueError, "Array strides must be a multiple of the item size");
+    SWIG_fail;
+  }
+}
+%(shape)s
+%(stride)s
+%(data)s
+}
+%(freearg)s""" % locals()
+
+def fortran_typemap(dims, array, dtype, itype, readonly):
+    """Return a typemap passing a Fortran ordered NumPy array to C without
+    copying, together with its shape.
+
+    If readonly is True, arrays that are not Fortran contiguous or have
+    another data type are converted to a Fortran ordered copy. Otherwise
+    a writeable Fortran contiguous array with matching data type is
+    required."""
+    nd = len(dims)
+    params = ", ".join(["%s %s" % (itype, n) for n in dims] + ["%s* %s" % (dtype, array)])
+    typecode = _numpy_typecodes[dtype]
+    if readonly:
+        get_array = reindent("""
+            array = (PyArrayObject*) PyArray_FROMANY($input, %(typecode)s, %(nd)d, %(nd)d, NPY_ARRAY_FARRAY_RO);
+            if (!array) SWIG_fail;
+            """ % locals()).strip()
+        freearg = "%%typemap(freearg) (%s) {\n  Py_XDECREF(array$argnum);\n}\n" % params
+    else:
+        get_array = reindent("""
+            array = obj_to_array_no_conversion($input, %(typecode)s);
+            if (!array || !require_dimensions(array, %(nd)d) || !require_native(array)) SWIG_fail;
+            if (!PyArray_IS_F_CONTIGUOUS(array) || !PyArray_ISALIGNED(array) || !PyArray_ISWRITEABLE(array)) {
+              PyErr_SetString(PyExc_TypeError, "Array must be Fortran contiguous, aligned and writeable");
+              SWIG_fail;
+            }
+            """ % locals()).strip()
+        freearg = ""
+    shape = "\n".join("$%d = (%s) PyArray_DIM(array, %d);" % (i + 1, itype, i)
+                       for i in range(nd))
+    data = "$%d = (%s*) PyArray_DATA(array);" % (nd + 1, dtype)
+    return """
+%%typemap(in, fragment="NumPy_Fragments") (%(params)s) (PyArrayObject* array=NULL) {
+%(get_array)s
+%(shape)s
+%(data)s
+}
+%(freearg)s""" % locals()
+
+def multi_typemap(names, dtype, itype, readonly):
+    """Return a typemap passing a NumPy array with any number of
+    dimensions to C without copying or allocating memory.
+
+    names holds the names of the number of dimensions, the pointer to the
+    shape, optionally the pointer to the strides counted in elements, and
+    the array. Without strides the array must be C contiguous. The data
+    type, alignment and byte order are checked. If readonly is True,
+    objects not satisfying these requirements are converted, otherwise a
+    writeable array is required."""
+    strided = len(names) == 4
+    params = ", ".join(["int %s" % names[0]] + ["%s* %s" % (itype, n) for n in names[1:-1]]
+                       + ["%s* %s" % (dtype, names[-1])])
+    typecode = _numpy_typecodes[dtype]
+    local = "PyArrayObject* ary=NULL"
+    if readonly:
+        flags = "NPY_ARRAY_ALIGNED" if strided else "NPY_ARRAY_CARRAY_RO"
+        get_array = reindent("""
+            ary = (PyArrayObject*) PyArray_FROMANY($input, %(typecode)s, 0, 0, %(flags)s);
+            if (!ary) SWIG_fail;
+            """ % locals()).strip()
+        freearg = "%%typemap(freearg) (%s) {\n  Py_XDECREF(ary$argnum);\n}\n" % params
+    else:
+        contiguous = "" if strided else "!PyArray_IS_C_CONTIGUOUS(ary) || "
+        requirement = "aligned and writeable" if strided else "contiguous, aligned and writeable"
+        get_array = reindent("""
+            ary = obj_to_array_no_conversion($input, %(typecode)s);
+            if (!ary || !require_native(ary)) SWIG_fail;
+            if (%(contiguous)s!PyArray_ISALIGNED(ary) || !PyArray_ISWRITEABLE(ary)) {
+              PyErr_SetString(PyExc_TypeError, "Array must be %(requirement)s");
+              SWIG_fail;
+            }
+            """ % locals()).strip()
+        freearg = ""
+    if itype == "npy_intp":
+        shape = "$2 = PyArray_DIMS(ary);"
+    else:
+        local += ", %s dims_temp[NPY_MAXDIMS]" % itype
+        shape = reindent("""
+            for (int d=0; d<$1; d++)
+              dims_temp[d] = (%(itype)s) PyArray_DIM(ary, d);
+            $2 = dims_temp;
+            """ % locals()).strip()
+    if strided:
+        local += ", %s strides_temp[NPY_MAXDIMS]" % itype
+        shape += reindent("""
+
+            for (int d=0; d<$1; d++) {
+              if (PyArray_STRIDE(ary, d) %% (npy_intp) sizeof(%(dtype)s)) {
+                PyErr_SetString(PyExc_ValueError, "Array strides must be a multiple of the item size");
+                SWIG_fail;
+              }
+              strides_temp[d] = (%(itype)s) (PyArray_STRIDE(ary, d) / (npy_intp) sizeof(%(dtype)s));
+            }
+            $3 = strides_temp;
+            """ % locals()).rstrip()
+    data = "$%d = (%s*) PyArray_DATA(ary);" % (len(names), dtype)
+    return """
+%%typemap(in, fragment="NumPy_Fragments") (%(params)s) (%(local)s) {
+%(get_array)s
+$1 = PyArray_NDIM(ary);
+%(shape)s
+%(data)s
+}
+%(freearg)s""" % locals()
+
+def trusted_typemap(dims, array, dtype, itype, multi):
+    """Return a typemap passing a NumPy array to C by only extracting its
+    data pointer and shape, for arrays known to be correct.
+
+    The argument is assumed to be an aligned, C contiguous array of the
+    given data type and number of dimensions. These checks are compiled in
+    only if INSTANT_DEBUG is defined, e.g. with cppargs=['-DINSTANT_DEBUG'].
+    If multi is True, dims holds the names of the number of dimensions and
+    the pointer to the shape, otherwise the names of the dimensions."""
+    if multi:
+        params = "int %s, %s* %s" % (dims[0], itype, dims[1])
+    else:
+        params = ", ".join("%s %s" % (itype, n) for n in dims)
+    params += ", %s* %s" % (dtype, array)
+    typecode = _numpy_typecodes[dtype]
+    local = ""
+    if multi:
+        ndim_check = ""
+        shape = "  $1 = PyArray_NDIM(ary);\n"
+        if itype == "npy_intp":
+            shape += "  $2 = PyArray_DIMS(ary);"
+        else:
+            local = "(%s dims_temp[NPY_MAXDIMS])" % itype
+            shape += ("\n  for (int d=0; d<$1; d++)"
+                      "\n    dims_temp[d] = (%s) PyArray_DIM(ary, d);"
+                      "\n  $2 = dims_temp;" % itype)
+        last = 3
+    else:
+        nd = len(dims)
+        ndim_check = " || PyArray_NDIM(ary) != %d" % nd
+        shape = "\n".join("  $%d = (%s) PyArray_DIM(ary, %d);" % (i + 1, itype, i)
+                           for i in range(nd))
+        last = nd + 1
+    return """
+%%typemap(in, fragment="NumPy_Fragments") (%(params)s) %(local)s{
+  PyArrayObject* ary = (PyArrayObject*) $input;
+%%#ifdef INSTANT_DEBUG
+  if (!is_array($input) || PyArray_TYPE(ary) != %(typecode)s%(ndim_check)s
+      || !PyArray_IS_C_CONTIGUOUS(ary) || !PyArray_ISALIGNED(ary) || !PyArray_ISNOTSWAPPED(ary)) {
+    PyErr_SetString(PyExc_TypeError, "Trusted argument must be an aligned, C contiguous array of type '%(dtype)s'");
+    SWIG_fail;
+  }
+%%#endif
+%(shape)s
+  $%(last)d = (%(dtype)s*) PyArray_DATA(ary);
+}
+""" % locals()
+
+def ragged_typemap(count, lengths, array, dtype, itype, readonly):
+    """Return a typemap passing a list or tuple of NumPy arrays of different
+    lengths to C in a single call, as the number of arrays, an array with
+    the number of elements in each array and an array of data pointers.
+
+    If readonly is True, objects that are not C contiguous arrays of dtype
+    are converted, otherwise writeable arrays of dtype are required."""
+    params = "int %s, %s* %s, %s** %s" % (count, itype, lengths, dtype, array)
+    typecode = _numpy_typecodes[dtype]
+    if readonly:
+        get_array = reindent("""
+            ragged_refs[i] = PyArray_FROMANY(obj, %(typecode)s, 0, 0, NPY_ARRAY_CARRAY_RO);
+            if (!ragged_refs[i]) SWIG_fail;
+            ary = (PyArrayObject*) ragged_refs[i];
+            """ % locals())
+    else:
+        get_array = reindent("""
+            ary = obj_to_array_no_conversion(obj, %(typecode)s);
+            if (!ary || !require_contiguous(ary) || !require_native(ary)) SWIG_fail;
+            if (!PyArray_ISALIGNED(ary) || !PyArray_ISWRITEABLE(ary)) {
+              PyErr_SetString(PyExc_TypeError, "Arrays in list must be aligned and writeable");
+              SWIG_fail;
+            }
+            """ % locals())
+    get_array = "\n".join("    " + line for line in get_array.strip().split("\n"))
+    return """
+%%typemap(in, fragment="NumPy_Fragments") (%(params)s)
+  (PyObject* ragged_seq=NULL, Py_ssize_t ragged_count=0, %(itype)s* ragged_lengths=NULL,
+   %(dtype)s** ragged_data=NULL, PyObject** ragged_refs=NULL) {
+  Py_ssize_t i;
+  ragged_seq = PySequence_Fast($input, "A list or tuple of arrays required");
+  if (!ragged_seq) SWIG_fail;
+  ragged_count = PySequence_Fast_GET_SIZE(ragged_seq);
+  ragged_lengths = (%(itype)s*) PyMem_Malloc((ragged_count + 1)*sizeof(%(itype)s));
+  ragged_data = (%(dtype)s**) PyMem_Malloc((ragged_count + 1)*sizeof(%(dtype)s*));
+  ragged_refs = (PyObject**) PyMem_Malloc((ragged_count + 1)*sizeof(PyObject*));
+  if (!ragged_lengths || !ragged_data || !ragged_refs) {
+    PyErr_NoMemory();
+    SWIG_fail;
+  }
+  for (i=0; i<ragged_count; i++)
+    ragged_refs[i] = NULL;
+  for (i=0; i<ragged_count; i++) {
+    PyObject* obj = PySequence_Fast_GET_ITEM(ragged_seq, i);
+    PyArrayObject* ary;
+%(get_array)s
+    ragged_lengths[i] = (%(itype)s) PyArray_SIZE(ary);
+    ragged_data[i] = (%(dtype)s*) PyArray_DATA(ary);
+  }
+  $1 = (int) ragged_count;
+  $2 = ragged_lengths;
+  $3 = ragged_data;
+}
+%%typemap(freearg) (%(params)s) {
+  if (ragged_refs$argnum) {
+    for (Py_ssize_t i=0; i<ragged_count$argnum; i++)
+      Py_XDECREF(ragged_refs$argnum[i]);
+  }
+  PyMem_Free(ragged_refs$argnum);
+  PyMem_Free(ragged_data$argnum);
+  PyMem_Free(ragged_lengths$argnum);
+  Py_XDECREF(ragged_seq$argnum);
+}
+""" % locals()
+
+def output_typemap(dims, array, dtype, itype, multi):
+    """Return a typemap for an output array, returned from the wrapped function.
+
+    The caller passes either the shape of a new array to allocate, or an
+    existing C contiguous array of matching data type which is written
+    into and returned, avoiding allocations in loops. If multi is True,
+    dims holds the names of the number of dimensions and of the pointer
+    to the shape, and any number of dimensions is accepted."""
+    typecode = _numpy_typecodes[dtype]
+    if multi:
+        check_dims = ""
+        check_shape = ""
+        params = "int %s, %s* %s, %s* %s" % (dims[0], itype, dims[1], dtype, array)
+        local = ", %s dims_temp[NPY_MAXDIMS]" % itype
+        shape = reindent("""
+            $1 = PyArray_NDIM(output);
+            for (int d=0; d<$1; d++)
+              dims_temp[d] = (%(itype)s) PyArray_DIM(output, d);
+            $2 = dims_temp;
+            $3 = (%(dtype)s*) PyArray_DATA(output);
+            """ % locals()).strip()
+    else:
+        nd = len(dims)
+        check_dims = "!require_dimensions(output, %d) || " % nd
+        check_shape = reindent("""
+            if (shape.len != %(nd)d) {
+              PyErr_Format(PyExc_TypeError, "Output array must have %(nd)d dimensions, given shape has %%d dimensions",
+                           shape.len);
+              PyDimMem_FREE(shape.ptr);
+              SWIG_fail;
+            }
+            """ % locals()).strip()
+        params = ", ".join(["%s %s" % (itype, n) for n in dims] + ["%s* %s" % (dtype, array)])
+        local = ""
+        shape = "\n".join(["$%d = (%s) PyArray_DIM(output, %d);" % (i + 1, itype, i)
+                           for i in range(nd)] +
+                          ["$%d = (%s*) PyArray_DATA(output);" % (nd + 1, dtype)])
+    return """
+%%typemap(in, fragment="NumPy_Fragments") (%(params)s) (PyArrayObject* output=NULL%(local)s) {
+if (is_array($input)) {
+  output = obj_to_array_no_conversion($input, %(typecode)s);
+  if (!output) SWIG_fail;
+  /* Own a reference, released by freearg also on the error paths */
+  Py_INCREF(output);
+  if (%(check_dims)s!require_native(output)) SWIG_fail;
+  if (!PyArray_IS_C_CONTIGUOUS(output) || !PyArray_ISALIGNED(output) || !PyArray_ISWRITEABLE(output)) {
+    PyErr_SetString(PyExc_TypeError, "Output array must be contiguous, aligned and writeable");
+    SWIG_fail;
+  }
+}
+else {
+  PyArray_Dims shape = {NULL, 0};
+  if (!PyArray_IntpConverter($input, &shape)) SWIG_fail;
+  %(check_shape)s
+  output = (PyArrayObject*) PyArray_SimpleNew(shape.len, shape.ptr, %(typecode)s);
+  PyDimMem_FREE(shape.ptr);
+  if (!output) SWIG_fail;
+}
+%(shape)s
+}
+%%typemap(argout) (%(params)s) {
+  $result = SWIG_Python_AppendOutput($result, (PyObject*) output$argnum);
+  output$argnum = NULL;
+}
+%%typemap(freearg) (%(params)s) {
+  Py_XDECREF(output$argnum);
+}
+""" % locals()
+
+def owned_typemap(dims, array, dtype, itype, dealloc):
+    """Return a typemap returning memory allocated by the wrapped function
+    as a NumPy array, without copying.
+
+    The function gets pointers to the dimensions and to the data pointer,
+    which it sets. The array owns the memory through a PyCapsule base
+    object, which calls the deallocator dealloc(void*) when the array is
+    garbage collected."""
+    nd = len(dims)
+    params = ", ".join(["%s* %s" % (itype, n) for n in dims] + ["%s** %s" % (dtype, array)])
+    typecode = _numpy_typecodes[dtype]
+    local = "%s dims_temp[%d], %s* data_temp=NULL" % (itype, nd, dtype)
+    pointers = "\n".join(["  $%d = &dims_temp[%d];" % (i + 1, i) for i in range(nd)] +
+                          ["  $%d = &data_temp;" % (nd + 1)])
+    shape = ", ".join("(npy_intp) *$%d" % (i + 1) for i in range(nd))
+    destructor = capsule_destructor_name(dealloc)
+    return """
+%%typemap(in, numinputs=0) (%(params)s) (%(local)s) {
+%(pointers)s
+}
+%%typemap(argout, fragment="NumPy_Fragments") (%(params)s) {
+  npy_intp dims[%(nd)d] = { %(shape)s };
+  PyObject* obj;
+  if (*$%(last)d) {
+    PyObject* capsule = PyCapsule_New((void*) *$%(last)d, NULL, %(destructor)s);
+    if (!capsule) {
+      %(dealloc)s((void*) *$%(last)d);
+      SWIG_fail;
+    }
+    obj = PyArray_SimpleNewFromData(%(nd)d, dims, %(typecode)s, (void*) *$%(last)d);
+    if (!obj) {
+      Py_DECREF(capsule);
+      SWIG_fail;
+    }
+    if (PyArray_SetBaseObject((PyArrayObject*) obj, capsule) < 0) {
+      Py_DECREF(obj);
+      SWIG_fail;
+    }
+  }
+  else {
+    if (PyArray_MultiplyList(dims, %(nd)d)) {
+      PyErr_SetString(PyExc_ValueError, "NULL data returned for a non-empty array");
+      SWIG_fail;
+    }
+    obj = PyArray_SimpleNew(%(nd)d, dims, %(typecode)s);
+    if (!obj) SWIG_fail;
+  }
+  $result = SWIG_Python_AppendOutput($result, obj);
+}
+""" % dict(locals(), last=nd + 1)
+
+# NumPy type codes of the dimension types, used for sparse matrix indices
+_index_typecodes = {'int': 'NPY_INT', 'int64_t': 'NPY_INT64', 'npy_intp': 'NPY_INTP'}
+
+# Helper functions shared by the sparse matrix typemaps
+sparse_fragment = """
+%fragment("InstantSparse", "header", fragment="NumPy_Fragments") {
+/* Return 1 if obj is a sparse matrix in the given format */
+static int instant_sparse_format(PyObject* obj, const char* format)
+{
+  PyObject* attr = PyObject_GetAttrString(obj, "format");
+  int match;
+  if (!attr) {
+    PyErr_Clear();
+    return 0;
+  }
+%#if PY_MAJOR_VERSION >= 3
+  match = PyUnicode_Check(attr) && PyUnicode_CompareWithASCIIString(attr, format) == 0;
+%#else
+  match = PyString_Check(attr) && strcmp(PyString_AsString(attr), format) == 0;
+%#endif
+  Py_DECREF(attr);
+  return match;
+}
+
+/* Return a new reference to the 1D array attribute name of obj, converted
+   to typecode if readonly, otherwise required to be writeable and of
+   exactly that type */
+static PyArrayObject* instant_sparse_array(PyObject* obj, const char* name,
+                                           int typecode, int readonly)
+{
+  PyObject* attr = PyObject_GetAttrString(obj, name);
+  PyArrayObject* ary = NULL;
+  if (!attr) return NULL;
+  if (readonly)
+    ary = (PyArrayObject*) PyArray_FROMANY(attr, typecode, 1, 1, NPY_ARRAY_CARRAY_RO);
+  else if (is_array(attr) && PyArray_TYPE((PyArrayObject*) attr) == typecode
+           && PyArray_NDIM((PyArrayObject*) attr) == 1
+           && PyArray_ISCARRAY((PyArrayObject*) attr)
+           && PyArray_ISNOTSWAPPED((PyArrayObject*) attr)) {
+    Py_INCREF(attr);
+    ary = (PyArrayObject*) attr;
+  }
+  else
+    PyErr_Format(PyExc_TypeError, "Sparse matrix %s must be a writeable contiguous array of type '%s'",
+                 name, typecode_string(typecode));
+  Py_DECREF(attr);
+  return ary;
+}
+
+/* Return a new 1D array owning data through a PyCapsule, or an empty
+   array if n is zero. The data is deallocated if this fails. */
+static PyObject* instant_owned_array(void* data, npy_intp n, int typecode,
+                                     void (*destructor)(PyObject*),
+                                     void (*dealloc)(void*))
+{
+  PyObject* capsule;
+  PyObject* obj;
+  if (!data) {
+    if (n) {
+      PyErr_SetString(PyExc_ValueError, "NULL data returned for a non-empty array");
+      return NULL;
+    }
+    return PyArray_SimpleNew(1, &n, typecode);
+  }
+  capsule = PyCapsule_New(data, NULL, destructor);
+  if (!capsule) {
+    dealloc(data);
+    return NULL;
+  }
+  obj = PyArray_SimpleNewFromData(1, &n, typecode, data);
+  if (!obj) {
+    Py_DECREF(capsule);
+    return NULL;
+  }
+  if (PyArray_SetBaseObject((PyArrayObject*) obj, capsule) < 0) {
+    Py_DECREF(obj);
+    return NULL;
+  }
+  return obj;
+}
+
+/* Return a new scipy.sparse matrix in the given format, made from the
+   arrays without copying. The references to the arrays are stolen. */
+static PyObject* instant_sparse_matrix(const char* format, PyObject* data,
+                                       PyObject* indices, PyObject* indptr,
+                                       npy_intp m, npy_intp n)
+{
+  PyObject* module = NULL;
+  PyObject* matrix = NULL;
+  if (data && indices && indptr)
+    module = PyImport_ImportModule("scipy.sparse");
+  if (module) {
+    char name[16];
+    sprintf(name, "%s_matrix", format);
+    matrix = PyObject_CallMethod(module, name, "((OOO)(nn))", data, indices, indptr,
+                                 (Py_ssize_t) m, (Py_ssize_t) n);
+    Py_DECREF(module);
+  }
+  Py_XDECREF(data);
+  Py_XDECREF(indices);
+  Py_XDECREF(indptr);
+  return matrix;
+}
+}
+"""
+
+def sparse_typemap(names, format, dtype, itype, readonly):
+    """Return a typemap passing a scipy.sparse matrix in CSR or CSC format
+    to C without copying.
+
+    names holds the names of the number of rows and columns, the index
+    pointer array, the index array and the data array. The index arrays
+    are of type itype. If readonly is True, arrays of other types are
+    converted, otherwise the arrays must be writeable and of the right
+    types."""
+    m, n, indptr, indices, data = names
+    params = "%s %s, %s %s, %s* %s, %s* %s, %s* %s" % (itype, m, itype, n, itype, indptr,
+                                                     itype, indices, dtype, data)
+    typecode = _numpy_typecodes[dtype]
+    indexcode = _index_typecodes[itype]
+    major = "$1" if format == "csr" else "$2"
+    readonly = int(readonly)
+    upper = format.upper()
+    return """
+%%typemap(in, fragment="InstantSparse") (%(params)s)
+  (PyArrayObject* sp_indptr=NULL, PyArrayObject* sp_indices=NULL, PyArrayObject* sp_data=NULL) {
+  Py_ssize_t rows, cols;
+  PyObject* shape;
+  if (!instant_sparse_format($input, "%(format)s")) {
+    PyErr_SetString(PyExc_TypeError, "Sparse matrix in %(upper)s format required");
+    SWIG_fail;
+  }
+  shape = PyObject_GetAttrString($input, "shape");
+  if (!shape) SWIG_fail;
+  if (!PyArg_ParseTuple(shape, "nn", &rows, &cols)) {
+    Py_DECREF(shape);
+    SWIG_fail;
+  }
+  Py_DECREF(shape);
+  $1 = (%(itype)s) rows;
+  $2 = (%(itype)s) cols;
+  sp_indptr = instant_sparse_array($input, "indptr", %(indexcode)s, %(readonly)d);
+  if (!sp_indptr) SWIG_fail;
+  sp_indices = instant_sparse_array($input, "indices", %(indexcode)s, %(readonly)d);
+  if (!sp_indices) SWIG_fail;
+  sp_data = instant_sparse_array($input, "data", %(typecode)s, %(readonly)d);
+  if (!sp_data) SWIG_fail;
+  $3 = (%(itype)s*) PyArray_DATA(sp_indptr);
+  $4 = (%(itype)s*) PyArray_DATA(sp_indices);
+  $5 = (%(dtype)s*) PyArray_DATA(sp_data);
+  if (PyArray_DIM(sp_indptr, 0) != %(major)s + 1
+      || PyArray_DIM(sp_indices, 0) < $3[%(major)s] || PyArray_DIM(sp_data, 0) < $3[%(major)s]) {
+    PyErr_SetString(PyExc_ValueError, "Sparse matrix arrays have inconsistent lengths");
+    SWIG_fail;
+  }
+}
+%%typemap(freearg) (%(params)s) {
+  Py_XDECREF(sp_indptr$argnum);
+  Py_XDECREF(sp_indices$argnum);
+  Py_XDECREF(sp_data$argnum);
+}
+""" % locals()
+
+def owned_sparse_typemap(names, format, dtype, itype, dealloc):
+    """Return a typemap returning a scipy.sparse matrix in CSR or CSC format
+    made from arrays allocated by the wrapped function, without copying.
+
+    The function gets pointers to the number of rows and columns and to
+    the index pointer, index and data pointers, which it sets. The arrays
+    own the memory and call the deallocator dealloc(void*) when they are
+    garbage collected."""
+    m, n, indptr, indices, data = names
+    params = "%s* %s, %s* %s, %s** %s, %s** %s, %s** %s" % (itype, m, itype, n, itype, indptr,
+                                                          itype, indices, dtype, data)
+    typecode = _numpy_typecodes[dtype]
+    indexcode = _index_typecodes[itype]
+    major = "*$1" if format == "csr" else "*$2"
+    destructor = capsule_destructor_name(dealloc)
+    return """
+%%typemap(in, numinputs=0) (%(params)s)
+  (%(itype)s rows_temp=0, %(itype)s cols_temp=0, %(itype)s* indptr_temp=NULL,
+   %(itype)s* indices_temp=NULL, %(dtype)s* data_temp=NULL) {
+  $1 = &rows_temp;
+  $2 = &cols_temp;
+  $3 = &indptr_temp;
+  $4 = &indices_temp;
+  $5 = &data_temp;
+}
+%%typemap(argout, fragment="InstantSparse") (%(params)s) {
+  npy_intp nnz = *$3 ? (npy_intp) (*$3)[%(major)s] : 0;
+  PyObject* indptr = instant_owned_array((void*) *$3, (npy_intp) %(major)s + 1, %(indexcode)s,
+                                         %(destructor)s, %(dealloc)s);
+  PyObject* indices = instant_owned_array((void*) *$4, nnz, %(indexcode)s,
+                                          %(destructor)s, %(dealloc)s);
+  PyObject* data = instant_owned_array((void*) *$5, nnz, %(typecode)s,
+                                       %(destructor)s, %(dealloc)s);
+  PyObject* matrix = instant_sparse_matrix("%(format)s", data, indices, indptr, *$1, *$2);
+  if (!matrix) SWIG_fail;
+  $result = SWIG_Python_AppendOutput($result, matrix);
+}
+""" % locals()
+
+def struct_fields(code, name):
+    """Return the names of the data members of the struct name defined in
+    code, or None if no definition is found. Only plain C structs are
+    understood."""
+    code = remove_comments(code)
+    match = (re.search(r"struct\s+%s\s*\{(.*?)\}" % re.escape(name), code, re.S) or
+             re.search(r"typedef\s+struct\s*\w*\s*\{(.*?)\}\s*%s\s*;" % re.escape(name),
+                       code, re.S))
+    if not match:
+        return None
+    fields = []
+    for declaration in match.group(1).split(";"):
+        declaration = re.sub(r"\[.*?\]", "", declaration)
+        for declarator in declaration.split(","):
+            words = re.findall(r"\w+", declarator)
+            if words:
+                fields.append(words[-1])
+    return fields
+
+# Helper function for checking record data types against C structs
+struct_fragment = """
+%fragment("InstantStruct", "header", fragment="NumPy_Fragments") {
+/* Return 1 if the record data type of ary has the size of the struct
+   name and the given fields at the same offsets and with the same sizes,
+   otherwise set an exception and return 0 */
+static int instant_check_struct(PyArrayObject* ary, const char* name, size_t size,
+                                int nfields, const char* const* fields,
+                                const size_t* offsets, const size_t* sizes)
+{
+  PyObject* descr_fields;
+  int i;
+  if ((size_t) PyArray_ITEMSIZE(ary) != size) {
+    PyErr_Format(PyExc_TypeError, "Record size %d does not match size %d of struct %s",
+                 (int) PyArray_ITEMSIZE(ary), (int) size, name);
+    return 0;
+  }
+  descr_fields = PyObject_GetAttrString((PyObject*) PyArray_DESCR(ary), "fields");
+  if (!descr_fields) return 0;
+  for (i=0; i<nfields; i++) {
+    PyObject* field = NULL;
+    PyObject* itemsize = NULL;
+    long offset = -1;
+    long fieldsize = -1;
+    if (descr_fields != Py_None)
+      field = PyMapping_GetItemString(descr_fields, (char*) fields[i]);
+    if (field && PyTuple_Check(field) && PyTuple_Size(field) >= 2) {
+      offset = PyLong_AsLong(PyTuple_GET_ITEM(field, 1));
+      itemsize = PyObject_GetAttrString(PyTuple_GET_ITEM(field, 0), "itemsize");
+      if (itemsize)
+        fieldsize = PyLong_AsLong(itemsize);
+    }
+    Py_XDECREF(itemsize);
+    Py_XDECREF(field);
+    PyErr_Clear();
+    if (offset != (long) offsets[i] || fieldsize != (long) sizes[i]) {
+      PyErr_Format(PyExc_TypeError, "Record field '%s' does not match struct %s, "
+                   "expected offset %d and size %d", fields[i], name,
+                   (int) offsets[i], (int) sizes[i]);
+      Py_DECREF(descr_fields);
+      return 0;
+    }
+  }
+  Py_DECREF(descr_fields);
+  return 1;
+}
+}
+"""
+
+def struct_typemap(dims, array, struct, fields, itype, readonly):
+    """Return a typemap passing a NumPy array with a record data type to C
+    as a pointer to struct, without copying.
+
+    The record size and the offsets and sizes of the given fields are
+    checked against the struct. The check is only repeated when an array
+    with a different data type object is passed. If readonly is False, the
+    array must be writeable."""
+    nd = len(dims)
+    params = ", ".join(["%s %s" % (itype, n) for n in dims] + ["%s* %s" % (struct, array)])
+    writeable = "" if readonly else " || !PyArray_ISWRITEABLE(ary)"
+    nfields = len(fields)
+    if fields:
+        names = ", ".join('"%s"' % f for f in fields)
+        offsets = ", ".join("offsetof(%s, %s)" % (struct, f) for f in fields)
+        sizes = ", ".join("sizeof(((%s*) 0)->%s)" % (struct, f) for f in fields)
+        layout = reindent("""
+            static const char* fields[] = { %(names)s };
+            static const size_t offsets[] = { %(offsets)s };
+            static const size_t sizes[] = { %(sizes)s };
+            """ % locals())
+        arguments = "fields, offsets, sizes"
+    else:
+        layout = ""
+        arguments = "NULL, NULL, NULL"
+    layout = "\n".join("    " + line for line in layout.strip().split("\n") if line)
+    shape = "\n".join("  $%d = (%s) PyArray_DIM(ary, %d);" % (i + 1, itype, i) for i in range(nd))
+    return """
+%%typemap(in, fragment="InstantStruct") (%(params)s) (PyArrayObject* ary=NULL) {
+  static PyObject* checked_descr = NULL;
+  ary = obj_to_array_no_conversion($input, NPY_VOID);
+  if (!ary || !require_dimensions(ary, %(nd)d) || !require_contiguous(ary)) SWIG_fail;
+  if (!PyArray_ISALIGNED(ary)%(writeable)s) {
+    PyErr_SetString(PyExc_TypeError, "Record array must be aligned and writeable");
+    SWIG_fail;
+  }
+  if ((PyObject*) PyArray_DESCR(ary) != checked_descr) {
+%(layout)s
+    if (!instant_check_struct(ary, "%(struct)s", sizeof(%(struct)s), %(nfields)d, %(arguments)s))
+      SWIG_fail;
+    Py_XDECREF(checked_descr);
+    checked_descr = (PyObject*) PyArray_DESCR(ary);
+    Py_INCREF(checked_descr);
+  }
+%(shape)s
+  $%(last)d = (%(struct)s*) PyArray_DATA(ary);
+}
+""" % dict(locals(), last=nd + 1)
+
+def capsule_destructor_name(dealloc):
+    return "instant_capsule_" + re.sub(r"\W", "_", dealloc)
+
+def capsule_destructor(dealloc):
+    "Return C code for a PyCapsule destructor calling dealloc(void*)."
+    destructor = capsule_destructor_name(dealloc)
+    return reindent("""
+        %%{
+        static void %(destructor)s(PyObject* capsule)
+        {
+          %(dealloc)s(PyCapsule_GetPointer(capsule, NULL));
+        }
+        %%}
+        """ % locals())
+
+# Buffer format characters of the kinds matching each data type,
+# complex types are prefixed by 'Z'
+_buffer_formats = {'float': 'fd', 'double': 'fd', 'short': 'hilq', 'int': 'hilq',
+                   'long': 'hilq', 'long long': 'hilq', 'unsigned short': 'HILQ',
+                   'unsigned int': 'HILQ', 'unsigned long': 'HILQ',
+                   'unsigned long long': 'HILQ', 'std::complex<float>': 'Zfd',
+                   'std::complex<double>': 'Zfd'}
+
+def buffer_typemap(dims, array, dtype, itype, readonly):
+    """Return a typemap passing any object exporting the buffer protocol
+    to C without copying, together with its shape.
+
+    The buffer is held until the call returns. Untyped byte buffers,
+    like bytearray and mmap objects, are only accepted for 1D arrays and
+    reinterpreted as arrays of dtype. If readonly is False, the buffer
+    must be writeable."""
+    nd = len(dims)
+    params = ", ".join(["%s %s" % (itype, n) for n in dims] + ["%s* %s" % (dtype, array)])
+    flags = "PyBUF_C_CONTIGUOUS | PyBUF_FORMAT"
+    if not readonly:
+        flags += " | PyBUF_WRITABLE"
+    kinds = _buffer_formats[dtype]
+    is_complex = int(kinds.startswith("Z"))
+    kinds = kinds.lstrip("Z")
+    shape = "\n".join("  $%d = (%s) view.shape[%d];" % (i + 1, itype, i)
+                       for i in range(nd))
+    return """
+%%typemap(in) (%(params)s) (Py_buffer view, int have_view=0) {
+  if (PyObject_GetBuffer($input, &view, %(flags)s) < 0) SWIG_fail;
+  have_view = 1;
+  const char* format = view.format ? view.format : "B";
+  if (format[0] == '@' || format[0] == '=') format++;
+  bool raw = !strcmp(format, "B") || !strcmp(format, "b") || !strcmp(format, "c");
+  if (raw && %(nd)d == 1) {
+    if (view.len %% sizeof(%(dtype)s)) {
+      PyErr_SetString(PyExc_ValueError, "Buffer size must be a multiple of the item size");
+      SWIG_fail;
+    }
+    $1 = (%(itype)s) (view.len / sizeof(%(dtype)s));
+  }
+  else {
+    if (%(is_complex)d) {
+      if (format[0] != 'Z') format = "";
+      else format++;
+    }
+    if (strlen(format) != 1 || !strchr("%(kinds)s", format[0])
+        || view.itemsize != sizeof(%(dtype)s)) {
+      PyErr_Format(PyExc_TypeError, "Buffer of type '%(dtype)s' required, buffer with format '%%s' given",
+                   view.format ? view.format : "B");
+      SWIG_fail;
+    }
+    if (view.ndim != %(nd)d) {
+      PyErr_Format(PyExc_TypeError, "Buffer must have %(nd)d dimensions, given buffer has %%d dimensions",
+                   view.ndim);
+      SWIG_fail;
+    }
+%(shape)s
+  }
+  $%(last)d = (%(dtype)s*) view.buf;
+}
+%%typemap(freearg) (%(params)s) {
+  if (have_view$argnum) PyBuffer_Release(&view$argnum);
+}
+""" % dict(locals(), last=nd + 1)
+
+# Words that may end a parameter type, i.e. are not parameter names
+_c_type_words = set(['void', 'bool', 'char', 'short', 'int', 'long', 'float', 'double',
+                     'signed', 'unsigned', 'const', 'volatile'])
+
+def remove_comments(code):
+    "Return code with C and C++ comments removed."
+    return re.sub(r"//[^\n]*|/\*.*?\*/", "", code, flags=re.S)
+
+def parameter_type(parameter):
+    """Return the type of a C function parameter without its name, in the
+    form used in scipy.LowLevelCallable signatures, e.g. 'double *'."""
+    parameter = parameter.split("=")[0]
+    stars = parameter.count("*") + parameter.count("[")
+    words = re.findall(r"\w+", parameter)
+    if len(words) > 1 and words[-1] not in _c_type_words:
+        words = words[:-1]
+    return " ".join(words) + (" " + "*"*stars if stars else "")
+
+def c_signature(return_type, parameters):
+    """Return the signature string 'return_type (type1, type2, ...)' of a
+    C function with the given return type and comma separated parameters."""
+    parameters = [parameter_type(p) for p in parameters.split(",") if p.strip()]
+    if parameters == ["void"]:
+        parameters = []
+    # Add a dummy name, so a type like 'struct T' is not taken for a name
+    return "%s (%s)" % (parameter_type(return_type + " _"), ", ".join(parameters))
+
+def find_function_signature(code, name):
+    "Return the signature string of the function name defined in code."
+    match = re.search(r"([\w\s\*&]+?)\b%s\s*\(([^()]*)\)\s*\{" % re.escape(name),
+                      remove_comments(code))
+    instant_assert(match, "Definition of function '%s' not found" % name)
+    return_type = re.sub(r"\b(static|inline|extern)\b", "", match.group(1))
+    return c_signature(return_type, match.group(2))
+
+def function_pointer_code(names, code):
+    """Return SWIG code for functions returning PyCapsules with pointers to
+    the functions names in code, named by their signatures."""
+    wrappers = []
+    for name in names:
+        signature = find_function_signature(code, name)
+        wrappers.append(reindent("""
+            %%inline %%{
+            PyObject* _instant_function_pointer_%(name)s()
+            {
+              return PyCapsule_New((void*) &%(name)s, "%(signature)s", NULL);
+            }
+            %%}
+            """ % locals()))
+    return "\n".join(wrappers)
+
+def function_pointer_typemaps(code):
+    """Return typemaps for the function pointer parameters in code, accepting
+    PyCapsules or scipy.LowLevelCallable objects with matching signatures."""
+    pattern = r"([\w\s\*&]+?)\(\s*\*\s*\w*\s*\)\s*\(([^()]*)\)"
+    typemaps = []
+    for return_type, parameters in re.findall(pattern, remove_comments(code)):
+        return_type = " ".join(re.findall(r"\w+|\*", return_type.split(",")[-1].split("(")[-1]))
+        return_type = re.sub(r"\b(static|inline|extern|typedef)\b", "", return_type).strip()
+        signature = c_signature(return_type, parameters)
+        pointer_type = signature.replace(" (", " (*)(", 1)
+        typemap = reindent("""
+            %%typemap(in) %(pointer_type)s {
+              PyObject* capsule = $input;
+              if (PyTuple_Check(capsule) && PyTuple_Size(capsule) > 0)
+                capsule = PyTuple_GET_ITEM(capsule, 0);
+              if (!PyCapsule_IsValid(capsule, "%(signature)s")) {
+                PyErr_SetString(PyExc_TypeError, "Function pointer with signature '%(signature)s' required");
+                SWIG_fail;
+              }
+              $1 = (%(pointer_type)s) PyCapsule_GetPointer(capsule, "%(signature)s");
+            }
+            """ % locals())
+        if typemap not in typemaps:
+            typemaps.append(typemap)
+    return "".join(typemaps)
+
 def write_interfacefile(filename, modulename, code, init_code,
                         additional_definitions, additional_declarations,
-                        system_headers, local_headers, wrap_headers, arrays):
+                        system_headers, local_headers, wrap_headers, arrays,
+                        generic_types=[], function_pointers=[], openmp=False):
     """Generate a SWIG interface file. Intended for internal library use.
 
     The input arguments are as follows:
@@ -77,6 +1090,10 @@ def write_interfacefile(filename, modulename, code, init_code,
       - local_headers (A list of local headers with declarations needed by the wrapped code)
       - wrap_headers (A list of local headers that will be included in the code and wrapped by SWIG)
       - arrays (A nested list, the inner lists describing the different arrays)
+      - generic_types (A list of data types to instantiate the function
+        templates in code and the arrays marked 'generic' with)
+      - function_pointers (A list of functions in code to export pointers to)
+      - openmp (A bool indicating if the code uses OpenMP)
 
     The result of this function is that a SWIG interface with
     the name modulename.i is written to the current directory.
@@ -87,89 +1104,204 @@ def write_interfacefile(filename, modulename, code, init_code,
     typemaps = ""
     valid_types = ['float', 'double', 'short', 'int', 'long', 'long long',
                    'unsigned short', 'unsigned int', 'unsigned long',
-                   'unsigned long long']
-    for a in arrays:
-        if isinstance(a, tuple):
-            a = list(a)
+                   'unsigned long long', 'std::complex<float>',
+                   'std::complex<double>']
+    valid_dim_types = ['npy_intp', 'int64_t']
+    # numpy.i instantiates its typemaps for the real types with int dimensions
+    instantiated = set((t, 'int') for t in valid_types if 'complex' not in t)
+    deallocators = []
+    use_sparse = False
+    use_struct = False
+
+    # Split the arrays into names and flags, and expand generic arrays to
+    # one array for each generic type
+    for t in generic_types:
+        instant_assert(t in valid_types, "Invalid generic type '%s'" % t)
+    functions = defined_functions(code)
+    arrays = [split_array_spec(a, valid_types + valid_dim_types, functions) for a in arrays]
+    specs = [(names, 'generic' in flags, 'owned' in flags) for names, flags in arrays]
+    expanded = []
+    for names, flags in arrays:
+        if 'generic' in flags:
+            instant_assert(generic_types, "Generic array given without generic types")
+            for t in generic_types:
+                expanded.append((names, [t if i == 'generic' else i for i in flags]))
+        else:
+            expanded.append((names, flags))
+    arrays = expanded
+    use_complex = any('complex' in t for names, flags in arrays for t in flags)
+    generic_functions = find_template_functions(code) if generic_types else []
+    instant_assert(generic_functions or not generic_types,
+                   "Generic types given, but no function templates found in code")
+    # Dispatch on the generic arrays, or the first array if the function is not found
+    dispatch_positions = {}
+    for f in generic_functions:
+        parameters = function_parameters(code, f)
+        positions = generic_positions(parameters, specs) if parameters is not None else []
+        if positions:
+            dispatch_positions[f] = positions
+
+    for names, flags in arrays:
         DATA_TYPE = 'double'
         for vt in valid_types:
-            if vt in a:
+            if vt in flags:
                 DATA_TYPE = vt
-                a.remove(vt)
-        if 'in' in a:
+        DIM_TYPE = 'int'
+        for it in valid_dim_types:
+            if it in flags:
+                DIM_TYPE = it
+        if (DATA_TYPE, DIM_TYPE) not in instantiated:
+            instantiated.add((DATA_TYPE, DIM_TYPE))
+            typemaps += reindent("""
+            %%numpy_typemaps(%(dtype)s, %(typecode)s, %(itype)s)
+            """ % { 'dtype' : DATA_TYPE, 'typecode' : _numpy_typecodes[DATA_TYPE],
+                    'itype' : DIM_TYPE })
+        if 'trusted' in flags:
+            # arrays known to be correct, passed with minimal overhead
+            multi = 'multi' in flags
+            instant_assert(len(names) == 3 if multi else len(names) > 1 and len(names) < 5,
+                           "Wrong number of elements in trusted array")
+            typemaps += trusted_typemap(names[:-1], names[-1], DATA_TYPE, DIM_TYPE, multi)
+        elif 'ragged' in flags:
+            # lists of arrays with different lengths
+            readonly = 'in' in flags
+            instant_assert(len(names) == 3, "Wrong number of elements in ragged array")
+            typemaps += ragged_typemap(names[0], names[1], names[2], DATA_TYPE, DIM_TYPE,
+                                       readonly)
+        elif [i for i in flags if i.startswith('struct=')]:
+            # record arrays passed as pointers to C structs
+            spec = [i for i in flags if i.startswith('struct=')][0]
+            struct = spec.split('=', 1)[1].strip()
+            readonly = 'in' in flags
+            instant_assert(len(names) > 1 and len(names) < 5,
+                           "Wrong number of elements in struct array")
+            fields = struct_fields("\n".join([code, additional_definitions,
+                                              additional_declarations]), struct)
+            if fields is None:
+                instant_warning("Definition of struct %s not found, only its size is checked"
+                                % struct)
+                fields = []
+            if not use_struct:
+                use_struct = True
+                typemaps += struct_fragment
+            typemaps += struct_typemap(names[:-1], names[-1], struct, fields, DIM_TYPE, readonly)
+        elif 'csr' in flags or 'csc' in flags:
+            # scipy.sparse matrices in compressed row or column format
+            format = 'csr' if 'csr' in flags else 'csc'
+            instant_assert(DIM_TYPE in _index_typecodes, "Sparse matrix indices must be of type "
+                           "%s" % ", ".join(sorted(_index_typecodes)))
+            if not use_sparse:
+                use_sparse = True
+                typemaps += sparse_fragment
+            if 'owned' in flags:
+                dealloc = 'free'
+                for i in [i for i in flags if i.startswith('dealloc=')]:
+                    dealloc = i.split('=', 1)[1].strip()
+                instant_assert(len(names) == 5, "Wrong number of elements in sparse matrix")
+                if dealloc not in deallocators:
+                    deallocators.append(dealloc)
+                    typemaps += capsule_destructor(dealloc)
+                typemaps += owned_sparse_typemap(names, format, DATA_TYPE, DIM_TYPE, dealloc)
+            else:
+                readonly = 'in' in flags
+                instant_assert(len(names) == 5, "Wrong number of elements in sparse matrix")
+                typemaps += sparse_typemap(names, format, DATA_TYPE, DIM_TYPE, readonly)
+        elif 'strided' in flags:
+            # arrays passed with strides, i.e. views and transposes
+            readonly = 'in' in flags
+            instant_assert(len(names) in (3, 5, 7), "Wrong number of elements in strided array")
+            nd = len(names)//2
+            typemaps += strided_typemap(names[:nd], names[nd:2*nd], names[-1], DATA_TYPE,
+                                        DIM_TYPE, readonly)
+        elif 'owned' in flags:
+            # arrays allocated by the wrapped function, i.e. of unknown size
+            dealloc = 'free'
+            for i in [i for i in flags if i.startswith('dealloc=')]:
+                dealloc = i.split('=', 1)[1].strip()
+            instant_assert(len(names) > 1 and len(names) < 5,
+                           "Wrong number of elements in owned array")
+            if dealloc not in deallocators:
+                deallocators.append(dealloc)
+                typemaps += capsule_destructor(dealloc)
+            typemaps += owned_typemap(names[:-1], names[-1], DATA_TYPE, DIM_TYPE, dealloc)
+        elif 'buffer' in flags:
+            # objects exporting the buffer protocol, e.g. memory maps
+            readonly = 'in' in flags
+            instant_assert(len(names) > 1 and len(names) < 5,
+                           "Wrong number of elements in buffer array")
+            typemaps += buffer_typemap(names[:-1], names[-1], DATA_TYPE, DIM_TYPE, readonly)
+        elif 'fortran' in flags:
+            # Fortran ordered arrays
+            readonly = 'in' in flags
+            instant_assert(len(names) > 2 and len(names) < 5,
+                           "Wrong number of elements in Fortran array")
+            typemaps += fortran_typemap(names[:-1], names[-1], DATA_TYPE, DIM_TYPE, readonly)
+        elif 'in' in flags:
             # input arrays
-            a.remove('in')
-            instant_assert(len(a) > 1 and len(a) < 5, "Wrong number of elements in input array")
-            if len(a) == 2:
+            multi = 'multi' in flags
+            instant_assert(len(names) > 1 and len(names) < 5,
+                           "Wrong number of elements in input array")
+            if multi:
+                # n-dimensional arrays, i.e. tensors > 3-dimensional
+                instant_assert(len(names) > 2, "Wrong number of elements in multi array")
+                typemaps += multi_typemap(names, DATA_TYPE, DIM_TYPE, True)
+            elif len(names) == 2:
                 # 1-dimensional arrays, i.e. vectors
                 typemaps += reindent("""
-                %%apply (int DIM1, %(dtype)s* IN_ARRAY1) {(int %(n1)s, %(dtype)s* %(array)s)};
-                """ % { 'n1' : a[0], 'array' : a[1], 'dtype' : DATA_TYPE })
-            elif len(a) == 3:
+                %%apply (%(itype)s DIM1, %(dtype)s* IN_ARRAY1) {(%(itype)s %(n1)s, %(dtype)s* %(array)s)};
+                """ % { 'n1' : names[0], 'array' : names[1], 'dtype' : DATA_TYPE, 'itype' : DIM_TYPE })
+            elif len(names) == 3:
                 # 2-dimensional arrays, i.e. matrices
                 typemaps += reindent("""
-                %%apply (int DIM1, int DIM2, %(dtype)s* IN_ARRAY2) {(int %(n1)s, int %(n2)s, %(dtype)s* %(array)s)};
-                """ % { 'n1' : a[0], 'n2' : a[1], 'array' : a[2], 'dtype' : DATA_TYPE })
+                %%apply (%(itype)s DIM1, %(itype)s DIM2, %(dtype)s* IN_ARRAY2) {(%(itype)s %(n1)s, %(itype)s %(n2)s, %(dtype)s* %(array)s)};
+                """ % { 'n1' : names[0], 'n2' : names[1], 'array' : names[2], 'dtype' : DATA_TYPE, 'itype' : DIM_TYPE })
             else:
                 # 3-dimensional arrays, i.e. tensors
                 typemaps += reindent("""
-                %%apply (int DIM1, int DIM2, int DIM3, %(dtype)s* IN_ARRAY3) {(int %(n1)s, int %(n2)s, int %(n3)s, %(dtype)s* %(array)s)};
-                """ % { 'n1' : a[0], 'n2' : a[1], 'n3' : a[2], 'array' : a[3], 'dtype' : DATA_TYPE })
-        elif 'out' in a:
+                %%apply (%(itype)s DIM1, %(itype)s DIM2, %(itype)s DIM3, %(dtype)s* IN_ARRAY3) {(%(itype)s %(n1)s, %(itype)s %(n2)s, %(itype)s %(n3)s, %(dtype)s* %(array)s)};
+                """ % { 'n1' : names[0], 'n2' : names[1], 'n3' : names[2], 'array' : names[3], 'dtype' : DATA_TYPE, 'itype' : DIM_TYPE })
+        elif 'out' in flags:
             # output arrays
-            a.remove('out')
-            instant_assert(len(a) == 2, "Output array must be 1-dimensional")
-            # 1-dimensional arrays, i.e. vectors
-            typemaps += reindent("""
-            %%apply (int DIM1, %(dtype)s* ARGOUT_ARRAY1) {(int %(n1)s, %(dtype)s* %(array)s)};
-            """ % { 'n1' : a[0], 'array' : a[1], 'dtype' : DATA_TYPE })
+            multi = 'multi' in flags
+            if multi:
+                instant_assert(len(names) == 3, "Wrong number of elements in output array")
+            else:
+                instant_assert(len(names) > 1 and len(names) < 5,
+                               "Wrong number of elements in output array")
+            typemaps += output_typemap(names[:-1], names[-1], DATA_TYPE, DIM_TYPE, multi)
         else:
             # in-place arrays
-            instant_assert(len(a) > 1 and len(a) < 5, "Wrong number of elements in output array")
-            if 'multi' in a:
+            multi = 'multi' in flags
+            instant_assert(len(names) > 1 and len(names) < 5,
+                           "Wrong number of elements in output array")
+            if multi:
                 # n-dimensional arrays, i.e. tensors > 3-dimensional
-                a.remove('multi')
-                typemaps += reindent("""
-                %%typemap(in) (int %(n)s,int* %(ptv)s,%(dtype)s* %(array)s){
-                  if (!PyArray_Check($input)) {
-                    PyErr_SetString(PyExc_TypeError, "Not a NumPy array");
-                    return NULL; ;
-                  }
-                  PyArrayObject* pyarray;
-                  pyarray = (PyArrayObject*)$input;
-                  $1 = int(pyarray->nd);
-                  int* dims = new int[$1];
-                  for (int d=0; d<$1; d++) {
-                     dims[d] = int(pyarray->dimensions[d]);
-                  }
-
-                  $2 = dims;
-                  $3 = (%(dtype)s*)pyarray->data;
-                }
-                %%typemap(freearg) (int %(n)s,int* %(ptv)s,%(dtype)s* %(array)s){
-                    // deleting dims
-                    delete $2;
-                }
-                """ % { 'n' : a[0] , 'ptv' : a[1], 'array' : a[2], 'dtype' : DATA_TYPE })
-            elif len(a) == 2:
+                instant_assert(len(names) > 2, "Wrong number of elements in multi array")
+                typemaps += multi_typemap(names, DATA_TYPE, DIM_TYPE, False)
+            elif len(names) == 2:
                 # 1-dimensional arrays, i.e. vectors
                 typemaps += reindent("""
-                %%apply (int DIM1, %(dtype)s* INPLACE_ARRAY1) {(int %(n1)s, %(dtype)s* %(array)s)};
-                """ % { 'n1' : a[0], 'array' : a[1], 'dtype' : DATA_TYPE })
-            elif len(a) == 3:
+                %%apply (%(itype)s DIM1, %(dtype)s* INPLACE_ARRAY1) {(%(itype)s %(n1)s, %(dtype)s* %(array)s)};
+                """ % { 'n1' : names[0], 'array' : names[1], 'dtype' : DATA_TYPE, 'itype' : DIM_TYPE })
+            elif len(names) == 3:
                 # 2-dimensional arrays, i.e. matrices
                 typemaps += reindent("""
-                %%apply (int DIM1, int DIM2, %(dtype)s* INPLACE_ARRAY2) {(int %(n1)s, int %(n2)s, %(dtype)s* %(array)s)};
-                """ % { 'n1' : a[0], 'n2' : a[1], 'array' : a[2], 'dtype' : DATA_TYPE })
+                %%apply (%(itype)s DIM1, %(itype)s DIM2, %(dtype)s* INPLACE_ARRAY2) {(%(itype)s %(n1)s, %(itype)s %(n2)s, %(dtype)s* %(array)s)};
+                """ % { 'n1' : names[0], 'n2' : names[1], 'array' : names[2], 'dtype' : DATA_TYPE, 'itype' : DIM_TYPE })
             else:
                 # 3-dimensional arrays, i.e. tensors
                 typemaps += reindent("""
-                %%apply (int DIM1, int DIM2, int DIM3, %(dtype)s* INPLACE_ARRAY3) {(int %(n1)s, int %(n2)s, int %(n3)s, %(dtype)s* %(array)s)};
-                """ % { 'n1' : a[0], 'n2' : a[1], 'n3' : a[2], 'array' : a[3], 'dtype' : DATA_TYPE})
+                %%apply (%(itype)s DIM1, %(itype)s DIM2, %(itype)s DIM3, %(dtype)s* INPLACE_ARRAY3) {(%(itype)s %(n1)s, %(itype)s %(n2)s, %(itype)s %(n3)s, %(dtype)s* %(array)s)};
+                """ % { 'n1' : names[0], 'n2' : names[1], 'n3' : names[2], 'array' : names[3], 'dtype' : DATA_TYPE, 'itype' : DIM_TYPE })
             # end
         # end if
     # end for
 
+    if use_complex:
+        system_headers = system_headers + ['complex']
+    if openmp and 'omp.h' not in system_headers:
+        system_headers = system_headers + ['omp.h']
+
     system_headers_code = mapstrings('#include <%s>', system_headers)
     local_headers_code  = mapstrings('#include "%s"', local_headers)
     wrap_headers_code1  = mapstrings('#include "%s"', wrap_headers)
@@ -178,6 +1310,26 @@ def write_interfacefile(filename, modulename, code, init_code,
     numpy_i_include = ''
     if arrays:
         numpy_i_include = r'%include "numpy.i"'
+    if use_complex:
+        numpy_i_include = '%include "std_complex.i"\n' + numpy_i_include
+
+    generic_wrappers = generic_code(generic_functions, generic_types, dispatch_positions)
+    function_pointers_code = function_pointer_code(function_pointers, code)
+    openmp_wrappers = ""
+    if openmp:
+        openmp_wrappers = reindent("""
+            %inline %{
+            void set_num_threads(int n)
+            {
+              omp_set_num_threads(n);
+            }
+            int get_num_threads()
+            {
+              return omp_get_max_threads();
+            }
+            %}
+            """)
+    typemaps += function_pointer_typemaps(code)
 
     # Do not reindent as SWIG interface code can also include Python code.
     interface_string = """%%module  %(modulename)s
@@ -206,6 +1358,9 @@ def write_interfacefile(filename, modulename, code, init_code,
 %(wrap_headers_code2)s
 //%(typemaps)s
 %(code)s;
+%(generic_wrappers)s
+%(function_pointers_code)s
+%(openmp_wrappers)s
 
 """ % locals()
 
@@ -31,6 +31,7 @@ _swig_binary_cache = None
 _swig_version_cache = None
 _pkg_config_installed = None
 _header_and_library_cache = {}
+_openmp_flags_cache = None
 
 def check_and_set_swig_binary(binary="swig", path=""):
     """ Check if a particular swig binary is available"""
@@ -111,6 +112,31 @@ def check_swig_version(version, same=False):
     
     return swig_enough
 
+def get_openmp_flags():
+    """Return the compiler and linker flags enabling OpenMP for the C++
+    compiler used to build modules, as two lists."""
+    global _openmp_flags_cache
+    if _openmp_flags_cache is None:
+        import sysconfig
+        compiler = os.environ.get("CXX") or sysconfig.get_config_var("CXX") or "c++"
+        try:
+            result, output = get_status_output("%s --version" % compiler.split()[0])
+        except OSError:
+            result, output = 1, ""
+        if result != 0:
+            # The compiler could not be asked, so assume GCC-like flags
+            output = ""
+        if "Intel" in output:
+            flags = ["-qopenmp"], ["-qopenmp"]
+        elif "Apple" in output and "clang" in output:
+            # Apple clang needs the OpenMP runtime to be linked explicitly
+            flags = ["-Xpreprocessor", "-fopenmp"], ["-lomp"]
+        else:
+            # GCC and LLVM clang
+            flags = ["-fopenmp"], ["-fopenmp"]
+        _openmp_flags_cache = flags
+    return _openmp_flags_cache
+
 def header_and_libs_from_pkgconfig(*packages, **kwargs):
     """This function returns list of include files, flags,
     libraries and library directories obtain from a pkgconfig file.
@@ -0,0 +1,489 @@
+"""Compilation of elementwise array expressions, like C{sin(x) + a*y},
+sequences of them and reductions of them, to C loops making a single pass
+over the arrays."""
+
+# This file is part of Instant.
+#
+# Instant is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Instant is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Instant. If not, see <http://www.gnu.org/licenses/>.
+#
+# Alternatively, Instant may be distributed under the terms of the BSD license.
+
+import re, math, operator
+from .output import instant_assert
+from .codegeneration import _numpy_typechars
+from .inlining import inline_module_with_numpy
+from .asynchronous import awaitable
+from .cache import memory_cached_object, place_object_in_memory_cache
+
+# Headers included for compiled expressions, defining their constants
+_expression_headers = ["cmath", "cfloat", "climits"]
+
+# C keywords and constants of the headers, which are not variables
+_expression_keywords = set("""
+bool char short int long float double signed unsigned const volatile void sizeof
+true false NULL NAN INFINITY HUGE_VAL HUGE_VALF HUGE_VALL
+FLT_MAX FLT_MIN FLT_EPSILON FLT_DIG FLT_MANT_DIG DBL_MAX DBL_MIN DBL_EPSILON DBL_DIG
+DBL_MANT_DIG LDBL_MAX LDBL_MIN LDBL_EPSILON CHAR_BIT CHAR_MAX CHAR_MIN SCHAR_MAX
+SCHAR_MIN UCHAR_MAX SHRT_MAX SHRT_MIN USHRT_MAX INT_MAX INT_MIN UINT_MAX LONG_MAX
+LONG_MIN ULONG_MAX LLONG_MAX LLONG_MIN ULLONG_MAX
+""".split())
+
+def expression_variables(expression):
+    """Return the names of the variables in a C expression in order of
+    first occurrence, i.e. the names that are not functions, C keywords
+    like float in casts, or constants like NAN, DBL_MAX or M_PI."""
+    names = []
+    for name, call in re.findall(r"\b([A-Za-z_]\w*)\b(\s*\()?", expression):
+        if (not call and not name.startswith("M_") and name not in _expression_keywords
+            and name not in names):
+            names.append(name)
+    return names
+
+def expression_types(expression, dtypes, scalars, caller):
+    """Return the variables, arrays and scalars of expression, and a dict
+    with the C type of each variable, given either as a dict or a single
+    type for all variables. caller is used in error messages."""
+    if isinstance(dtypes, str):
+        default_type, dtypes = dtypes, {}
+    else:
+        default_type, dtypes = "double", dict(dtypes)
+    variables = expression_variables(expression)
+    for v in variables:
+        dtypes.setdefault(v, default_type)
+    scalars = list(scalars)
+    arrays = [v for v in variables if v not in scalars]
+    instant_assert(arrays, "In instant.%s: Expression %r has no arrays."
+                   % (caller, expression))
+    for v in variables:
+        instant_assert(dtypes[v] in _numpy_typechars,
+                       "In instant.%s: Invalid type '%s' of %s." % (caller, dtypes[v], v))
+    return variables, arrays, scalars, dtypes
+
+def array_arguments(variables, scalars, numpy_types, args, flat=True):
+    """Return the arguments to a compiled expression function, with the
+    arrays converted to C contiguous arrays of the given NumPy types,
+    flattened if flat is True, and the common shape of the arrays."""
+    import numpy
+    instant_assert(len(args) == len(variables),
+                   "Expected %d arguments (%s), got %d." % (len(variables),
+                   ", ".join(variables), len(args)))
+    shape = None
+    values = []
+    for v, a in zip(variables, args):
+        if v in scalars:
+            values.append(a)
+            continue
+        a = numpy.ascontiguousarray(a, dtype=numpy_types[v])
+        if shape is None:
+            shape = a.shape
+        elif a.shape != shape:
+            raise ValueError("Array %s has shape %s, expected %s." % (v, a.shape, shape))
+        values.append(a.reshape(-1) if flat else a)
+    return values, shape
+
+def expression_parameters(variables, scalars, dtypes):
+    "Return the C function parameters for the variables of an expression."
+    parameters = []
+    for v in variables:
+        if v in scalars:
+            parameters.append("%s %s" % (dtypes[v], v))
+        else:
+            parameters.append("npy_intp instant_n_%s, %s* %s" % (v, dtypes[v], v))
+    return parameters
+
+def indexed_expression(expression, variables, scalars):
+    """Return expression with the arrays indexed by instant_i, checking
+    that it is a single C expression."""
+    instant_assert(not re.search(r"[;{}#]", expression),
+                   "Invalid expression %r." % expression)
+    arrays = [v for v in variables if v not in scalars]
+    return re.sub(r"\b(%s)\b(?!\s*\()" % "|".join(arrays), r"\1[instant_i]", expression)
+
+def expression_code(expression, variables, scalars, dtypes, result_type, openmp):
+    "Return C code for a function evaluating expression elementwise."
+    parameters = expression_parameters(variables, scalars, dtypes)
+    parameters.append("npy_intp instant_n, %s* instant_result" % result_type)
+    body = indexed_expression(expression, variables, scalars)
+    pragma = "#pragma omp parallel for" if openmp else ""
+    return """
+void evaluate(%s)
+{
+  %s
+  for (npy_intp instant_i=0; instant_i<instant_n; instant_i++)
+    instant_result[instant_i] = %s;
+}
+""" % (", ".join(parameters), pragma, body)
+
+def compile_expression(expression, dtypes="double", scalars=(), openmp=False, **kwargs):
+    """Compile an elementwise expression of arrays and scalars to a function
+    evaluating it in a single loop, without temporary arrays.
+
+    The expression is a C expression, e.g. C{'sin(x) + cos(y)*a'}, where the
+    functions from C{cmath} can be used. The variables are arrays of the
+    same shape, except those named in B{scalars}. B{dtypes} is either a C
+    type for all variables, or a dict mapping variable names to C types,
+    C{'double'} for the names not given. The result has the type of the
+    first array. If B{openmp} is True, the loop runs in parallel. The
+    remaining arguments are passed on to L{inline_module_with_numpy}.
+
+    The returned function takes the variables as positional arguments in
+    order of first occurrence in the expression, and an optional output
+    array C{out}, and returns the resulting array::
+
+        f = compile_expression('sin(x) + cos(y)*a', scalars=['a'])
+        z = f(x, y, 2.0)
+
+    Compiled expressions are cached by the expression and arguments with
+    their modules in the memory cache, see L{set_memory_cache_size}. The
+    module computing it is available as the attribute C{module} of the
+    returned function, e.g. for its C{set_num_threads}, and the expression
+    as C{expression}, so it can be fused with others by L{fuse_expressions}.
+    In coroutines, C{await f.async_(x, y, 2.0)} runs it without blocking
+    the event loop, see L{awaitable}.
+    """
+    variables, arrays, scalars, dtypes = expression_types(expression, dtypes, scalars,
+                                                          "compile_expression")
+    result_type = dtypes[arrays[0]]
+
+    key = (expression, repr(sorted(dtypes.items())), repr(scalars), openmp,
+           repr(sorted(kwargs.items())))
+    cached = memory_cached_object(key)
+    if cached is not None:
+        return cached
+
+    code = expression_code(expression, variables, scalars, dtypes, result_type, openmp)
+    array_specs = [["instant_n_%s" % v, v, "trusted", dtypes[v], "npy_intp"] for v in arrays]
+    array_specs.append(["instant_n", "instant_result", "trusted", result_type, "npy_intp"])
+    kwargs.setdefault("cppargs", ["-O3"])
+    kwargs.setdefault("release_gil", True)
+    kwargs["system_headers"] = list(kwargs.get("system_headers", [])) + _expression_headers
+    module = inline_module_with_numpy(code, arrays=array_specs, openmp=openmp, **kwargs)
+    evaluate = module.evaluate
+
+    import numpy
+    numpy_types = dict((v, numpy.dtype(_numpy_typechars[dtypes[v]])) for v in variables)
+    result_dtype = numpy_types[arrays[0]]
+
+    def compiled_expression(*args, **options):
+        out = options.pop("out", None)
+        instant_assert(not options, "Unexpected keyword arguments %s." % ", ".join(options))
+        values, shape = array_arguments(variables, scalars, numpy_types, args)
+        if out is None:
+            out = numpy.empty(shape, dtype=result_dtype)
+        elif (not isinstance(out, numpy.ndarray) or out.shape != shape or
+              out.dtype != result_dtype or not out.flags.c_contiguous or
+              not out.flags.writeable):
+            raise ValueError("Output array must be a writeable C contiguous array "
+                             "of type %s and shape %s." % (result_dtype, shape))
+        values.append(out.reshape(-1))
+        evaluate(*values)
+        return out
+
+    compiled_expression.module = module
+    awaitable(compiled_expression)
+    compiled_expression.expression = expression
+    compiled_expression.__name__ = "compiled_expression"
+    compiled_expression.__doc__ = "Evaluate %s elementwise for arguments (%s)." % \
+                                  (expression, ", ".join(variables))
+    place_object_in_memory_cache(key, module, compiled_expression)
+    return compiled_expression
+
+def fused_code(steps, outputs, inputs, scalars, dtypes, openmp):
+    """Return C code for a function evaluating a sequence of elementwise
+    steps in a single loop, writing the outputs to arrays."""
+    parameters = expression_parameters(inputs, scalars, dtypes)
+    for name in outputs:
+        parameters.append("npy_intp instant_n_%s, %s* instant_out_%s" % (name, dtypes[name], name))
+    body = []
+    for name, expression in steps:
+        value = indexed_expression(expression, inputs, scalars)
+        body.append("    const %s %s = %s;" % (dtypes[name], name, value))
+    for name in outputs:
+        body.append("    instant_out_%s[instant_i] = %s;" % (name, name))
+    pragma = "#pragma omp parallel for" if openmp else ""
+    return """
+void fused(%s)
+{
+  %s
+  for (npy_intp instant_i=0; instant_i<instant_n_%s; instant_i++) {
+%s
+  }
+}
+""" % (", ".join(parameters), pragma, outputs[0], "\n".join(body))
+
+def fuse_expressions(steps, outputs=None, dtypes="double", scalars=(), openmp=False,
+                     **kwargs):
+    """Fuse a sequence of elementwise expressions to a function evaluating
+    them all in a single loop, without storing the intermediate results.
+
+    B{steps} is a list of pairs C{(name, expression)}, where each expression
+    can use the arrays and scalars given to the function and the names of
+    the earlier steps, e.g. C{[('t', 'sin(x) + a'), ('y', 't*t + x')]}. An
+    expression can also be a function made by L{compile_expression}.
+    B{outputs} are the names of the steps returned, by default the last.
+    B{dtypes} can give the C types of the steps as well, which by default
+    have the type of the first array. B{scalars} and B{openmp} are as for
+    L{compile_expression}, and the remaining arguments are passed on to
+    L{inline_module_with_numpy}.
+
+    The returned function takes the arrays and scalars as positional
+    arguments in order of first occurrence in the steps, and optional
+    output arrays C{out}. It returns the output array, or a tuple of them
+    for several outputs::
+
+        f = fuse_expressions([('t', 'sin(x) + a'), ('y', 't*t + x')], scalars=['a'])
+        y = f(x, 2.0)
+
+    Fused functions are cached by the steps and arguments.
+    """
+    steps = [(name, getattr(e, "expression", e)) for name, e in steps]
+    names = [name for name, e in steps]
+    instant_assert(steps and len(set(names)) == len(names),
+                   "In instant.fuse_expressions: Expecting steps with different names.")
+    outputs = list(outputs or names[-1:])
+    for name in outputs:
+        instant_assert(name in names, "In instant.fuse_expressions: Unknown output '%s'." % name)
+    for i, (name, expression) in enumerate(steps):
+        later = set(expression_variables(expression)) & set(names[i:])
+        instant_assert(not later, "In instant.fuse_expressions: Step '%s' uses %s before it "
+                       "is computed." % (name, ", ".join(sorted(later))))
+
+    step_types = {} if isinstance(dtypes, str) else dict(dtypes)
+    combined = " ".join("(%s)" % e for name, e in steps)
+    variables, arrays, scalars, dtypes = expression_types(combined, dtypes, scalars,
+                                                          "fuse_expressions")
+    inputs = [v for v in variables if v not in names]
+    arrays = [v for v in arrays if v not in names]
+    instant_assert(arrays, "In instant.fuse_expressions: The steps use no arrays.")
+    for name in names:
+        dtypes[name] = step_types.get(name, dtypes[arrays[0]])
+        instant_assert(dtypes[name] in _numpy_typechars,
+                       "In instant.fuse_expressions: Invalid type '%s' of %s."
+                       % (dtypes[name], name))
+
+    key = ("fused", repr(steps), repr(outputs), repr(sorted(dtypes.items())), repr(scalars),
+           openmp, repr(sorted(kwargs.items())))
+    cached = memory_cached_object(key)
+    if cached is not None:
+        return cached
+
+    code = fused_code(steps, outputs, inputs, scalars, dtypes, openmp)
+    array_specs = [["instant_n_%s" % v, v, "trusted", dtypes[v], "npy_intp"] for v in arrays]
+    array_specs += [["instant_n_%s" % v, "instant_out_%s" % v, "trusted", dtypes[v], "npy_intp"]
+                    for v in outputs]
+    kwargs.setdefault("cppargs", ["-O3"])
+    kwargs.setdefault("release_gil", True)
+    kwargs["system_headers"] = list(kwargs.get("system_headers", [])) + _expression_headers
+    module = inline_module_with_numpy(code, arrays=array_specs, openmp=openmp, **kwargs)
+    evaluate = module.fused
+
+    import numpy
+    numpy_types = dict((v, numpy.dtype(_numpy_typechars[dtypes[v]])) for v in inputs + outputs)
+
+    def fused_expressions(*args, **options):
+        out = options.pop("out", None)
+        instant_assert(not options, "Unexpected keyword arguments %s." % ", ".join(options))
+        values, shape = array_arguments(inputs, scalars, numpy_types, args)
+        if out is None:
+            out = tuple(numpy.empty(shape, dtype=numpy_types[v]) for v in outputs)
+        elif isinstance(out, numpy.ndarray):
+            out = (out,)
+        instant_assert(len(out) == len(outputs), "Expecting %d output arrays." % len(outputs))
+        for v, a in zip(outputs, out):
+            if (not isinstance(a, numpy.ndarray) or a.shape != shape or
+                a.dtype != numpy_types[v] or not a.flags.c_contiguous or
+                not a.flags.writeable):
+                raise ValueError("Output array %s must be a writeable C contiguous array "
+                                 "of type %s and shape %s." % (v, numpy_types[v], shape))
+            values.append(a.reshape(-1))
+        evaluate(*values)
+        return out[0] if len(out) == 1 else out
+
+    fused_expressions.module = module
+    awaitable(fused_expressions)
+    fused_expressions.__name__ = "fused_expressions"
+    fused_expressions.__doc__ = "Evaluate %s elementwise for arguments (%s)." % \
+        ("; ".join("%s = %s" % step for step in steps), ", ".join(inputs))
+    place_object_in_memory_cache(key, module, fused_expressions)
+    return fused_expressions
+
+# Built-in reductions: the identity, the combination of a and b, the
+# transformation of each value v and of the final result r. T is the type
+# of the result.
+_reductions = {
+    'sum': ("0", "(a) + (b)", "v", "r"),
+    'prod': ("1", "(a)*(b)", "v", "r"),
+    'min': ("std::numeric_limits<T>::has_infinity ? std::numeric_limits<T>::infinity() "
+            ": std::numeric_limits<T>::max()", "(b) < (a) ? (b) : (a)", "v", "r"),
+    'max': ("std::numeric_limits<T>::has_infinity ? -std::numeric_limits<T>::infinity() "
+            ": std::numeric_limits<T>::lowest()", "(b) > (a) ? (b) : (a)", "v", "r"),
+    'dot': ("0", "(a) + (b)", "v", "r"),
+    'norm1': ("0", "(a) + (b)", "std::abs(v)", "r"),
+    'norm2': ("0", "(a) + (b)", "std::norm(v)", "std::sqrt(r)"),
+    'norminf': ("0", "(b) > (a) ? (b) : (a)", "std::abs(v)", "r"),
+    }
+
+# Python functions combining the results of built-in reductions of parts
+# of the arrays
+_reduction_combines = {'sum': operator.add, 'prod': operator.mul, 'min': min, 'max': max,
+                       'dot': operator.add, 'norm1': operator.add, 'norm2': math.hypot,
+                       'norminf': max}
+
+# Result types of norms of values of each type
+_norm_types = {'float': 'float', 'std::complex<float>': 'float',
+               'std::complex<double>': 'double'}
+
+# Number of values reduced in each block in the deterministic order
+_reduction_block_size = 4096
+
+def reduction_code(reduction, expression, variables, scalars, dtypes, value_type,
+                   result_type, openmp, deterministic):
+    "Return C code for a function reducing the values of expression."
+    identity, combine, transform, final = reduction
+    parameters = expression_parameters(variables, scalars, dtypes)
+    # SWIG has no typemap for a scalar npy_intp, and long is 32 bits on
+    # Windows, so long long holds the sizes of arrays of 2^31 values or more
+    parameters.append("long long instant_n")
+    value = indexed_expression(expression, variables, scalars)
+    block_size = _reduction_block_size
+    pragma = "#pragma omp"
+    if deterministic:
+        # Reduce fixed blocks in any order, then the block results in order
+        loop = """
+  npy_intp instant_blocks = (instant_n + %(block_size)d - 1)/%(block_size)d;
+  std::vector<T> instant_partial(instant_blocks);
+  %(pragma)s parallel for schedule(static)
+  for (npy_intp instant_b=0; instant_b<instant_blocks; instant_b++) {
+    T instant_local = INSTANT_IDENTITY;
+    npy_intp instant_end = std::min((npy_intp) instant_n, (instant_b + 1)*%(block_size)d);
+    for (npy_intp instant_i=instant_b*%(block_size)d; instant_i<instant_end; instant_i++)
+      instant_local = INSTANT_COMBINE(instant_local, INSTANT_TRANSFORM(%(value)s));
+    instant_partial[instant_b] = instant_local;
+  }
+  for (npy_intp instant_b=0; instant_b<instant_blocks; instant_b++)
+    instant_result = INSTANT_COMBINE(instant_result, instant_partial[instant_b]);""" % locals()
+    else:
+        loop = """
+  %(pragma)s parallel
+  {
+    T instant_local = INSTANT_IDENTITY;
+    %(pragma)s for nowait
+    for (npy_intp instant_i=0; instant_i<instant_n; instant_i++)
+      instant_local = INSTANT_COMBINE(instant_local, INSTANT_TRANSFORM(%(value)s));
+    %(pragma)s critical
+    instant_result = INSTANT_COMBINE(instant_result, instant_local);
+  }""" % locals()
+    if not openmp:
+        loop = "\n".join(line for line in loop.split("\n") if pragma not in line)
+    return """
+#define INSTANT_IDENTITY (%(identity)s)
+#define INSTANT_COMBINE(a, b) (%(combine)s)
+#define INSTANT_TRANSFORM(v) (%(transform)s)
+#define INSTANT_FINAL(r) (%(final)s)
+
+%(result_type)s reduce(%(parameters)s)
+{
+  typedef %(result_type)s T;
+  T instant_result = INSTANT_IDENTITY;%(loop)s
+  return INSTANT_FINAL(instant_result);
+}
+""" % dict(locals(), parameters=", ".join(parameters))
+
+def compile_reduction(reduction, expression=None, dtypes="double", scalars=(), openmp=False,
+                      deterministic=False, **kwargs):
+    """Compile a reduction of an elementwise expression of arrays and
+    scalars to a function computing it in a single pass, optionally in
+    parallel.
+
+    B{reduction} is one of C{'sum'}, C{'prod'}, C{'min'}, C{'max'},
+    C{'dot'}, C{'norm1'}, C{'norm2'} and C{'norminf'}, or a tuple C{(identity,
+    combine)} of C expressions, where C{combine} combines two values C{a} and
+    C{b}, e.g. C{('0', 'a > b ? a : b')}. It is used both for the values and
+    for partial results, so it must be associative. The expression defaults to C{'x'},
+    or C{'x*y'} for C{'dot'}. B{dtypes} and B{scalars} are as for
+    L{compile_expression}. The result has the type of the first array,
+    or its real floating point type for the norms.
+
+    If B{openmp} is True, the reduction runs in parallel. The order of the
+    combinations then depends on the number of threads, which changes
+    rounding of floating point results. If B{deterministic} is True, the
+    values are reduced in fixed blocks whose results are combined in
+    order, giving the same result for any number of threads. The remaining
+    arguments are passed on to L{inline_module_with_numpy}::
+
+        norm = compile_reduction('norm2', openmp=True, deterministic=True)
+        r = norm(x)
+
+    Compiled reductions are cached by the reduction and arguments. The
+    module computing it is available as the attribute C{module} of the
+    returned function, e.g. for its C{set_num_threads}. For the built-in
+    reductions, the attribute C{combine} is a Python function combining
+    the results for two parts of the arrays, e.g. for L{stream_reduce}.
+    """
+    if expression is None:
+        expression = "x*y" if reduction == "dot" else "x"
+    variables, arrays, scalars, dtypes = expression_types(expression, dtypes, scalars,
+                                                          "compile_reduction")
+    value_type = dtypes[arrays[0]]
+    result_type = value_type
+    if isinstance(reduction, str):
+        instant_assert(reduction in _reductions,
+                       "In instant.compile_reduction: Unknown reduction '%s'." % reduction)
+        instant_assert(not (reduction in ('min', 'max') and 'complex' in value_type),
+                       "In instant.compile_reduction: Complex values can not be ordered.")
+        identity, combine, transform, final = _reductions[reduction]
+        if reduction.startswith('norm'):
+            result_type = _norm_types.get(value_type, 'double')
+            if 'unsigned' in value_type:
+                transform = transform.replace("std::abs(v)", "v")
+        reduction_parts = (identity, combine, transform, final)
+    else:
+        identity, combine = reduction
+        reduction_parts = (identity, combine, "v", "r")
+
+    key = ("reduction", repr(reduction), expression, repr(sorted(dtypes.items())),
+           repr(scalars), openmp, deterministic, repr(sorted(kwargs.items())))
+    cached = memory_cached_object(key)
+    if cached is not None:
+        return cached
+
+    code = reduction_code(reduction_parts, expression, variables, scalars, dtypes, value_type,
+                          result_type, openmp, deterministic)
+    array_specs = [["instant_n_%s" % v, v, "trusted", dtypes[v], "npy_intp"] for v in arrays]
+    kwargs.setdefault("cppargs", ["-O3"])
+    kwargs.setdefault("release_gil", True)
+    kwargs["system_headers"] = list(kwargs.get("system_headers", [])) + _expression_headers + \
+                               ["complex", "limits", "vector", "algorithm"]
+    module = inline_module_with_numpy(code, arrays=array_specs, openmp=openmp, **kwargs)
+    compute = module.reduce
+
+    import numpy
+    numpy_types = dict((v, numpy.dtype(_numpy_typechars[dtypes[v]])) for v in variables)
+
+    def compiled_reduction(*args):
+        values, shape = array_arguments(variables, scalars, numpy_types, args)
+        if reduction in ('min', 'max') and not numpy.prod(shape):
+            raise ValueError("Zero-size array to reduction operation %s." % reduction)
+        values.append(int(numpy.prod(shape)))
+        return compute(*values)
+
+    compiled_reduction.module = module
+    awaitable(compiled_reduction)
+    compiled_reduction.combine = _reduction_combines.get(reduction) \
+                                 if isinstance(reduction, str) else None
+    compiled_reduction.__name__ = "compiled_reduction"
+    compiled_reduction.__doc__ = "Compute the %s of %s for arguments (%s)." % \
+                                 (reduction, expression, ", ".join(variables))
+    place_object_in_memory_cache(key, module, compiled_reduction)
+    return compiled_reduction
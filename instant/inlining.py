@@ -28,7 +28,8 @@ def get_func_name(c_code):
     # TODO: Something more robust? Regexp?
     try:
         func = c_code[:c_code.index('(')]
-        ret, func_name = func.split()
+        # The last word is the name, possibly after a template declaration
+        func_name = func.split()[-1].lstrip('*&')
     except:
         instant_error("Failed to extract function name from c_code.")
     return func_name
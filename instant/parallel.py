@@ -0,0 +1,117 @@
+"""Parallel execution of compiled kernels on partitions of arrays."""
+
+# This file is part of Instant.
+#
+# Instant is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Instant is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Instant. If not, see <http://www.gnu.org/licenses/>.
+#
+# Alternatively, Instant may be distributed under the terms of the BSD license.
+
+from .output import instant_assert
+
+def default_workers():
+    "Return the default number of worker threads, the number of processors."
+    import multiprocessing
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+def partition_arguments(arrays, axis, parts):
+    """Return a list of argument tuples, one for each of at most parts
+    contiguous slices along axis of the arrays in arrays. Other arguments
+    are the same in all tuples."""
+    import numpy
+    if isinstance(arrays, numpy.ndarray) or not isinstance(arrays, (tuple, list)):
+        arrays = (arrays,)
+    lengths = set(a.shape[axis] for a in arrays if isinstance(a, numpy.ndarray))
+    instant_assert(len(lengths) == 1,
+                   "In instant.parallel_map: Expecting arrays of the same length along axis %d."
+                   % axis)
+    length = lengths.pop()
+    parts = max(1, min(parts, length))
+    bounds = [length*p // parts for p in range(parts + 1)]
+    partitions = []
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        args = []
+        for a in arrays:
+            if isinstance(a, numpy.ndarray):
+                args.append(a[(slice(None),)*(axis % a.ndim) + (slice(begin, end),)])
+            else:
+                args.append(a)
+        partitions.append(tuple(args))
+    return partitions
+
+def _concatenate_results(results, axis):
+    "Return the array results for slices concatenated along axis."
+    import numpy
+    instant_assert(all(isinstance(r, numpy.ndarray) for r in results),
+                   "In instant.parallel_map: Expecting array results to concatenate, "
+                   "pass combine to join other results.")
+    return numpy.concatenate(results, axis=axis)
+
+def parallel_map(kernel, arrays, axis=0, workers=None, parts=None, combine=None):
+    """Apply kernel to contiguous slices of arrays in parallel threads and
+    stitch the results together.
+
+    B{arrays} is an array or a tuple of arguments to kernel, where all
+    arrays are sliced along B{axis} into B{parts} slices, by default one
+    for each of the B{workers} threads, which default to the number of
+    processors. Other arguments are passed unchanged with each slice. The
+    kernel must release the global interpreter lock to run in parallel,
+    like the functions made by L{compile_expression} or modules built with
+    C{release_gil=True}.
+
+    The results for the slices are combined in order by B{combine}, which
+    defaults to the C{combine} attribute of reductions made by
+    L{compile_reduction}. Otherwise array results are concatenated along
+    axis, each array separately for kernels returning tuples of arrays,
+    and None is returned for kernels updating the arrays in place::
+
+        f = compile_expression('sqrt(x*x + y*y)')
+        r = parallel_map(f, (x, y), workers=4)
+    """
+    import numpy
+    from multiprocessing.pool import ThreadPool
+    if workers is None:
+        workers = default_workers()
+    instant_assert(workers >= 1, "In instant.parallel_map: Expecting workers >= 1.")
+    partitions = partition_arguments(arrays, axis, parts or workers)
+
+    if workers > 1 and len(partitions) > 1:
+        pool = ThreadPool(min(workers, len(partitions)))
+        try:
+            results = pool.map(lambda args: kernel(*args), partitions)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [kernel(*args) for args in partitions]
+
+    if combine is None:
+        combine = getattr(kernel, "combine", None)
+    if combine is not None:
+        result = results[0]
+        for value in results[1:]:
+            result = combine(result, value)
+        return result
+    if all(r is None for r in results):
+        return None
+    if isinstance(results[0], tuple):
+        instant_assert(all(isinstance(r, tuple) and len(r) == len(results[0])
+                           for r in results),
+                       "In instant.parallel_map: Expecting tuples of the same length "
+                       "from all slices.")
+        return tuple(_concatenate_results([r[i] for r in results], axis)
+                     for i in range(len(results[0])))
+    return _concatenate_results(results, axis)
@@ -0,0 +1,225 @@
+"""Execution of compiled kernels in a pool of processes, which import the
+module from the cache and access the arrays in shared memory."""
+
+# This file is part of Instant.
+#
+# Instant is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Instant is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Instant. If not, see <http://www.gnu.org/licenses/>.
+#
+# Alternatively, Instant may be distributed under the terms of the BSD license.
+
+import os
+from collections import namedtuple
+from .output import instant_assert
+from .cache import import_module
+
+# An array in a shared memory block, as passed to the worker processes
+SharedArgument = namedtuple("SharedArgument", ["name", "offset", "shape", "strides", "dtype"])
+
+# The module imported by a worker process
+_worker_module = None
+
+def _byte_bounds(array):
+    "Return the addresses of the first and past the last byte of array."
+    import numpy
+    byte_bounds = getattr(numpy, "byte_bounds", None)
+    if byte_bounds is None:
+        from numpy.lib.array_utils import byte_bounds
+    return byte_bounds(array)
+
+class _SharedBuffer(object):
+    """The memory of a shared memory block as seen by NumPy, keeping the
+    block mapped as long as arrays viewing it exist."""
+
+    def __init__(self, block, shape, dtype, offset=0, strides=None):
+        import ctypes
+        self.block = block
+        # Holding an export of the buffer prevents closing the block
+        self.memory = ctypes.c_char.from_buffer(block.buf)
+        if not isinstance(shape, (tuple, list)):
+            shape = (shape,)
+        self.__array_interface__ = dict(version=3, shape=tuple(shape), typestr=dtype.str,
+                                        descr=dtype.descr, strides=strides,
+                                        data=(ctypes.addressof(self.memory) + offset, False))
+
+    def __del__(self):
+        # Release the export before the block is closed
+        self.memory = None
+
+def _shared_array(block, shape, dtype, offset=0, strides=None):
+    "Return an array in a shared memory block."
+    import numpy
+    return numpy.asarray(_SharedBuffer(block, shape, numpy.dtype(dtype), offset, strides))
+
+def _block_start(block):
+    "Return the address of the memory of a shared memory block."
+    return _shared_array(block, (block.size,), "uint8").ctypes.data
+
+def _describe(a, blocks):
+    """Return a SharedArgument describing an array in one of blocks, a list
+    of (block, start address) pairs, or None if it is not in one of them."""
+    low, high = _byte_bounds(a)
+    for block, start in blocks:
+        if start <= low and high <= start + block.size:
+            return SharedArgument(block.name, a.__array_interface__["data"][0] - start,
+                                  a.shape, a.strides, a.dtype.str)
+    return None
+
+def _initialize_worker(moduleid, cache_dir):
+    "Import the module in a worker process."
+    global _worker_module
+    _worker_module = import_module(moduleid, cache_dir)
+    instant_assert(_worker_module is not None,
+                   "In instant.ProcessPool: Failed to import module %r in worker." % moduleid)
+
+def _call_in_worker(function, args):
+    """Call a function of the module in a worker process, with the arrays in
+    shared memory blocks attached while they are used. Returned arrays in
+    the blocks are returned as SharedArgument descriptions."""
+    import numpy
+    from multiprocessing import shared_memory
+    blocks = {}
+    values = []
+    for a in args:
+        if isinstance(a, SharedArgument):
+            if a.name not in blocks:
+                blocks[a.name] = shared_memory.SharedMemory(name=a.name)
+            values.append(_shared_array(blocks[a.name], a.shape, a.dtype, a.offset, a.strides))
+        else:
+            values.append(a)
+    result = getattr(_worker_module, function)(*values)
+    starts = [(block, _block_start(block)) for block in blocks.values()]
+
+    def describe(r):
+        if isinstance(r, numpy.ndarray):
+            return _describe(r, starts) or r
+        if isinstance(r, tuple):
+            return tuple(describe(v) for v in r)
+        if isinstance(r, list):
+            return [describe(v) for v in r]
+        return r
+
+    # The blocks are closed when the arrays viewing them are deleted
+    return describe(result)
+
+class ProcessPool(object):
+    """A pool of processes calling the functions of a compiled module, for
+    kernels which can not run in parallel threads, because they hold the
+    global interpreter lock or are not thread safe.
+
+    Each worker imports the module from the cache by its name. Arrays
+    passed to the functions must be allocated by L{array} or L{shared},
+    placing them in shared memory, so only their location is sent to the
+    workers and the functions can update them in place::
+
+        with ProcessPool(module, workers=4) as pool:
+            x = pool.shared(x)
+            pool.map('smooth', [(x[:n],), (x[n:],)])
+    """
+
+    def __init__(self, module, workers=None, cache_dir=None):
+        """Start the pool for a module or the name of a module in the
+        cache, with the given number of worker processes, by default one
+        for each processor."""
+        from concurrent.futures import ProcessPoolExecutor
+        from .parallel import default_workers
+        if isinstance(module, str):
+            moduleid = module
+        else:
+            moduleid = module.__name__
+            if cache_dir is None:
+                cache_dir = os.path.dirname(os.path.dirname(os.path.abspath(module.__file__)))
+        self._blocks = []
+        self._executor = ProcessPoolExecutor(workers or default_workers(),
+                                             initializer=_initialize_worker,
+                                             initargs=(moduleid, cache_dir))
+
+    def array(self, shape, dtype="float64"):
+        "Return a new array of zeros in shared memory."
+        import numpy
+        from multiprocessing import shared_memory
+        dtype = numpy.dtype(dtype)
+        size = int(numpy.prod(shape))*dtype.itemsize
+        block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        array = _shared_array(block, shape, dtype)
+        self._blocks.append((block, _block_start(block)))
+        array[...] = 0
+        return array
+
+    def shared(self, array):
+        "Return a copy of array in shared memory."
+        import numpy
+        array = numpy.asarray(array)
+        copy = self.array(array.shape, array.dtype)
+        copy[...] = array
+        return copy
+
+    def _argument(self, a):
+        "Return the description of an array in shared memory, or a unchanged."
+        import numpy
+        if not isinstance(a, numpy.ndarray):
+            return a
+        description = _describe(a, self._blocks)
+        instant_assert(description is not None, "In instant.ProcessPool: Arrays must be "
+                       "allocated by ProcessPool.array or ProcessPool.shared.")
+        return description
+
+    def _result(self, r):
+        "Return the result from a worker with arrays in shared memory as arrays."
+        if isinstance(r, SharedArgument):
+            for block, start in self._blocks:
+                if block.name == r.name:
+                    return _shared_array(block, r.shape, r.dtype, r.offset, r.strides)
+        if isinstance(r, tuple):
+            return tuple(self._result(v) for v in r)
+        if isinstance(r, list):
+            return [self._result(v) for v in r]
+        return r
+
+    def submit(self, function, *args):
+        """Call the named function of the module with the given arguments in
+        a worker and return a C{concurrent.futures} future for the result.
+        Returned arrays in shared memory are not copied."""
+        from concurrent.futures import Future
+        result = Future()
+
+        def done(future):
+            try:
+                result.set_result(self._result(future.result()))
+            except BaseException as e:
+                result.set_exception(e)
+
+        self._executor.submit(_call_in_worker, function,
+                              [self._argument(a) for a in args]).add_done_callback(done)
+        return result
+
+    def map(self, function, arguments):
+        """Call the named function of the module for each tuple of arguments
+        in parallel and return the results in order."""
+        futures = [self.submit(function, *args) for args in arguments]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Shut down the workers and free the shared memory. Arrays in it
+        which are still referenced stay valid until they are deleted."""
+        self._executor.shutdown()
+        for block, start in self._blocks:
+            # The block is closed when the arrays viewing it are deleted
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
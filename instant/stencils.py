@@ -0,0 +1,223 @@
+"""Compilation of stencil updates on 1D, 2D and 3D grids, like a Jacobi step
+C{0.25*(u(-1,0) + u(1,0) + u(0,-1) + u(0,1))}, to cache blocked loops."""
+
+# This file is part of Instant.
+#
+# Instant is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Instant is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Instant. If not, see <http://www.gnu.org/licenses/>.
+#
+# Alternatively, Instant may be distributed under the terms of the BSD license.
+
+import re
+from .output import instant_assert
+from .codegeneration import _numpy_typechars
+from .inlining import inline_module_with_numpy
+from .asynchronous import awaitable
+from .cache import memory_cached_object, place_object_in_memory_cache
+from .expressions import _expression_headers, expression_types, array_arguments
+
+# Names of the grid indices in each direction
+_stencil_indices = ['i', 'j', 'k']
+
+# Default tile sizes for 1D, 2D and 3D grids, keeping the tiles of a few
+# arrays in cache while traversing the last direction contiguously
+_default_tiles = {1: (4096,), 2: (64, 512), 3: (16, 16, 256)}
+
+# Neighbour accesses like u(-1,0)
+_offset_pattern = r"\b([A-Za-z_]\w*)\s*\(\s*([+-]?\d+(?:\s*,\s*[+-]?\d+)*)\s*\)"
+
+# Functions of cmath, whose calls with integers like sqrt(2) are not neighbour accesses
+_stencil_functions = set("""
+abs fabs sqrt cbrt exp exp2 expm1 log log2 log10 log1p pow sin cos tan asin acos atan
+atan2 sinh cosh tanh asinh acosh atanh floor ceil round trunc fmod fmin fmax hypot erf
+erfc tgamma lgamma copysign min max
+""".split())
+
+def stencil_offsets(expression):
+    """Return a dict mapping each array accessed with offsets like
+    C{u(-1,0)} in expression to the list of its offsets. Calls of cmath
+    functions, and of functions also called with other arguments, are
+    not accesses."""
+    accesses = re.findall(_offset_pattern, expression)
+    calls = re.findall(r"\b([A-Za-z_]\w*)\s*\(", expression)
+    names = [name for name, args in accesses]
+    offsets = {}
+    for name, args in accesses:
+        if name in _stencil_functions or calls.count(name) != names.count(name):
+            continue
+        offsets.setdefault(name, []).append(tuple(int(a) for a in args.split(",")))
+    return offsets
+
+def stencil_code(expression, variables, scalars, dtypes, result_type, ndim, radius,
+                 tile, openmp):
+    "Return C code for a function applying a stencil in tiled loops."
+    indices = _stencil_indices[:ndim]
+    dims = ["instant_n%d" % d for d in range(ndim)]
+    arrays = [v for v in variables if v not in scalars]
+
+    def linear_index(offsets):
+        index = "(%s%+d)" % (indices[0], offsets[0]) if offsets[0] else indices[0]
+        for d in range(1, ndim):
+            i = "(%s%+d)" % (indices[d], offsets[d]) if offsets[d] else indices[d]
+            index = "(%s)*%s + %s" % (index, dims[d], i)
+        return index
+
+    def neighbour(match):
+        name, args = match.group(1), match.group(2)
+        if name not in arrays:
+            return match.group(0)
+        offsets = [int(a) for a in args.split(",")]
+        instant_assert(len(offsets) == ndim, "Expecting %d offsets in %r." % (ndim, match.group(0)))
+        return "%s[%s]" % (name, linear_index(offsets))
+
+    body = re.sub(_offset_pattern, neighbour, expression)
+    if arrays:
+        body = re.sub(r"\b(%s)\b(?!\s*[\(\[])" % "|".join(arrays),
+                      r"\1[%s]" % linear_index([0]*ndim), body)
+
+    parameters = []
+    for v in variables:
+        if v in scalars:
+            parameters.append("%s %s" % (dtypes[v], v))
+        else:
+            parameters.append(", ".join(["npy_intp instant_%s%d" % (v, d) for d in range(ndim)] +
+                                        ["%s* %s" % (dtypes[v], v)]))
+    parameters.append(", ".join(["npy_intp %s" % n for n in dims] +
+                                ["%s* instant_out" % result_type]))
+
+    loops = []
+    for d in range(ndim):
+        loops.append("for (npy_intp instant_t%d=%d; instant_t%d<%s-%d; instant_t%d+=%d)"
+                     % (d, radius, d, dims[d], radius, d, tile[d]))
+    for d in range(ndim):
+        loops.append("for (npy_intp %s=instant_t%d; %s<std::min(instant_t%d+%d, %s-%d); %s++)"
+                     % (indices[d], d, indices[d], d, tile[d], dims[d], radius, indices[d]))
+    code = ""
+    if openmp:
+        collapse = " collapse(%d)" % ndim if ndim > 1 else ""
+        code += "  #pragma omp parallel for%s schedule(static)\n" % collapse
+    for depth, loop in enumerate(loops):
+        code += "  " + "  "*depth + loop + "\n"
+    code += "  " + "  "*len(loops) + "instant_out[%s] = %s;\n" % (linear_index([0]*ndim), body)
+    return """
+void stencil(%s)
+{
+%s}
+""" % (", ".join(parameters), code)
+
+def compile_stencil(expression, ndim=2, radius=None, tile=None, dtypes="double", scalars=(),
+                    openmp=False, **kwargs):
+    """Compile a stencil update of arrays on a 1D, 2D or 3D grid to a
+    function applying it to all points in cache blocked (tiled) loops.
+
+    The value of an array C{u} in a neighbouring point is written with the
+    offsets in each direction, e.g. C{u(-1,0)} for the previous point in
+    the first direction, and C{u} alone is the value in the point itself.
+    The indices of the point are C{i}, C{j} and C{k}. The neighbourhood
+    has the given B{radius}, by default the largest offset, and only
+    points at least that far from the boundary are updated. B{tile} gives
+    the number of points in each direction of a tile. B{dtypes} and
+    B{scalars} are as for L{compile_expression}, and the result has the
+    type of the first array. If B{openmp} is True, the tiles are updated
+    in parallel. The remaining arguments are passed on to
+    L{inline_module_with_numpy}.
+
+    The returned function takes the arrays and scalars as positional
+    arguments in order of first occurrence in the expression, and an
+    optional output array C{out}, which must not be one of the arrays. It
+    returns the output array. If no output array is given, it is a copy of
+    the first array, so the boundary values are kept::
+
+        jacobi = compile_stencil('0.25*(u(-1,0) + u(1,0) + u(0,-1) + u(0,1)) - h*h*f',
+                                 scalars=['h'])
+        u = jacobi(u, h, f)
+
+    Compiled stencils are cached by the expression and arguments.
+    """
+    instant_assert(ndim in _default_tiles,
+                   "In instant.compile_stencil: Expecting ndim to be 1, 2 or 3.")
+    offsets = stencil_offsets(expression)
+    indices = _stencil_indices[:ndim]
+    instant_assert(not set(offsets) & set(indices),
+                   "In instant.compile_stencil: Grid indices can not have offsets.")
+    # Arrays accessed with offsets, like u(1,0), are variables too, but
+    # the grid indices are not
+    plain = re.sub(_offset_pattern,
+                   lambda m: m.group(1) if m.group(1) in offsets else m.group(0), expression)
+    variables, arrays, scalars, dtypes = expression_types(plain, dtypes, scalars,
+                                                          "compile_stencil")
+    variables = [v for v in variables if v not in indices]
+    arrays = [v for v in arrays if v not in indices]
+    instant_assert(arrays, "In instant.compile_stencil: Expression %r has no arrays."
+                   % expression)
+    largest = max([abs(o) for v in offsets for offset in offsets[v] for o in offset] + [0])
+    if radius is None:
+        radius = largest
+    instant_assert(radius >= largest, "In instant.compile_stencil: Radius %d is smaller "
+                   "than the largest offset %d." % (radius, largest))
+    tile = tuple(tile or _default_tiles[ndim])
+    instant_assert(len(tile) == ndim and min(tile) > 0,
+                   "In instant.compile_stencil: Expecting %d positive tile sizes." % ndim)
+    result_type = dtypes[arrays[0]]
+
+    key = ("stencil", expression, ndim, radius, tile, repr(sorted(dtypes.items())),
+           repr(scalars), openmp, repr(sorted(kwargs.items())))
+    cached = memory_cached_object(key)
+    if cached is not None:
+        return cached
+
+    code = stencil_code(expression, variables, scalars, dtypes, result_type, ndim, radius,
+                        tile, openmp)
+    array_specs = [["instant_%s%d" % (v, d) for d in range(ndim)] +
+                   [v, "trusted", dtypes[v], "npy_intp"] for v in arrays]
+    array_specs.append(["instant_n%d" % d for d in range(ndim)] +
+                       ["instant_out", "trusted", result_type, "npy_intp"])
+    kwargs.setdefault("cppargs", ["-O3"])
+    kwargs.setdefault("release_gil", True)
+    kwargs["system_headers"] = list(kwargs.get("system_headers", [])) + \
+                               _expression_headers + ["algorithm"]
+    module = inline_module_with_numpy(code, arrays=array_specs, openmp=openmp, **kwargs)
+    apply_stencil = module.stencil
+
+    import numpy
+    numpy_types = dict((v, numpy.dtype(_numpy_typechars[dtypes[v]])) for v in variables)
+    result_dtype = numpy_types[arrays[0]]
+
+    def compiled_stencil(*args, **options):
+        out = options.pop("out", None)
+        instant_assert(not options, "Unexpected keyword arguments %s." % ", ".join(options))
+        values, shape = array_arguments(variables, scalars, numpy_types, args, flat=False)
+        if len(shape) != ndim:
+            raise ValueError("Expecting arrays with %d dimensions, got %d." % (ndim, len(shape)))
+        if out is None:
+            out = values[variables.index(arrays[0])].copy()
+        elif (not isinstance(out, numpy.ndarray) or out.shape != shape or
+              out.dtype != result_dtype or not out.flags.c_contiguous or
+              not out.flags.writeable):
+            raise ValueError("Output array must be a writeable C contiguous array "
+                             "of type %s and shape %s." % (result_dtype, shape))
+        else:
+            for v, a in zip(variables, values):
+                if v not in scalars and numpy.shares_memory(out, a):
+                    raise ValueError("Output array must not share memory with array %s." % v)
+        values.append(out)
+        apply_stencil(*values)
+        return out
+
+    compiled_stencil.module = module
+    awaitable(compiled_stencil)
+    compiled_stencil.__name__ = "compiled_stencil"
+    compiled_stencil.__doc__ = "Apply the stencil %s for arguments (%s)." % \
+                               (expression, ", ".join(variables))
+    place_object_in_memory_cache(key, module, compiled_stencil)
+    return compiled_stencil
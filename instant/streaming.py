@@ -0,0 +1,227 @@
+"""Streaming execution of compiled kernels over iterables of array chunks,
+reading the next chunks in a background thread while a kernel runs, and
+over memory mapped files larger than the memory."""
+
+# This file is part of Instant.
+#
+# Instant is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Instant is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Instant. If not, see <http://www.gnu.org/licenses/>.
+#
+# Alternatively, Instant may be distributed under the terms of the BSD license.
+
+import os, sys, mmap
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+from .output import instant_assert
+
+# Marker for the end of the chunks in the prefetch queue
+_end_of_chunks = object()
+
+def prefetched(chunks, prefetch=1):
+    """Iterate over chunks, reading up to prefetch chunks ahead in a
+    background thread. Exceptions raised while reading are raised here."""
+    instant_assert(prefetch >= 1, "In instant.prefetched: Expecting prefetch >= 1.")
+    buffer = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read():
+        try:
+            for chunk in chunks:
+                if not put((chunk, None)):
+                    return
+        except Exception:
+            put((None, sys.exc_info()))
+            return
+        put((_end_of_chunks, None))
+
+    reader = threading.Thread(target=read, name="instant-prefetch")
+    reader.daemon = True
+    reader.start()
+    try:
+        while True:
+            chunk, error = buffer.get()
+            if error is not None:
+                exception = error[1]
+                if hasattr(exception, "with_traceback"):
+                    exception = exception.with_traceback(error[2])
+                raise exception
+            if chunk is _end_of_chunks:
+                break
+            yield chunk
+    finally:
+        # Stop the reader after its current chunk, without waiting for it
+        stop.set()
+
+def _arguments(chunk):
+    "Return the kernel arguments for a chunk, either a tuple or a single array."
+    return chunk if isinstance(chunk, tuple) else (chunk,)
+
+def stream(kernel, chunks, prefetch=1):
+    """Apply kernel to each chunk from the iterable chunks and yield the
+    results, with the next chunk read in a background thread while the
+    kernel runs (double buffering).
+
+    A chunk is either a single array or a tuple of arguments to kernel.
+    The kernel should release the global interpreter lock, like the
+    functions made by L{compile_expression} or modules built with
+    C{release_gil=True}, so the reading can run in parallel with it::
+
+        f = compile_expression('sqrt(x*x + y*y)')
+        for r in stream(f, zip(xchunks, ychunks)):
+            write(r)
+    """
+    for chunk in prefetched(chunks, prefetch):
+        yield kernel(*_arguments(chunk))
+
+def stream_reduce(kernel, chunks, combine=None, initial=None, prefetch=1):
+    """Apply a reduction kernel to each chunk from the iterable chunks and
+    return the combined result, with the next chunk read in a background
+    thread while the kernel runs.
+
+    The results for the chunks are combined in order by combine(a, b),
+    which defaults to the C{combine} attribute of reductions made by
+    L{compile_reduction}. If initial is given, it is combined with the
+    result of the first chunk, otherwise the chunks must not be empty::
+
+        norm = compile_reduction('norm2')
+        r = stream_reduce(norm, chunks)
+    """
+    if combine is None:
+        combine = getattr(kernel, "combine", None)
+    instant_assert(combine is not None,
+                   "In instant.stream_reduce: Expecting a function combining results.")
+    result = initial
+    first = initial is None
+    for value in stream(kernel, chunks, prefetch):
+        result = value if first else combine(result, value)
+        first = False
+    instant_assert(not first, "In instant.stream_reduce: No chunks to reduce.")
+    return result
+
+def _map_window(f, start, stop, dtype, offset, access, advise):
+    """Map the items start to stop of a raw binary file with the given
+    header offset and return the memory map and an array viewing it."""
+    import numpy
+    begin = offset + start*dtype.itemsize
+    end = offset + stop*dtype.itemsize
+    aligned = begin - begin % mmap.ALLOCATIONGRANULARITY
+    window = mmap.mmap(f.fileno(), end - aligned, access=access, offset=aligned)
+    if advise and hasattr(window, "madvise"):
+        # Read the window sequentially, starting the readahead now
+        window.madvise(mmap.MADV_SEQUENTIAL)
+        window.madvise(mmap.MADV_WILLNEED)
+    return window, numpy.frombuffer(window, dtype, stop - start, begin - aligned)
+
+def _close_window(window):
+    "Close a memory map unless the kernel kept an array viewing it."
+    try:
+        window.close()
+    except BufferError:
+        pass
+
+def mmap_apply(kernel, inputs, output=None, dtype="float64", output_dtype=None, offset=0,
+               window_size=64*1024*1024, workers=1, advise=True, combine=None):
+    """Apply kernel to raw binary files too large for the memory, in
+    windows of the memory mapped files passed to kernel without copying.
+
+    B{inputs} is the path of a file, or a list of paths of files with the
+    same number of items of type B{dtype} after a header of B{offset}
+    bytes. The kernel is called with an array for each input in each
+    window of about B{window_size} bytes. If B{output} is the path of a
+    file, it is created to hold the same number of items of type
+    B{output_dtype}, by default B{dtype}, and the window of the output is
+    passed as the last argument. With B{advise}, the operating system is
+    told that the windows are read sequentially and should be read ahead.
+    With B{workers} > 1, that many windows are processed in parallel
+    threads, which requires a kernel releasing the global interpreter
+    lock, e.g. built with C{release_gil=True}.
+
+    Returns the results of kernel for the windows in order, or these
+    combined in order by B{combine}::
+
+        scale = inline_with_numpy(code, arrays=[['n', 'x', 'in'], ['m', 'y']],
+                                  release_gil=True)
+        mmap_apply(scale, 'input.raw', 'output.raw', workers=4)
+    """
+    import numpy
+    from multiprocessing.pool import ThreadPool
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    dtype = numpy.dtype(dtype)
+    output_dtype = numpy.dtype(output_dtype or dtype)
+    sizes = [os.path.getsize(path) - offset for path in inputs]
+    count = sizes[0] // dtype.itemsize
+    for path, size in zip(inputs, sizes):
+        instant_assert(size >= 0 and size == count*dtype.itemsize,
+                       "In instant.mmap_apply: File %r does not have %d items of type %s."
+                       % (path, count, dtype))
+    items = max(1, window_size // max(dtype.itemsize, output_dtype.itemsize))
+    windows = [(start, min(start + items, count)) for start in range(0, count, items)]
+
+    files = [open(path, "rb") for path in inputs]
+    try:
+        if output is not None:
+            files.append(open(output, "w+b"))
+            files[-1].truncate(count*output_dtype.itemsize)
+
+        def process(window):
+            start, stop = window
+            maps = [_map_window(f, start, stop, dtype, offset, mmap.ACCESS_READ, advise)
+                    for f in files[:len(inputs)]]
+            if output is not None:
+                maps.append(_map_window(files[-1], start, stop, output_dtype, 0,
+                                        mmap.ACCESS_WRITE, False))
+            mapped = [m for m, array in maps]
+            arrays = [array for m, array in maps]
+            del maps
+            try:
+                return kernel(*arrays)
+            finally:
+                del arrays
+                if output is not None:
+                    mapped[-1].flush()
+                for m in mapped:
+                    _close_window(m)
+
+        if workers > 1:
+            pool = ThreadPool(workers)
+            try:
+                results = pool.map(process, windows)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [process(window) for window in windows]
+    finally:
+        for f in files:
+            f.close()
+
+    if combine is None:
+        return results
+    instant_assert(results, "In instant.mmap_apply: No windows to combine.")
+    result = results[0]
+    for value in results[1:]:
+        result = combine(result, value)
+    return result
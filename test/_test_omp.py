@@ -45,7 +45,7 @@ void compute_scalar(int n, double* x,
 
 N = 8000000
 
-compute_func = inline_with_numpy(c_code, arrays = [['n', 'x'], ['m', 'y']], cppargs = ['-fopenmp'], lddargs=['-lgomp'], system_headers=["omp.h"])  
+compute_func = inline_with_numpy(c_code, arrays = [['n', 'x'], ['m', 'y']], openmp=True)
 
 x = arange(0, 1, 1.0/N) 
 y = arange(0, 1, 1.0/N) 
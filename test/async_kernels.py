@@ -0,0 +1,30 @@
+"""Coroutines calling kernels, used by test42.py. They are kept apart from
+the test, which must be parsed by Python 2 to be skipped."""
+
+import asyncio
+import numpy
+import instant
+
+async def main(spin, f, total):
+    "Call the kernels from coroutines and check the results."
+    # Kernels run while the event loop keeps going
+    ticks = []
+    async def tick():
+        for i in range(5):
+            ticks.append(i)
+            await asyncio.sleep(0.01)
+    result, _ = await asyncio.gather(spin.async_(0.3), tick())
+    assert result == 0.3 and ticks == list(range(5))
+
+    x = numpy.arange(1000.0)
+    assert numpy.allclose(await f.async_(x, 2*x), numpy.sqrt(5)*x)
+    assert await total.async_(x) == x.sum()
+    assert await instant.call_async(f, x, x, out=x) is x
+
+    # Timed out calls stop waiting
+    try:
+        await asyncio.wait_for(spin.async_(1.0), 0.05)
+    except asyncio.TimeoutError:
+        pass
+    else:
+        raise AssertionError("Call did not time out")
@@ -110,7 +110,7 @@ c = sum_func(a, b, b.size)
 print(c)
 print(numpy.dot(a, b))
 
-# Example 5: arrays with more than 3 dimensions, uses old typemaps, only doubles
+# Example 5: arrays with more than 3 dimensions
 c_code = """
 void sum (int m, int* mp, double* array1, int n, int* np, double* array2){
   int w = mp[0], x = mp[1], y = mp[2], z = mp[3];
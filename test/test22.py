@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+from instant import inline_module_with_numpy
+
+# Strided and Fortran ordered arrays are passed to C without copying
+c_code = """
+void scale(int n, int m, int sn, int sm, double* a, double f) {
+  for (int i=0; i<n; i++)
+    for (int j=0; j<m; j++)
+      a[i*sn + j*sm] *= f;
+}
+
+double trace(int n, int m, int sn, int sm, double* b) {
+  double tmp = 0.0;
+  for (int i=0; i<n && i<m; i++)
+    tmp += b[i*sn + i*sm];
+  return tmp;
+}
+
+void fill_columns(int n, int m, double* a) {
+  for (int j=0; j<m; j++)
+    for (int i=0; i<n; i++)
+      a[i + n*j] = j;
+}
+
+double first_column_sum(int n, int m, double* b) {
+  double tmp = 0.0;
+  for (int i=0; i<n; i++)
+    tmp += b[i];
+  return tmp;
+}
+"""
+
+module = inline_module_with_numpy(c_code,
+                                  arrays=[['n', 'm', 'sn', 'sm', 'a', 'strided'],
+                                          ['n', 'm', 'sn', 'sm', 'b', 'strided', 'in'],
+                                          ['n', 'm', 'a', 'fortran'],
+                                          ['n', 'm', 'b', 'fortran', 'in']],
+                                  cache_dir="test_cache")
+
+# A strided view is modified in place
+a = numpy.ones((6, 8))
+module.scale(a[::2, 1::3], 3.0)
+b = numpy.ones((6, 8))
+b[::2, 1::3] *= 3.0
+assert (a == b).all()
+
+# Read only views of other data types are converted
+assert module.trace(numpy.eye(3, dtype='int32')) == 3.0
+
+# A transposed view is read without copying
+c = numpy.arange(12.0).reshape(3, 4)
+assert module.trace(c.T) == numpy.trace(c.T)
+assert module.trace(c[::-1, :]) == numpy.trace(c[::-1, :])
+
+# A Fortran ordered array is filled in place
+f = numpy.zeros((3, 4), order='F')
+module.fill_columns(f)
+assert (f == numpy.arange(4.0)).all()
+
+# Fortran ordered view of a C ordered array
+g = numpy.zeros((4, 3))
+module.fill_columns(g.T)
+assert (g.T == numpy.arange(4.0)).all()
+
+# C ordered arrays are rejected in place, but converted when read only
+try:
+    module.fill_columns(numpy.zeros((3, 4)))
+    raise RuntimeError("Expected a TypeError")
+except TypeError:
+    pass
+h = numpy.arange(12.0).reshape(3, 4)
+assert module.first_column_sum(h) == h[:, 0].sum()
+assert module.first_column_sum(numpy.asfortranarray(h)) == h[:, 0].sum()
+
+print("Strided and Fortran ordered arrays passed without copying.")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+from instant import inline_module_with_numpy
+
+# Array dimensions passed as 64-bit integers
+c_code = """
+double sum(npy_intp n, double* x) {
+  double tmp = 0.0;
+  for (npy_intp i=0; i<n; i++)
+    tmp += x[i];
+  return tmp;
+}
+
+int dim_size(npy_intp n1, npy_intp n2, float* y) {
+  for (npy_intp i=0; i<n1*n2; i++)
+    y[i] = 2*y[i];
+  return sizeof(n1);
+}
+
+void fill(int64_t n, long* z) {
+  for (int64_t i=0; i<n; i++)
+    z[i] = i;
+}
+
+double total(int nd, npy_intp* dims, double* t) {
+  npy_intp size = 1;
+  for (int d=0; d<nd; d++)
+    size *= dims[d];
+  double tmp = 0.0;
+  for (npy_intp i=0; i<size; i++)
+    tmp += t[i];
+  return tmp;
+}
+"""
+
+module = inline_module_with_numpy(c_code,
+                                  arrays=[['n', 'x', 'in', 'npy_intp'],
+                                          ['n1', 'n2', 'y', 'float', 'npy_intp'],
+                                          ['n', 'z', 'out', 'long', 'int64_t'],
+                                          ['nd', 'dims', 't', 'multi', 'npy_intp']],
+                                  cache_dir="test_cache")
+
+x = numpy.arange(10.0)
+assert module.sum(x) == x.sum()
+
+y = numpy.ones((3, 4), dtype='float32')
+assert module.dim_size(y) == 8
+assert (y == 2).all()
+
+z = module.fill(5)
+assert (z == numpy.arange(5)).all()
+
+t = numpy.ones((2, 3, 4, 5))
+assert module.total(t) == t.size
+
+print("Arrays passed with 64-bit dimensions.")
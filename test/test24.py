@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+from instant import inline_with_numpy, inline_module_with_numpy
+
+# A function template compiled for several data types in one module
+c_code = """
+template <typename T>
+T sum(int n, T* x) {
+  T tmp = 0;
+  for (int i=0; i<n; i++)
+    tmp += x[i];
+  return tmp;
+}
+"""
+
+types = ['float', 'double', 'int', 'long long']
+sum_func = inline_with_numpy(c_code, arrays=[['n', 'x', 'in', 'generic']],
+                             generic_types=types, cache_dir="test_cache")
+
+for dtype in ['float32', 'float64', 'int32', 'int64']:
+    x = numpy.arange(10, dtype=dtype)
+    s = sum_func(x)
+    assert s == 45, (dtype, s)
+
+# Lists are passed to the first specialization
+assert sum_func([1.5, 2.5]) == 4.0
+
+try:
+    sum_func(numpy.arange(10, dtype='int16'))
+    raise RuntimeError("Expected a TypeError")
+except TypeError:
+    pass
+
+# In-place arrays, including complex data
+c_code = """
+template <class T>
+void scale(int n, T* y, double f) {
+  for (int i=0; i<n; i++)
+    y[i] *= f;
+}
+"""
+
+types = ['float', 'double', 'std::complex<double>']
+module = inline_module_with_numpy(c_code, arrays=[['n', 'y', 'generic']],
+                                  generic_types=types, cache_dir="test_cache")
+
+for dtype in ['float32', 'float64', 'complex128']:
+    y = numpy.ones(5, dtype=dtype)
+    module.scale(y, 3.0)
+    assert (y == 3).all() and y.dtype == dtype, (dtype, y)
+module.scale_double(y.real.copy(), 2.0)
+
+# Dispatching on the generic array, not on arrays of fixed type before it
+c_code = """
+template <typename T>
+void count(int n, int* idx, int m, T* x) {
+  for (int i=0; i<n; i++)
+    x[idx[i]] += 1;
+}
+"""
+
+count = inline_with_numpy(c_code, arrays=[['n', 'idx', 'in', 'int'], ['m', 'x', 'generic']],
+                          generic_types=['float', 'double'], cache_dir="test_cache")
+for dtype in ['float32', 'float64']:
+    x = numpy.zeros(3, dtype=dtype)
+    count(numpy.array([0, 2, 2], dtype='int32'), x)
+    assert (x == [1, 0, 2]).all(), (dtype, x)
+
+print("Function templates specialized for several data types.")
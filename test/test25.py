@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os, mmap, array, tempfile
+import numpy
+from instant import inline_module_with_numpy
+
+# Objects exporting the buffer protocol are passed without copying
+c_code = """
+double sum(int n, double* x) {
+  double tmp = 0.0;
+  for (int i=0; i<n; i++)
+    tmp += x[i];
+  return tmp;
+}
+
+void scale(int n, double* y, double f) {
+  for (int i=0; i<n; i++)
+    y[i] *= f;
+}
+
+double trace(int n, int m, double* z) {
+  double tmp = 0.0;
+  for (int i=0; i<n && i<m; i++)
+    tmp += z[i*m + i];
+  return tmp;
+}
+"""
+
+module = inline_module_with_numpy(c_code,
+                                  arrays=[['n', 'x', 'buffer', 'in'],
+                                          ['n', 'y', 'buffer'],
+                                          ['n', 'm', 'z', 'buffer', 'in']],
+                                  cache_dir="test_cache")
+
+x = numpy.arange(10.0)
+assert module.sum(x) == 45
+assert module.sum(memoryview(x)) == 45
+assert module.sum(array.array('d', range(10))) == 45
+assert module.sum(x.tobytes()) == 45
+assert module.trace(numpy.eye(4)) == 4
+
+# Byte buffers are reinterpreted and modified in place
+b = bytearray(x.tobytes())
+module.scale(b, 2.0)
+assert (numpy.frombuffer(b) == 2*x).all()
+
+# Memory mapped files
+fd, filename = tempfile.mkstemp()
+os.close(fd)
+try:
+    m = numpy.memmap(filename, dtype='float64', mode='w+', shape=(10,))
+    m[:] = x
+    module.scale(m, 3.0)
+    m.flush()
+    with open(filename, "r+b") as f:
+        mm = mmap.mmap(f.fileno(), 0)
+        assert module.sum(mm) == 3*45
+        module.scale(mm, 2.0)
+        mm.close()
+    assert (numpy.fromfile(filename) == 6*x).all()
+    del m
+finally:
+    os.remove(filename)
+
+# Read only and wrongly typed buffers are rejected
+for arg in [x.tobytes(), numpy.arange(10, dtype='int32')]:
+    try:
+        module.scale(arg, 2.0)
+        raise RuntimeError("Expected an error")
+    except (TypeError, BufferError):
+        pass
+
+print("Buffers passed without copying.")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import sys
+import numpy
+from instant import inline_module_with_numpy
+
+# Output arrays are either allocated with a given shape,
+# or supplied by the caller and reused
+c_code = """
+void time_step(int n, double* p, int m, double* q, double dt) {
+  for (int i=0; i<n && i<m; i++)
+    q[i] = p[i] + dt*p[i];
+}
+
+void outer(int n, double* x, int n1, int n2, double* a) {
+  for (int i=0; i<n1; i++)
+    for (int j=0; j<n2; j++)
+      a[i*n2 + j] = x[i % n]*x[j % n];
+}
+
+double fill(int nd, int* dims, double* b) {
+  int size = 1;
+  for (int d=0; d<nd; d++)
+    size *= dims[d];
+  for (int i=0; i<size; i++)
+    b[i] = i;
+  return size;
+}
+"""
+
+module = inline_module_with_numpy(c_code,
+                                  arrays=[['n', 'p', 'in'],
+                                          ['m', 'q', 'out'],
+                                          ['n', 'x', 'in'],
+                                          ['n1', 'n2', 'a', 'out'],
+                                          ['nd', 'dims', 'b', 'out', 'multi']],
+                                  cache_dir="test_cache")
+
+# Allocated from a size, as before
+p = numpy.ones(5)
+q = module.time_step(p, 5, 0.5)
+assert (q == 1.5).all()
+
+# Written into the caller's buffer, which is also returned
+buf = numpy.zeros(5)
+for i in range(3):
+    r = module.time_step(p, buf, 0.5)
+    assert r is buf
+assert (buf == 1.5).all()
+
+# Multi-dimensional output arrays
+x = numpy.arange(3.0)
+a = module.outer(x, (3, 3))
+assert a.shape == (3, 3) and (a == numpy.outer(x, x)).all()
+out = numpy.empty((3, 3))
+assert module.outer(x, out) is out and (out == a).all()
+
+size, b = module.fill((2, 3, 4, 5))
+assert size == 120 and b.shape == (2, 3, 4, 5)
+assert (b.ravel() == numpy.arange(120)).all()
+out = numpy.empty((2, 2, 2, 2, 2))
+size, c = module.fill(out)
+assert c is out and size == 32
+
+# Wrong shapes and non-contiguous buffers are rejected
+for arg in [(3,), numpy.empty(9), numpy.empty((3, 6))[:, ::2]]:
+    try:
+        module.outer(x, arg)
+        raise RuntimeError("Expected a TypeError")
+    except TypeError:
+        pass
+
+# Arrays may be named like flags
+c_code = """
+void twice(int n, double* out) {
+  for (int i=0; i<n; i++)
+    out[i] *= 2;
+}
+
+void copy(int k, double* x, int m, double* out) {
+  for (int i=0; i<k && i<m; i++)
+    out[i] = x[i];
+}
+"""
+named = inline_module_with_numpy(c_code, arrays=[['n', 'out'], ['k', 'x', 'in'],
+                                                 ['m', 'out', 'out']],
+                                 cache_dir="test_cache")
+y = numpy.ones(3)
+named.twice(y)
+assert (y == 2).all()
+assert (named.copy(y, 3) == 2).all()
+
+# Specifications which may be read both ways are rejected
+try:
+    inline_module_with_numpy("void f(int n, double* x, double* out) {}",
+                             arrays=[['n', 'x', 'out']], cache_dir="test_cache")
+    raise AssertionError("Expected a RuntimeError")
+except RuntimeError as e:
+    assert "Ambiguous" in str(e)
+
+# Rejected arrays are left intact and keep their references
+for bad in [numpy.empty(9), numpy.zeros((3, 3), dtype=numpy.dtype("float64").newbyteorder())]:
+    refs = sys.getrefcount(bad)
+    try:
+        module.outer(x, bad)
+        raise RuntimeError("Expected a TypeError")
+    except TypeError:
+        pass
+    assert sys.getrefcount(bad) == refs
+    bad[...] = 1
+    assert bad.sum() == bad.size
+
+print("Output arrays allocated or reused.")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import gc
+import numpy
+from instant import inline_module_with_numpy
+
+# Memory allocated in C is returned as NumPy arrays without copying
+c_code = """
+int freed_count = 0;
+
+void count_free(void* p) {
+  freed_count++;
+  free(p);
+}
+
+int freed() {
+  return freed_count;
+}
+
+void primes(int limit, int* n, int** p) {
+  *n = 0;
+  *p = (int*) malloc(limit*sizeof(int));
+  for (int i=2; i<limit; i++) {
+    bool prime = true;
+    for (int j=2; j*j<=i && prime; j++)
+      prime = i % j != 0;
+    if (prime)
+      (*p)[(*n)++] = i;
+  }
+}
+
+void table(int rows, int* n1, int* n2, double** t) {
+  *n1 = rows;
+  *n2 = 3;
+  *t = (double*) malloc(rows*3*sizeof(double));
+  for (int i=0; i<rows*3; i++)
+    (*t)[i] = i;
+}
+
+void nothing(int* n, double** e) {
+  *n = 0;
+  *e = NULL;
+}
+"""
+
+module = inline_module_with_numpy(c_code,
+                                  arrays=[['n', 'p', 'owned', 'int', 'dealloc=count_free'],
+                                          ['n1', 'n2', 't', 'owned'],
+                                          ['n', 'e', 'owned']],
+                                  cache_dir="test_cache")
+
+p = module.primes(30)
+assert (p == [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]).all()
+assert p.base is not None
+assert module.freed() == 0
+del p
+gc.collect()
+assert module.freed() == 1
+
+t = module.table(4)
+assert t.shape == (4, 3) and (t.ravel() == numpy.arange(12)).all()
+
+e = module.nothing()
+assert e.shape == (0,)
+
+print("Arrays returned from C-owned memory without copying.")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+from instant import inline_module_with_numpy
+
+# Arrays with any number of dimensions and data type are passed without copying
+c_code = """
+long count(int nd, npy_intp* dims, const float* x) {
+  long n = 1;
+  for (int d=0; d<nd; d++)
+    n *= dims[d];
+  return n;
+}
+
+void twice(int nd, int* dims, int* array1) {
+  long n = 1;
+  for (int d=0; d<nd; d++)
+    n *= dims[d];
+  for (long i=0; i<n; i++)
+    array1[i] *= 2;
+}
+
+double diagonal(int nd, int* dims, int* strides, double* y) {
+  double s = 0;
+  for (int i=0; i<dims[0]; i++) {
+    long offset = 0;
+    for (int d=0; d<nd; d++)
+      offset += i*strides[d];
+    s += y[offset];
+  }
+  return s;
+}
+"""
+
+m = inline_module_with_numpy(c_code,
+                             arrays=[['nd', 'dims', 'x', 'in', 'multi', 'float', 'npy_intp'],
+                                     ['nd', 'dims', 'array1', 'multi', 'int'],
+                                     ['nd', 'dims', 'strides', 'y', 'multi']],
+                             cache_dir="test_cache")
+
+# Input arrays of other types are converted
+a = numpy.arange(120, dtype=numpy.int16).reshape(2, 3, 4, 5)
+assert m.count(a) == 120
+assert m.count(a[:, ::2]) == 80
+
+# In-place arrays are modified without copying
+b = numpy.arange(32, dtype=numpy.intc).reshape(2, 2, 2, 2, 2)
+m.twice(b)
+assert (b == 2*numpy.arange(32).reshape(b.shape)).all()
+
+for bad in [numpy.zeros((2, 2, 2, 2)), b[:, ::2], b.byteswap().newbyteorder()]:
+    try:
+        m.twice(bad)
+    except (TypeError, ValueError):
+        pass
+    else:
+        raise AssertionError("Invalid array accepted")
+
+# Strides make it possible to pass views
+c = numpy.arange(3.0**4).reshape(3, 3, 3, 3)
+assert m.diagonal(c) == sum(c[i, i, i, i] for i in range(3))
+assert m.diagonal(c[::2, ::2, ::2, ::2]) == c[0, 0, 0, 0] + c[2, 2, 2, 2]
+
+print("Successfully passed arrays with any number of dimensions")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+from instant import inline_module_with_numpy
+
+# Trusted arrays are passed by only extracting their data pointers and shapes
+c_code = """
+double dot(int n, double* x, int m, double* y) {
+  double s = 0;
+  for (int i=0; i<n; i++)
+    s += x[i]*y[i];
+  return s;
+}
+
+void scale(int m, int n, float* a, float factor) {
+  for (int i=0; i<m*n; i++)
+    a[i] *= factor;
+}
+
+long count(int nd, npy_intp* dims, int* b) {
+  long n = 1;
+  for (int d=0; d<nd; d++)
+    n *= dims[d];
+  return n;
+}
+"""
+
+arrays = [['n', 'x', 'in', 'trusted'],
+          ['m', 'y', 'in', 'trusted'],
+          ['m', 'n', 'a', 'trusted', 'float'],
+          ['nd', 'dims', 'b', 'trusted', 'multi', 'int', 'npy_intp']]
+
+fast = inline_module_with_numpy(c_code, arrays=arrays, cache_dir="test_cache")
+debug = inline_module_with_numpy(c_code, arrays=arrays, cppargs=['-O0', '-DINSTANT_DEBUG'],
+                                 cache_dir="test_cache")
+
+x = numpy.arange(5.0)
+a = numpy.ones((3, 4), dtype=numpy.float32)
+b = numpy.zeros((2, 3, 4, 5), dtype=numpy.intc)
+for m in (fast, debug):
+    assert m.dot(x, x) == 30.0
+    m.scale(a, 2.0)
+    assert m.count(b) == 120
+assert (a == 4.0).all()
+
+# The debug build checks the arguments
+bad_calls = [lambda: debug.dot(numpy.arange(5), x),
+             lambda: debug.dot(x[::2], x[::2]),
+             lambda: debug.scale(a[0], 1.0),
+             lambda: debug.count(b.astype(numpy.int64))]
+for call in bad_calls:
+    try:
+        call()
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("Invalid array accepted")
+
+print("Successfully passed trusted arrays")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import sys
+import numpy
+from instant import inline_module_with_numpy
+
+try:
+    import scipy.sparse
+except ImportError:
+    print("scipy.sparse not available, skipping sparse matrix test")
+    sys.exit(0)
+
+# Sparse matrices are passed to and returned from C without copying
+c_code = """
+void matvec(int m, int n, int* indptr, int* indices, double* data,
+            int k, double* x, int l, double* y) {
+  for (int i=0; i<m; i++) {
+    y[i] = 0;
+    for (int j=indptr[i]; j<indptr[i+1]; j++)
+      y[i] += data[j]*x[indices[j]];
+  }
+}
+
+double colsum(int rows, int cols, int* colptr, int* rowind, double* values, int j) {
+  double s = 0;
+  for (int p=colptr[j]; p<colptr[j+1]; p++)
+    s += values[p];
+  return s;
+}
+
+void scale(int nrows, int ncols, int* rowptr, int* colind, double* entries, double factor) {
+  for (int p=0; p<rowptr[nrows]; p++)
+    entries[p] *= factor;
+}
+
+void identity(int size, int* m, int* n, int** indptr, int** indices, double** data) {
+  *m = *n = size;
+  *indptr = (int*) malloc((size + 1)*sizeof(int));
+  *indices = (int*) malloc(size*sizeof(int));
+  *data = (double*) malloc(size*sizeof(double));
+  for (int i=0; i<size; i++) {
+    (*indptr)[i] = i;
+    (*indices)[i] = i;
+    (*data)[i] = 1.0;
+  }
+  (*indptr)[size] = size;
+}
+"""
+
+m = inline_module_with_numpy(c_code,
+                             arrays=[['m', 'n', 'indptr', 'indices', 'data', 'csr', 'in'],
+                                     ['k', 'x', 'in'], ['l', 'y'],
+                                     ['rows', 'cols', 'colptr', 'rowind', 'values', 'csc', 'in'],
+                                     ['nrows', 'ncols', 'rowptr', 'colind', 'entries', 'csr'],
+                                     ['m', 'n', 'indptr', 'indices', 'data', 'csr', 'owned']],
+                             cache_dir="test_cache")
+
+A = scipy.sparse.random(5, 4, density=0.5, format='csr', random_state=1)
+x = numpy.arange(4.0)
+y = numpy.zeros(5)
+m.matvec(A, x, y)
+assert numpy.allclose(y, A.dot(x))
+
+B = A.tocsc()
+for j in range(4):
+    assert numpy.allclose(m.colsum(B, j), A[:, j].sum())
+
+for wrong in [B, A.todense()]:
+    try:
+        m.matvec(wrong, x, y)
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("Wrong matrix format accepted")
+
+# In-place modification requires arrays of the right types
+C = A.copy()
+m.scale(C, 2.0)
+assert numpy.allclose(C.toarray(), 2*A.toarray())
+try:
+    m.scale(A.astype(numpy.float32), 2.0)
+except TypeError:
+    pass
+else:
+    raise AssertionError("Wrong data type accepted")
+
+I = m.identity(3)
+assert I.format == 'csr' and I.shape == (3, 3)
+assert (I.toarray() == numpy.eye(3)).all()
+
+print("Successfully passed sparse matrices")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+from instant import inline_module_with_numpy
+
+# Arrays with record data types are passed as pointers to C structs
+c_code = """
+struct Particle {
+  float mass;
+  double x[3];  // position
+  int id;
+};
+
+double total_mass(int n, Particle* particles) {
+  double m = 0;
+  for (int i=0; i<n; i++)
+    m += particles[i].mass;
+  return m;
+}
+
+void move(int n, Particle* p, double dx) {
+  for (int i=0; i<n; i++)
+    p[i].x[0] += dx;
+}
+"""
+
+m = inline_module_with_numpy(c_code,
+                             arrays=[['n', 'particles', 'in', 'struct=Particle'],
+                                     ['n', 'p', 'struct=Particle']],
+                             cache_dir="test_cache")
+
+particle = numpy.dtype([('mass', numpy.float32), ('x', numpy.float64, (3,)),
+                        ('id', numpy.intc)], align=True)
+a = numpy.zeros(4, dtype=particle)
+a['mass'] = [1.0, 2.0, 3.0, 4.0]
+assert m.total_mass(a) == 10.0
+m.move(a, 0.5)
+assert (a['x'][:, 0] == 0.5).all() and (a['x'][:, 1] == 0.0).all()
+
+# Read-only arrays can be passed when marked 'in'
+a.flags.writeable = False
+assert m.total_mass(a) == 10.0
+
+# Layouts that do not match the struct are rejected
+packed = numpy.dtype([('mass', numpy.float32), ('x', numpy.float64, (3,)),
+                      ('id', numpy.intc)])
+renamed = numpy.dtype([('m', numpy.float32), ('x', numpy.float64, (3,)),
+                       ('id', numpy.intc)], align=True)
+swapped = numpy.dtype([('id', numpy.intc), ('x', numpy.float64, (3,)),
+                       ('mass', numpy.float32)], align=True)
+for dtype in [packed, renamed, swapped, numpy.float64]:
+    try:
+        m.total_mass(numpy.zeros(4, dtype=dtype))
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("Wrong record layout accepted")
+
+print("Successfully passed record arrays as structs")
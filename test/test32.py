@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+from instant import inline_module_with_numpy
+
+# Lists of arrays with different lengths are passed in a single call
+c_code = """
+void sums(int count, int* lengths, double** arrays, int n, double* result) {
+  for (int i=0; i<count; i++) {
+    result[i] = 0;
+    for (int j=0; j<lengths[i]; j++)
+      result[i] += arrays[i][j];
+  }
+}
+
+void normalize(int k, int* sizes, float** data) {
+  for (int i=0; i<k; i++) {
+    float m = 0;
+    for (int j=0; j<sizes[i]; j++)
+      m = data[i][j] > m ? data[i][j] : m;
+    for (int j=0; j<sizes[i]; j++)
+      data[i][j] /= m;
+  }
+}
+"""
+
+m = inline_module_with_numpy(c_code,
+                             arrays=[['count', 'lengths', 'arrays', 'ragged', 'in'],
+                                     ['n', 'result'],
+                                     ['k', 'sizes', 'data', 'ragged', 'float']],
+                             cache_dir="test_cache")
+
+# Input arrays are converted if needed
+arrays = [numpy.arange(float(i)) for i in range(100)] + [[1, 2, 3], numpy.ones((2, 3))]
+result = numpy.zeros(len(arrays))
+m.sums(arrays, result)
+assert (result == [numpy.sum(a) for a in arrays]).all()
+m.sums((), result[:0])
+
+# Arrays modified in place must be of the right type
+data = [numpy.arange(1, i + 2, dtype=numpy.float32) for i in range(10)]
+m.normalize(data)
+assert all(a[-1] == 1.0 for a in data)
+for bad in [[numpy.ones(3)], [numpy.ones(4, dtype=numpy.float32)[::2]], numpy.ones(3)]:
+    try:
+        m.normalize(bad)
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("Invalid list of arrays accepted")
+
+print("Successfully passed lists of arrays")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import sys
+import instant
+from instant import inline_module
+
+# Pointers to compiled functions are passed to other modules and SciPy
+integrands = inline_module("""
+double square(double x) {
+  return x*x;
+}
+
+/* Integrand with parameters, in the form used by scipy.integrate.quad */
+double polynomial(int n, double* xx) {
+  double s = 0;
+  for (int i=n-1; i>0; i--)
+    s = s*xx[0] + xx[i];
+  return s;
+}
+""", function_pointers=['square', 'polynomial'], cache_dir="test_cache")
+
+integrator = inline_module("""
+double midpoint(double (*f)(double), double a, double b, int n) {
+  double h = (b - a)/n, s = 0;
+  for (int i=0; i<n; i++)
+    s += f(a + (i + 0.5)*h);
+  return s*h;
+}
+""", cache_dir="test_cache")
+
+square = instant.function_pointer(integrands, 'square')
+assert abs(integrator.midpoint(square, 0.0, 1.0, 1000) - 1.0/3) < 1e-6
+
+try:
+    integrator.midpoint(instant.function_pointer(integrands, 'polynomial'), 0.0, 1.0, 10)
+except TypeError:
+    pass
+else:
+    raise AssertionError("Function pointer with wrong signature accepted")
+
+try:
+    import scipy.integrate
+except ImportError:
+    print("scipy not available, skipping LowLevelCallable test")
+    sys.exit(0)
+
+f = instant.low_level_callable(integrands, 'square')
+assert f.signature == "double (double)"
+assert abs(scipy.integrate.quad(f, 0.0, 3.0)[0] - 9.0) < 1e-10
+assert abs(integrator.midpoint(f, 0.0, 1.0, 1000) - 1.0/3) < 1e-6
+
+# Integrate 1 + 2x + 3x^2 from 0 to 1, the parameters follow x
+g = instant.low_level_callable(integrands, 'polynomial')
+assert g.signature == "double (int, double *)"
+assert abs(scipy.integrate.quad(g, 0.0, 1.0, args=(1.0, 2.0, 3.0))[0] - 3.0) < 1e-10
+
+print("Successfully passed function pointers")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+from instant import inline_module_with_numpy
+
+# Modules using OpenMP, with the number of threads set at runtime
+c_code = """
+void compute(int n, double* x, int m, double* y) {
+  #pragma omp parallel for
+  for (int i=0; i<m; i++)
+    y[i] = sin(x[i]) + cos(x[i]) + 3.4*x[i];
+}
+
+int threads_used() {
+  int used = 0;
+  #pragma omp parallel
+  {
+    #pragma omp single
+    used = omp_get_num_threads();
+  }
+  return used;
+}
+"""
+
+m = inline_module_with_numpy(c_code, arrays=[['n', 'x', 'in'], ['m', 'y']],
+                             system_headers=['cmath'], openmp=True, cache_dir="test_cache")
+
+x = numpy.linspace(0, 1, 100000)
+y = numpy.zeros_like(x)
+m.compute(x, y)
+assert numpy.allclose(y, numpy.sin(x) + numpy.cos(x) + 3.4*x)
+
+for n in (1, 3):
+    m.set_num_threads(n)
+    assert m.get_num_threads() == n
+    assert m.threads_used() == n
+
+print("Successfully built module with OpenMP")
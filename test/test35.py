@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+import instant
+
+# Elementwise expressions are compiled to a single loop
+f = instant.compile_expression("sin(x) + cos(y)*a", scalars=['a'], cache_dir="test_cache")
+x = numpy.linspace(0, 1, 1000)
+y = numpy.linspace(1, 2, 1000)
+assert numpy.allclose(f(x, y, 2.0), numpy.sin(x) + numpy.cos(y)*2.0)
+
+# Compiled expressions are cached
+assert instant.compile_expression("sin(x) + cos(y)*a", scalars=['a'], cache_dir="test_cache") is f
+
+# Arrays of any shape are accepted and converted, and results written into out
+out = numpy.empty((10, 100))
+r = f(x.reshape(10, 100), list(y.reshape(10, 100)), 0.5, out=out)
+assert r is out and numpy.allclose(out.ravel(), numpy.sin(x) + numpy.cos(y)*0.5)
+try:
+    f(x, y[:10], 1.0)
+except ValueError:
+    pass
+else:
+    raise AssertionError("Arrays of different shapes accepted")
+
+# Other types and parallel evaluation
+g = instant.compile_expression("n*k + M_PI*0", dtypes={'n': 'int', 'k': 'int'}, openmp=True,
+                               cache_dir="test_cache")
+n = numpy.arange(10, dtype=numpy.intc)
+r = g(n, n)
+assert r.dtype == numpy.intc and (r == n*n).all()
+
+h = instant.compile_expression("sqrt(u*u + v*v)", dtypes='float', cache_dir="test_cache")
+u = numpy.ones(5, dtype=numpy.float32)*3
+v = numpy.ones(5, dtype=numpy.float32)*4
+assert h(u, v).dtype == numpy.float32 and (h(u, v) == 5).all()
+
+# Casts and constants are not variables
+c = instant.compile_expression("x > 0 ? (double)(int)x : NAN", cache_dir="test_cache")
+r = c(numpy.array([-1.0, 2.5]))
+assert numpy.isnan(r[0]) and r[1] == 2.0
+assert instant.expression_variables("(float)x*DBL_EPSILON + INT_MAX + y") == ['x', 'y']
+
+print("Successfully compiled expressions")
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+import instant
+
+# Reductions of elementwise expressions, serial and parallel
+x = numpy.linspace(-1, 2, 100001)
+y = numpy.cos(x)
+
+for openmp in (False, True):
+    for deterministic in (False, True):
+        options = dict(openmp=openmp, deterministic=deterministic, cache_dir="test_cache")
+        assert numpy.allclose(instant.compile_reduction('sum', **options)(x), x.sum())
+        assert numpy.allclose(instant.compile_reduction('dot', **options)(x, y), x.dot(y))
+        assert instant.compile_reduction('min', **options)(y) == y.min()
+        assert instant.compile_reduction('max', 'x*x', **options)(x) == (x*x).max()
+        assert numpy.allclose(instant.compile_reduction('norm2', **options)(x),
+                              numpy.linalg.norm(x))
+
+# Deterministic reductions do not depend on the number of threads
+f = instant.compile_reduction('sum', 'sin(x)*a', scalars=['a'], openmp=True,
+                              deterministic=True, cache_dir="test_cache")
+results = set()
+for n in (1, 2, 3, 7):
+    f.module.set_num_threads(n)
+    results.add(f(x, 0.1))
+assert len(results) == 1
+
+# Other types and user-supplied combinations
+n = numpy.arange(1, 11, dtype=numpy.intc)
+assert instant.compile_reduction('prod', dtypes='int', cache_dir="test_cache")(n) == 3628800
+assert instant.compile_reduction('norminf', dtypes='unsigned int',
+                                 cache_dir="test_cache")(n.astype(numpy.uintc)) == 10
+assert instant.compile_reduction('norm1', dtypes='std::complex<double>',
+                                 cache_dir="test_cache")([3+4j, 1j]) == 6.0
+xor = instant.compile_reduction(('0', 'a ^ b'), dtypes='int', openmp=True, cache_dir="test_cache")
+assert xor(n) == numpy.bitwise_xor.reduce(n)
+
+try:
+    instant.compile_reduction('min', cache_dir="test_cache")([])
+except ValueError:
+    pass
+else:
+    raise AssertionError("Minimum of empty array computed")
+
+print("Successfully compiled reductions")
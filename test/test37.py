@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+import instant
+
+# Stencil updates in tiled loops on 2D and 3D grids
+jacobi = instant.compile_stencil("0.25*(u(-1,0) + u(1,0) + u(0,-1) + u(0,1) - h*h*f)",
+                                 scalars=['h'], tile=(8, 16), cache_dir="test_cache")
+n = 50
+u = numpy.random.rand(n, n)
+f = numpy.random.rand(n, n)
+h = 0.1
+expected = u.copy()
+expected[1:-1, 1:-1] = 0.25*(u[:-2, 1:-1] + u[2:, 1:-1] + u[1:-1, :-2] + u[1:-1, 2:]
+                             - h*h*f[1:-1, 1:-1])
+assert numpy.allclose(jacobi(u, h, f), expected)
+
+# The grid indices can be used, and results written into out
+out = numpy.zeros((n, n))
+grid = instant.compile_stencil("sin(u + i*h + j*h)", scalars=['h'], radius=0, openmp=True,
+                               cache_dir="test_cache")
+assert grid(u, h, out=out) is out
+x = numpy.arange(n)*h
+assert numpy.allclose(out, numpy.sin(u + x[:, None] + x[None, :]))
+
+laplace = instant.compile_stencil("u(-1,0,0) + u(1,0,0) + u(0,-1,0) + u(0,1,0) + "
+                                  "u(0,0,-1) + u(0,0,1) - 6*u", ndim=3, dtypes='float',
+                                  openmp=True, cache_dir="test_cache")
+v = numpy.random.rand(20, 30, 40).astype(numpy.float32)
+r = laplace(v)
+interior = (v[:-2, 1:-1, 1:-1] + v[2:, 1:-1, 1:-1] + v[1:-1, :-2, 1:-1] + v[1:-1, 2:, 1:-1] +
+            v[1:-1, 1:-1, :-2] + v[1:-1, 1:-1, 2:] - 6*v[1:-1, 1:-1, 1:-1])
+assert r.dtype == numpy.float32 and numpy.allclose(r[1:-1, 1:-1, 1:-1], interior, atol=1e-5)
+assert (r[0] == v[0]).all() and (r[:, :, -1] == v[:, :, -1]).all()
+
+# Calls of functions with integers are not neighbour accesses
+assert instant.stencil_offsets("0.5*sqrt(2)*u(1,0) + exp(1) + u") == {'u': [(1, 0)]}
+shift = instant.compile_stencil("0.5*sqrt(2)*u(1,0) + u", cache_dir="test_cache")
+expected = u.copy()
+expected[1:-1, 1:-1] = 0.5*numpy.sqrt(2)*u[2:, 1:-1] + u[1:-1, 1:-1]
+assert numpy.allclose(shift(u), expected)
+
+try:
+    jacobi(u[:10], h, f)
+except ValueError:
+    pass
+else:
+    raise AssertionError("Arrays of different shapes accepted")
+
+# Updating an array in place is not a Jacobi step
+try:
+    jacobi(u, h, f, out=u)
+except ValueError:
+    pass
+else:
+    raise AssertionError("Output array sharing memory with an input accepted")
+
+print("Successfully compiled stencils")
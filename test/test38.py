@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+import instant
+
+# Sequences of elementwise expressions are fused to a single loop
+x = numpy.linspace(0, 1, 1000)
+f = instant.fuse_expressions([('t', 'sin(x) + a'), ('y', 't*t + x')], scalars=['a'],
+                             cache_dir="test_cache")
+t = numpy.sin(x) + 0.5
+assert numpy.allclose(f(x, 0.5), t*t + x)
+
+# Compiled expressions can be fused, with several outputs and types
+scale = instant.compile_expression("2*x", cache_dir="test_cache")
+g = instant.fuse_expressions([('u', scale), ('n', 'u > 1'), ('v', 'u*z')],
+                             outputs=['n', 'v'], dtypes={'n': 'int'}, openmp=True,
+                             cache_dir="test_cache")
+z = numpy.arange(1000.0)
+n, v = g(x, z)
+assert n.dtype == numpy.intc and (n == (2*x > 1)).all()
+assert numpy.allclose(v, 2*x*z)
+
+out = (numpy.empty(1000, dtype=numpy.intc), numpy.empty(1000))
+assert g(x, z, out=out) is out
+
+try:
+    instant.fuse_expressions([('a', 'b + x'), ('b', 'x*x')])
+except AssertionError:
+    pass
+else:
+    raise AssertionError("Step used before it is computed")
+
+print("Successfully fused expressions")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+import instant
+
+# Kernels are applied to streams of chunks, read ahead in a background thread
+def chunks(n, size):
+    for i in range(n):
+        yield numpy.arange(i*size, (i + 1)*size, dtype=numpy.float64)
+
+f = instant.compile_expression("sqrt(x*x + y*y)", cache_dir="test_cache")
+results = list(instant.stream(f, ((x, 2*x) for x in chunks(10, 1000)), prefetch=2))
+x = numpy.arange(10000.0)
+assert numpy.allclose(numpy.concatenate(results), numpy.sqrt(5)*x)
+
+# Reductions carry their result across chunks
+norm = instant.compile_reduction('norm2', cache_dir="test_cache")
+assert numpy.isclose(instant.stream_reduce(norm, chunks(10, 1000)), numpy.linalg.norm(x))
+total = instant.compile_reduction('sum', cache_dir="test_cache")
+assert instant.stream_reduce(total, chunks(10, 1000), initial=1.0) == x.sum() + 1.0
+count = instant.compile_reduction(('0', 'a + b'), 'x > 5000', cache_dir="test_cache")
+assert instant.stream_reduce(count, chunks(10, 1000), combine=lambda a, b: a + b) == 4999
+
+# Errors while reading are raised in the caller
+def failing():
+    yield numpy.ones(10)
+    raise IOError("Lost connection")
+try:
+    list(instant.stream(f, ((c, c) for c in failing())))
+except IOError as e:
+    assert "Lost connection" in str(e)
+else:
+    raise AssertionError("Error while reading not raised")
+
+# Stopping early is possible
+for r in instant.stream(f, ((c, c) for c in chunks(1000, 10))):
+    break
+
+print("Successfully streamed chunks")
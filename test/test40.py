@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os, shutil, tempfile
+import numpy
+import instant
+
+# Kernels are applied to memory mapped files in windows
+code = """
+void scale(int n, double* x, int m, float* y)
+{
+  for (int i=0; i<n; i++)
+    y[i] = 2*x[i];
+}
+"""
+scale = instant.inline_with_numpy(code, arrays=[['n', 'x', 'in'], ['m', 'y', 'float']],
+                                  release_gil=True, cache_dir="test_cache")
+
+directory = tempfile.mkdtemp()
+try:
+    x = numpy.arange(300000.0)
+    path = os.path.join(directory, "x.raw")
+    with open(path, "wb") as f:
+        f.write(b"header" + b"\0"*10)
+        f.write(x.tobytes())
+
+    # Windows not aligned to pages, in parallel
+    output = os.path.join(directory, "y.raw")
+    instant.mmap_apply(scale, path, output, output_dtype="float32", offset=16,
+                       window_size=100000, workers=3)
+    y = numpy.fromfile(output, dtype=numpy.float32)
+    assert (y == 2*x).all()
+
+    # Reductions over several files
+    total = instant.compile_expression("x*y", cache_dir="test_cache")
+    dot = lambda a, b: float(total(a, b).sum())
+    r = instant.mmap_apply(dot, [path, path], offset=16, window_size=1 << 20,
+                           combine=lambda a, b: a + b)
+    assert numpy.isclose(r, numpy.dot(x, x))
+    assert len(instant.mmap_apply(len, path, offset=16, window_size=80000)) == 30
+
+    # Files must have the same number of items
+    try:
+        instant.mmap_apply(dot, [path, output], offset=16)
+    except AssertionError as e:
+        assert "does not have" in str(e)
+    else:
+        raise AssertionError("Files of different sizes not detected")
+finally:
+    shutil.rmtree(directory)
+
+print("Successfully processed memory mapped files")
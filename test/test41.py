@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import numpy
+import instant
+
+# Kernels are applied to slices of the arrays in parallel threads
+f = instant.compile_expression("sqrt(x*x + y*y)", cache_dir="test_cache")
+x = numpy.arange(100001.0)
+assert numpy.allclose(instant.parallel_map(f, (x, 2*x), workers=4), numpy.sqrt(5)*x)
+assert numpy.allclose(instant.parallel_map(f, (x[:3], x[:3]), workers=8), numpy.sqrt(2)*x[:3])
+
+# Slicing along other axes, with scalar arguments passed to all slices
+g = instant.compile_expression("a*x", scalars=['a'], cache_dir="test_cache")
+A = numpy.arange(12.0).reshape(3, 4)
+assert (instant.parallel_map(g, (3.0, A), axis=1, workers=2) == 3*A).all()
+
+# Kernels updating arrays in place
+code = """
+void square(int n, double* x)
+{
+  for (int i=0; i<n; i++)
+    x[i] *= x[i];
+}
+"""
+square = instant.inline_with_numpy(code, arrays=[['n', 'x']], release_gil=True,
+                                   cache_dir="test_cache")
+y = x.copy()
+assert instant.parallel_map(square, y, workers=3, parts=7) is None
+assert (y == x*x).all()
+
+# Tuples of arrays are concatenated element by element
+r = instant.parallel_map(lambda x: (x*2, x + 1), numpy.arange(4.0), workers=2)
+assert isinstance(r, tuple) and len(r) == 2
+assert (r[0] == 2*numpy.arange(4.0)).all() and (r[1] == numpy.arange(4.0) + 1).all()
+r = instant.parallel_map(lambda x: (x*2, x + 1), numpy.arange(5.0), workers=2)
+assert (r[0] == 2*numpy.arange(5.0)).all() and (r[1] == numpy.arange(5.0) + 1).all()
+try:
+    instant.parallel_map(lambda x: (x, len(x)), x, workers=2)
+    raise RuntimeError("Expected an AssertionError")
+except AssertionError:
+    pass
+
+# Reductions are combined
+total = instant.compile_reduction('sum', cache_dir="test_cache")
+assert instant.parallel_map(total, x, workers=4) == x.sum()
+assert instant.parallel_map(len, x, workers=4, parts=5, combine=max) == 20001
+
+print("Successfully mapped kernels in parallel")
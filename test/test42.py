@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import sys
+import instant
+
+if sys.version_info[0] < 3:
+    print("Skipping test of asyncio, not available")
+    sys.exit(0)
+import asyncio
+
+code = """
+double spin(double seconds)
+{
+  clock_t end = clock() + (clock_t)(seconds*CLOCKS_PER_SEC);
+  double sum = 0;
+  while (clock() < end)
+    sum += 1;
+  return sum > 0 ? seconds : 0.0;
+}
+"""
+spin = instant.awaitable(instant.inline(code, system_headers=["time.h"], release_gil=True,
+                                        cache_dir="test_cache"))
+f = instant.compile_expression("sqrt(x*x + y*y)", cache_dir="test_cache")
+total = instant.compile_reduction('sum', cache_dir="test_cache")
+
+# The coroutines are in a separate module, as Python 2 can not parse them
+from async_kernels import main
+asyncio.run(main(spin, f, total))
+instant.shutdown_async_executor()
+print("Successfully called kernels from coroutines")
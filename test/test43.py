@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import numpy
+import instant
+
+# Kernels with static state, which are not thread safe
+code = """
+static double scratch[1000];
+
+void smooth(int n, double* x)
+{
+  for (int i=0; i<n; i++)
+    scratch[i] = 0.5*(x[i > 0 ? i-1 : i] + x[i < n-1 ? i+1 : i]);
+  for (int i=0; i<n; i++)
+    x[i] = scratch[i];
+}
+
+double total(int m, double* y)
+{
+  double sum = 0;
+  for (int i=0; i<m; i++)
+    sum += y[i];
+  return sum;
+}
+
+void twice(int k, double* a, int l, double* b)
+{
+  for (int i=0; i<k; i++)
+    b[i] = 2*a[i];
+}
+
+long process_id()
+{
+  return (long)getpid();
+}
+"""
+
+def main():
+    module = instant.inline_module_with_numpy(code, arrays=[['n', 'x'], ['m', 'y', 'in'],
+                                                      ['k', 'a', 'in'], ['l', 'b', 'out']],
+                                              system_headers=["unistd.h"],
+                                              cache_dir="test_cache")
+    x = numpy.arange(2000.0)**2
+    with instant.ProcessPool(module, workers=2) as pool:
+        # Arrays in shared memory are updated in place by the workers
+        shared = pool.shared(x)
+        pool.map("smooth", [(shared[:1000],), (shared[1000:],)])
+        expected = x.copy()
+        for part in (expected[:1000], expected[1000:]):
+            part[:] = 0.5*(numpy.concatenate((part[:1], part[:-1])) +
+                           numpy.concatenate((part[1:], part[-1:])))
+        assert numpy.allclose(shared, expected)
+
+        # Strided views and scalar results
+        y = pool.array((4, 10))
+        y[:] = numpy.arange(40.0).reshape(4, 10)
+        assert pool.submit("total", y[:, 3]).result() == 3 + 13 + 23 + 33
+        assert pool.map("total", [(y[i],) for i in range(4)]) == [y[i].sum() for i in range(4)]
+        assert pool.submit("process_id").result() != os.getpid()
+
+        # Output arrays in shared memory are returned without copying
+        b = pool.array(10)
+        r = pool.submit("twice", y[1], b).result()
+        assert numpy.shares_memory(r, b) and (b == 2*y[1]).all()
+
+        # Other arrays are not copied to the workers
+        try:
+            pool.submit("total", x)
+        except AssertionError as e:
+            assert "ProcessPool.shared" in str(e)
+        else:
+            raise AssertionError("Array not in shared memory accepted")
+
+    # Arrays stay valid after the pool is closed
+    assert numpy.allclose(shared, expected) and (r == 2*y[1]).all()
+    del shared, y, b, r
+
+    # Modules can also be given by name
+    with instant.ProcessPool(module.__name__, workers=1, cache_dir="test_cache") as pool:
+        assert pool.submit("total", pool.shared(x[:10])).result() == x[:10].sum()
+    print("Successfully called kernels in processes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import gc, os, weakref
+import instant
+
+class Signature(object):
+    "A signature object, which the memory cache holds by weak references."
+    def __init__(self, name):
+        self.name = name
+    def signature(self):
+        return "((instant unittest test44.py %s))" % self.name
+
+code = "double value_%d() { return %d; }"
+instant.clear_memory_cache()
+instant.set_memory_cache_size(2)
+try:
+    signatures = [Signature(i) for i in range(3)]
+    modules = [instant.build_module(code=code % (i, i), signature=s, cache_dir="test_cache")
+               for i, s in enumerate(signatures)]
+    assert [getattr(m, "value_%d" % i)() for i, m in enumerate(modules)] == [0, 1, 2]
+
+    # The least recently used module is evicted
+    info = instant.memory_cache_info()
+    assert info.size == 2 and info.maxsize == 2 and info.evictions == 1, info
+    assert instant.memory_cached_modules() == modules[1:]
+
+    # Cached modules are hits, others are imported from disk again
+    hits, misses = info.hits, info.misses
+    assert instant.import_module(signatures[1], cache_dir="test_cache") is modules[1]
+    assert instant.import_module(Signature(2), cache_dir="test_cache") is modules[2]
+    assert instant.import_module(signatures[0], cache_dir="test_cache").value_0() == 0
+    info = instant.memory_cache_info()
+    assert (info.hits, info.misses, info.evictions) == (hits + 2, misses + 1, 2), info
+    assert instant.memory_cached_modules()[0] is modules[2]
+
+    # Signature objects are not kept alive by the cache
+    alive = weakref.ref(signatures[2])
+    del signatures[2]
+    gc.collect()
+    assert alive() is None
+
+    # Compiled expressions are evicted with their modules, which are kept
+    # in use while cached
+    instant.clear_memory_cache()
+    expressions = [instant.compile_expression("x*%d" % i, cache_dir="test_cache")
+                   for i in range(3)]
+    assert instant.compile_expression("x*2", cache_dir="test_cache") is expressions[2]
+    paths = [os.path.dirname(os.path.abspath(f.module.__file__)) for f in expressions]
+    assert [p in instant.cache._modules_in_use for p in paths] == [False, True, True]
+    alive = [weakref.ref(f) for f in expressions]
+    del expressions
+    assert instant.compile_expression("x*2", cache_dir="test_cache") is alive[2]()
+    gc.collect()
+    assert alive[0]() is None
+
+    instant.clear_memory_cache()
+    gc.collect()
+    assert [a() for a in alive] == [None, None, None]
+    assert not [p for p in paths if p in instant.cache._modules_in_use]
+    info = instant.memory_cache_info()
+    assert (info.hits, info.misses, info.evictions, info.size) == (0, 0, 0, 0)
+finally:
+    instant.set_memory_cache_size(256)
+
+print("Successfully evicted modules from the memory cache")
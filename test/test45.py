@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os, sys, time, subprocess
+import instant
+
+cache_dir = os.path.abspath(os.path.join("test_cache", "quota"))
+code = "double value_%d() { return %d; }"
+
+def build(i):
+    module = instant.inline_module(code % (i, i), cache_dir=cache_dir)
+    time.sleep(0.05)
+    return module.__name__
+
+def cached():
+    return set(m for m in os.listdir(cache_dir)
+               if os.path.exists(os.path.join(cache_dir, m, "finished_copying")))
+
+# Record every access, also shortly after the last
+instant.cache._access_interval = 0
+
+assert instant.get_disk_cache_quota() == (None, None)
+instant.set_disk_cache_quota(max_size="1.5K")
+assert instant.get_disk_cache_quota() == (1536, None)
+instant.set_disk_cache_quota(max_entries=2)
+assert instant.get_disk_cache_quota() == (1536, 2)
+instant.set_disk_cache_quota(max_size=None)
+assert instant.get_disk_cache_quota() == (None, 2)
+try:
+    # Modules not used by this process are evicted, the least recently used first
+    first = build(0)
+    second = build(1)
+    instant.clear_memory_cache()
+    assert instant.import_module(first, cache_dir=cache_dir).value_0() == 0
+    instant.clear_memory_cache()
+    third = build(2)
+    assert cached() == set([first, third])
+
+    # Modules used by this process are not evicted
+    assert instant.evict_from_disk_cache(cache_dir, max_entries=0) == [first]
+    assert cached() == set([third])
+
+    # Nor modules used by other processes
+    instant.clear_memory_cache()
+    script = ("import sys, time, instant; instant.import_module(%r, cache_dir=%r); "
+              "print('ready'); sys.stdout.flush(); time.sleep(60)" % (third, cache_dir))
+    other = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE)
+    try:
+        assert other.stdout.readline().strip() == b"ready"
+        assert instant.evict_from_disk_cache(cache_dir, max_entries=0) == []
+    finally:
+        other.kill()
+        other.wait()
+        other.stdout.close()
+    assert instant.evict_from_disk_cache(cache_dir, max_entries=0) == [third]
+    assert cached() == set()
+    assert instant.evict_from_disk_cache(cache_dir) == []
+
+    # Evicted modules are moved away before they are removed
+    assert not [m for m in os.listdir(cache_dir) if os.path.isdir(os.path.join(cache_dir, m))]
+
+    # Directories left by failed removals are neither listed nor kept
+    leftover = os.path.join(cache_dir, first + ".0123" + instant.cacheindex._removed_suffix)
+    os.makedirs(leftover)
+    open(os.path.join(leftover, "finished_copying"), "w").close()
+    instant.rebuild_cache_index(cache_dir)
+    assert instant.cached_modules(cache_dir) == []
+    assert instant.evict_from_disk_cache(cache_dir, max_entries=0) == []
+    assert not os.path.exists(leftover)
+finally:
+    instant.set_disk_cache_quota(None, None)
+
+print("Successfully evicted modules from the disk cache")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os, shutil, time
+import instant
+
+cache_dir = os.path.abspath(os.path.join("test_cache", "indexed"))
+code = "double value_%d() { return %d; }"
+signatures = ["((instant unittest test46.py %d))" % i for i in range(2)]
+modules = [instant.build_module(code=code % (i, i), signature=s, cache_dir=cache_dir).__name__
+           for i, s in enumerate(signatures)]
+
+# Modules are listed and looked up in the index
+assert os.path.exists(os.path.join(cache_dir, "instant_cache_index.sqlite"))
+assert instant.cached_modules(cache_dir) == sorted(modules)
+assert instant.lookup_cached_module(signatures[1], cache_dir) == modules[1]
+assert instant.lookup_cached_module(modules[0], cache_dir) == modules[0]
+assert instant.lookup_cached_module("((unknown))", cache_dir) is None
+info = instant.cached_module_info(modules[0], cache_dir)
+assert info["aliases"] == [signatures[0]] and info["size"] > 0
+assert info["toolchain"].startswith("swig %s" % instant.get_swig_version())
+stats = instant.disk_cache_stats(cache_dir)
+assert stats["modules"] == 2 and stats["size"] == sum(
+    instant.cached_module_info(m, cache_dir)["size"] for m in modules)
+
+# Accesses are recorded in the index, unless recorded shortly before
+instant.clear_memory_cache()
+time.sleep(0.05)
+assert instant.import_module(signatures[0], cache_dir=cache_dir).value_0() == 0
+assert instant.cached_module_info(modules[0], cache_dir)["accessed"] == info["accessed"]
+instant.cache._access_interval = 0
+instant.clear_memory_cache()
+assert instant.import_module(signatures[0], cache_dir=cache_dir).value_0() == 0
+assert instant.cached_module_info(modules[0], cache_dir)["accessed"] > info["accessed"]
+
+# Modules added or removed by hand are found after rebuilding the index
+copy = "instant_module_copy"
+shutil.copytree(os.path.join(cache_dir, modules[1]), os.path.join(cache_dir, copy))
+assert copy not in instant.cached_modules(cache_dir)
+instant.rebuild_cache_index(cache_dir)
+assert copy in instant.cached_modules(cache_dir)
+assert instant.cached_module_info(modules[1], cache_dir)["aliases"] == [signatures[1]]
+
+# Modules added without updating the index are found before building
+# them, and added to it
+instant.clear_memory_cache()
+instant.cacheindex.index_remove_module(cache_dir, modules[1])
+assert modules[1] not in instant.cached_modules(cache_dir)
+assert instant.import_module(signatures[1], cache_dir=cache_dir) is None
+recompile = instant.build.recompile
+def fail(*args):
+    raise RuntimeError("Compiled a module found in the cache")
+instant.build.recompile = fail
+try:
+    module = instant.build_module(code=code % (1, 1), signature=signatures[1], cache_dir=cache_dir)
+finally:
+    instant.build.recompile = recompile
+assert module.__name__ == modules[1] and module.value_1() == 1
+assert modules[1] in instant.cached_modules(cache_dir)
+
+# Stale entries are dropped when looked up
+instant.clear_memory_cache()
+shutil.rmtree(os.path.join(cache_dir, modules[1]))
+assert instant.import_module(signatures[1], cache_dir=cache_dir) is None
+assert modules[1] not in instant.cached_modules(cache_dir)
+
+# The write-ahead log is only used on local filesystems
+journal_mode = instant.cacheindex._journal_mode(cache_dir)
+assert journal_mode in ("WAL", "DELETE")
+assert instant.cacheindex._query(cache_dir, "PRAGMA journal_mode", fetch="one")[0] == journal_mode.lower()
+
+# Eviction removes modules not in use from the index
+assert instant.import_module(signatures[0], cache_dir=cache_dir).value_0() == 0
+assert instant.evict_from_disk_cache(cache_dir, max_entries=0) == [copy]
+assert instant.cached_modules(cache_dir) == [modules[0]]
+
+# Without the index, its files are not listed as modules
+os.environ["INSTANT_CACHE_INDEX"] = "0"
+try:
+    assert [m for m in instant.cached_modules(cache_dir) if not m.endswith(".lock")] == [modules[0]]
+finally:
+    del os.environ["INSTANT_CACHE_INDEX"]
+
+print("Successfully used the cache index")